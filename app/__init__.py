@@ -1,6 +1,17 @@
 import os
 from flask import Flask
-from .models import db  # Ensure db is imported from your models.py
+from .models import db, migrate_catalog  # Ensure db is imported from your models.py
+from .cache import dataset_cache, plot_cache
+from .render_pool import render_pool
+from .jobs import job_queue
+from .ai_service import AIService
+from .warehouse import warehouse
+from .batch import batch_analyzer
+from .uploads import chunked_uploads
+from .catalog import catalog
+from .metrics import metrics, profiler
+from .storage import storage
+from .report import eda_report
 
 def create_app():
     app = Flask(__name__)
@@ -13,8 +24,94 @@ def create_app():
     # Logic for the 'uploads' folder path
     app.config['UPLOAD_FOLDER'] = os.path.join(os.getcwd(), 'uploads')
 
+    # Request body limit (as in config.Config); bigger files use the chunked /uploads protocol
+    app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_MB', 16)) * 1024 * 1024
+    app.config['UPLOAD_CHUNK_MB'] = int(os.environ.get('UPLOAD_CHUNK_MB', 8))
+    app.config['MAX_UPLOAD_MB'] = int(os.environ.get('MAX_UPLOAD_MB', 2048))
+    app.config['UPLOAD_PARSERS'] = int(os.environ.get('UPLOAD_PARSERS', 4))
+
+    # Memory budget for parsed DataFrames kept between requests (per worker)
+    app.config['DATASET_CACHE_BYTES'] = int(os.environ.get('DATASET_CACHE_MB', 512)) * 1024 * 1024
+    dataset_cache.resize(app.config['DATASET_CACHE_BYTES'])
+
+    # Streaming ingestion: rows per CSV chunk and the worker RSS ceiling (0 = off)
+    app.config['INGEST_CHUNK_ROWS'] = int(os.environ.get('INGEST_CHUNK_ROWS', 100_000))
+    app.config['INGEST_MAX_RSS_MB'] = int(os.environ.get('INGEST_MAX_RSS_MB', 0))
+
+    # Approximate mode: a stratified sample of this many rows is kept at ingest;
+    # sampled answers are sent when the exact one misses the latency budget
+    app.config['SAMPLE_ROWS'] = int(os.environ.get('SAMPLE_ROWS', 100_000))
+    app.config['APPROX_BUDGET_MS'] = int(os.environ.get('APPROX_BUDGET_MS', 300))
+
+    # Plots over this many rows are binned/decimated before rendering
+    app.config['PLOT_EXACT_MAX_ROWS'] = int(os.environ.get('PLOT_EXACT_MAX_ROWS', 20_000))
+
+    # Rendered-plot cache: per-worker memory tier plus a disk tier shared by all workers
+    app.config['PLOT_CACHE_FOLDER'] = os.path.join(app.config['UPLOAD_FOLDER'], '.plot_cache')
+    app.config['PLOT_CACHE_MEMORY_MB'] = int(os.environ.get('PLOT_CACHE_MEMORY_MB', 64))
+    app.config['PLOT_CACHE_DISK_MB'] = int(os.environ.get('PLOT_CACHE_DISK_MB', 512))
+    plot_cache.configure(
+        app.config['PLOT_CACHE_FOLDER'],
+        app.config['PLOT_CACHE_MEMORY_MB'] * 1024 * 1024,
+        app.config['PLOT_CACHE_DISK_MB'] * 1024 * 1024
+    )
+
+    # Render pool: matplotlib runs in these processes, not in the web workers
+    app.config['RENDER_WORKERS'] = int(os.environ.get('RENDER_WORKERS', 2))
+    app.config['RENDER_QUEUE_SIZE'] = int(os.environ.get('RENDER_QUEUE_SIZE', 16))
+    app.config['RENDER_TIMEOUT'] = int(os.environ.get('RENDER_TIMEOUT', 30))
+    render_pool.configure(
+        app.config['RENDER_WORKERS'], app.config['RENDER_QUEUE_SIZE'], app.config['RENDER_TIMEOUT']
+    )
+
+    # Background jobs (status files are shared between workers)
+    app.config['JOB_FOLDER'] = os.path.join(app.config['UPLOAD_FOLDER'], '.jobs')
+    app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+    # Finished jobs (and their results) are kept this long for polling, then dropped
+    app.config['JOB_TTL'] = int(os.environ.get('JOB_TTL', 3600))
+    job_queue.configure(app.config['JOB_FOLDER'], app.config['JOB_WORKERS'], app.config['JOB_TTL'])
+
+    # AI insights: 'gemini' or the offline 'stub' backend, with a hard timeout
+    app.config['AI_BACKEND'] = os.environ.get('AI_BACKEND', 'gemini')
+    app.config['AI_TIMEOUT'] = int(os.environ.get('AI_TIMEOUT', 20))
+    AIService.configure(
+        app.config['AI_BACKEND'], app.config['AI_TIMEOUT'],
+        os.path.join(app.config['UPLOAD_FOLDER'], '.ai_cache')
+    )
+
+    # Batch uploads: files are ingested in parallel worker processes
+    app.config['BATCH_WORKERS'] = int(os.environ.get('BATCH_WORKERS', 2))
+    app.config['BATCH_MAX_FILES'] = int(os.environ.get('BATCH_MAX_FILES', 50))
+    # Cap on the unpacked size of a batch, so a small ZIP cannot inflate until the disk is full
+    app.config['BATCH_MAX_MB'] = int(os.environ.get('BATCH_MAX_MB', 2048))
+    batch_analyzer.configure(
+        app.config['BATCH_WORKERS'], app.config['BATCH_MAX_FILES'], app.config['BATCH_MAX_MB'] * 1024 * 1024
+    )
+
+    # Full auto-EDA reports (HTML/ZIP), saved per dataset version
+    app.config['REPORT_FOLDER'] = os.path.join(app.config['UPLOAD_FOLDER'], '.reports')
+    app.config['REPORT_MAX_PAIRS'] = int(os.environ.get('REPORT_MAX_PAIRS', 20))
+    app.config['REPORT_CACHE_ENTRIES'] = int(os.environ.get('REPORT_CACHE_ENTRIES', 32))
+
+    # Optional SQL warehouse: uploads are bulk-loaded into SQLite and
+    # groupby/filter/dropna pipelines run there (SQL_WAREHOUSE=1 to enable)
+    app.config['SQL_WAREHOUSE'] = os.environ.get('SQL_WAREHOUSE', '0') == '1'
+    app.config['WAREHOUSE_PATH'] = os.path.join(app.config['UPLOAD_FOLDER'], '.warehouse.db')
+
+    # Phase timing and /metrics; PROFILE_SLOW_MS > 0 saves sampled stacks of slower requests
+    app.config['METRICS_FOLDER'] = os.path.join(app.config['UPLOAD_FOLDER'], '.metrics')
+    app.config['SLOW_REQUEST_MS'] = int(os.environ.get('SLOW_REQUEST_MS', 1000))
+    app.config['PROFILE_SLOW_MS'] = int(os.environ.get('PROFILE_SLOW_MS', 0))
+    app.config['PROFILE_INTERVAL_MS'] = int(os.environ.get('PROFILE_INTERVAL_MS', 5))
+    metrics.configure(app, app.config['METRICS_FOLDER'], app.config['SLOW_REQUEST_MS'])
+    profiler.configure(
+        os.path.join(app.config['UPLOAD_FOLDER'], '.profiles'),
+        app.config['PROFILE_SLOW_MS'], app.config['PROFILE_INTERVAL_MS']
+    )
+
     # --- 2. INITIALIZE DATABASE ---
     db.init_app(app)
+    catalog.configure(app)
 
     # --- 3. REGISTER ROUTES (The fix for 404) ---
     from .routes import main_bp
@@ -24,8 +121,26 @@ def create_app():
     # --- 4. CREATE TABLES & FOLDERS ---
     if not os.path.exists(app.config['UPLOAD_FOLDER']):
         os.makedirs(app.config['UPLOAD_FOLDER'])
+    storage.configure(app, app.config['UPLOAD_FOLDER'])
+    eda_report.configure(
+        app.config['REPORT_FOLDER'], app.config['REPORT_MAX_PAIRS'], app.config['REPORT_CACHE_ENTRIES']
+    )
+    warehouse.configure(app.config['WAREHOUSE_PATH'], app.config['SQL_WAREHOUSE'])
+    chunked_uploads.configure(
+        app.config['UPLOAD_FOLDER'],
+        app.config['MAX_UPLOAD_MB'] * 1024 * 1024,
+        min(app.config['UPLOAD_CHUNK_MB'] * 1024 * 1024, app.config['MAX_CONTENT_LENGTH']),
+        app.config['INGEST_CHUNK_ROWS'],
+        app.config['INGEST_MAX_RSS_MB'] * 1024 * 1024,
+        app.config['SAMPLE_ROWS'],
+        app.config['UPLOAD_PARSERS']
+    )
         
     with app.app_context():
         db.create_all()
+        migrate_catalog(db.engine)
+        # No pooled connection may outlive this call: with gunicorn's
+        # preload_app every forked worker would share its socket/file handle
+        db.engine.dispose()
 
     return app
@@ -0,0 +1,245 @@
+import math
+import multiprocessing
+import os
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from werkzeug.utils import secure_filename
+
+from .jobs import job_queue
+
+
+BATCH_EXTENSIONS = ('.csv', '.xlsx', '.xls')
+
+
+def analyze_file(filepath, chunk_rows, max_rss_bytes, sample_rows):
+    """
+    Runs in a batch worker process: ingest (parse + profile + sidecar) and
+    the auto-EDA images for one file. Returns (summary, {kind: png bytes}).
+    """
+    from .columnar import ColumnarStore
+    from .ingest import StreamingIngestor
+    from .processor import DataService
+    from .render import render_image
+    from .stats import CoMoments
+
+    summary = StreamingIngestor(
+        chunk_rows=chunk_rows, max_rss_bytes=max_rss_bytes, sample_rows=sample_rows
+    ).ingest(filepath)
+    numeric = [col for col, st in summary['stats']['columns'].items() if st['numeric']]
+
+    images = {}
+    tasks = {'heatmap': DataService.heatmap_render_args(CoMoments.load(ColumnarStore.comoments_path(filepath)))}
+    if numeric:
+        tasks['distribution'] = DataService.eda_render_args(ColumnarStore.read(filepath, columns=numeric), 'distribution')
+    for kind, task in tasks.items():
+        if task is not None:
+            draw, args, figsize = task
+            images[kind] = render_image(draw, args, figsize=figsize)
+    return summary, images
+
+
+class BatchAnalyzer:
+    """
+    Batch uploads: many files (or ZIP archives of them) are ingested and
+    profiled in parallel worker processes, so N files take about as long
+    as the slowest one. A background job drives the pool, reports progress
+    per finished file and ends with a cross-file comparison.
+    """
+
+    def __init__(self, workers=2, max_files=50, max_bytes=2048 * 1024 * 1024):
+        self.workers = workers
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self._executor = None
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self.after_fork)
+
+    def configure(self, workers, max_files, max_bytes):
+        self.workers = workers
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: never fork a web worker that holds threads and sockets
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    # --- 1. Collecting files ---
+    def save_uploads(self, files, stage, discard):
+        """
+        Saves uploaded files, unpacking ZIPs, to the paths `stage(name)`
+        hands out (one per name). Returns the saved paths in upload order.
+        At most `max_files` files and `max_bytes` of unpacked data are
+        accepted; past either limit everything staged so far is
+        `discard()`ed and ValueError is raised.
+        """
+        paths, staged, unpacked = [], {}, 0
+        try:
+            for storage in files:
+                name = secure_filename(storage.filename or '')
+                if name.lower().endswith('.zip'):
+                    with zipfile.ZipFile(storage.stream) as archive:
+                        for member in archive.infolist():
+                            member_name = secure_filename(os.path.basename(member.filename))
+                            if member.is_dir() or not member_name.lower().endswith(BATCH_EXTENSIONS):
+                                continue
+                            self._check_count(paths)
+                            # The declared size is checked first, then the bytes actually inflated
+                            self._check_size(unpacked + member.file_size)
+                            path = staged[member_name] = staged.get(member_name) or stage(member_name)
+                            with archive.open(member) as src, open(path, 'wb') as dst:
+                                for block in iter(lambda: src.read(1024 * 1024), b''):
+                                    unpacked += len(block)
+                                    self._check_size(unpacked)
+                                    dst.write(block)
+                            paths.append(path)
+                elif name.lower().endswith(BATCH_EXTENSIONS):
+                    self._check_count(paths)
+                    path = staged[name] = staged.get(name) or stage(name)
+                    storage.save(path)
+                    paths.append(path)
+        except BaseException:
+            for path in staged.values():
+                discard(path)
+            raise
+        return list(dict.fromkeys(paths))
+
+    def _check_count(self, paths):
+        if len(paths) >= self.max_files:
+            raise ValueError(f"A batch can hold at most {self.max_files} files.")
+
+    def _check_size(self, unpacked):
+        if unpacked > self.max_bytes:
+            raise ValueError(f"A batch can unpack to at most {self.max_bytes // 2**20} MB.")
+
+    # --- 2. The batch job ---
+    def submit(self, paths, chunk_rows, max_rss_bytes, sample_rows, on_file=None, on_error=None):
+        """
+        Starts the batch job and returns its id. `on_file(path, summary,
+        images)` runs in the job thread as each file finishes (e.g. to
+        seed caches), `on_error(path)` for each file that failed.
+        """
+        job_id = 'batch-' + os.urandom(8).hex()
+        # The driver waits on the process pool for the whole batch, so it gets its own thread
+        job_queue.spawn(self._run, job_id, paths, chunk_rows, max_rss_bytes, sample_rows, on_file, on_error,
+                        job_id=job_id)
+        return job_id
+
+    def _run(self, job_id, paths, chunk_rows, max_rss_bytes, sample_rows, on_file, on_error):
+        executor = self._get_executor()
+        futures = {executor.submit(analyze_file, path, chunk_rows, max_rss_bytes, sample_rows): path for path in paths}
+        summaries, errors = {}, {}
+        for done, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            name = os.path.basename(path)
+            try:
+                summary, images = future.result()
+                summaries[name] = summary
+                if on_file:
+                    on_file(path, summary, images)
+            except Exception as e:
+                errors[name] = str(e)
+                if on_error:
+                    on_error(path)
+            job_queue.report(job_id, progress=done / len(paths),
+                             message=f"{done}/{len(paths)} files analyzed (last: {name})")
+
+        ordered = [(os.path.basename(p), summaries[os.path.basename(p)])
+                   for p in paths if os.path.basename(p) in summaries]
+        return {'comparison': self.compare(ordered), 'errors': errors}
+
+    # --- 3. Comparison ---
+    STAT_FIELDS = ('mean', 'std', 'min', '50%', 'max')
+
+    @staticmethod
+    def _number(value):
+        """JSON-safe statistic: NaN/inf become None."""
+        if value is None or not math.isfinite(value):
+            return None
+        return float(value)
+
+    @staticmethod
+    def _kind(dtype):
+        """Type family of an ingest dtype, so int8 vs int32 is not a schema change."""
+        dtype = str(dtype).lower()
+        if dtype.startswith(('int', 'uint')):
+            return 'integer'
+        if dtype.startswith('float'):
+            return 'float'
+        if dtype.startswith('bool'):
+            return 'boolean'
+        return 'text'
+
+    @staticmethod
+    def compare(named_summaries):
+        """
+        Schema diff, aligned-column summary and per-column stat deltas for
+        [(name, ingest summary), ...]. Deltas are relative to the first file.
+        """
+        from .stats import StatsAccumulator
+
+        names = [name for name, _ in named_summaries]
+        profiles = {name: StatsAccumulator.from_dict(s['stats']).columns for name, s in named_summaries}
+        columns = list(dict.fromkeys(col for _, s in named_summaries for col in s['columns']))
+
+        schema, aligned, partial, mismatched = [], [], [], []
+        for col in columns:
+            types = {name: BatchAnalyzer._kind(s['dtypes'][col]) if col in s['dtypes'] else None
+                     for name, s in named_summaries}
+            present = [t for t in types.values() if t is not None]
+            if len(present) < len(names):
+                status = 'partial'
+                partial.append(col)
+            elif len(set(present)) > 1:
+                status = 'type_mismatch'
+                mismatched.append(col)
+            else:
+                status = 'aligned'
+                aligned.append(col)
+            schema.append({'column': col, 'status': status, 'types': types})
+
+        deltas = []
+        for col in columns:
+            rows = {}
+            for name in names:
+                stats = profiles[name].get(col)
+                if stats is None or not stats.numeric:
+                    continue
+                summary = stats.summary()
+                rows[name] = {field: BatchAnalyzer._number(summary.get(field)) for field in BatchAnalyzer.STAT_FIELDS}
+                rows[name]['nulls'] = stats.nulls
+            if len(rows) < 2:
+                continue
+            base_name = next(iter(rows))
+            base = rows[base_name]
+            for name, values in rows.items():
+                values['mean_delta'] = (values['mean'] - base['mean']
+                                        if values['mean'] is not None and base['mean'] is not None else None)
+            deltas.append({'column': col, 'baseline': base_name, 'files': rows})
+
+        return {
+            'files': [{'name': name, 'rows': s['rows'], 'columns': len(s['columns']),
+                       'content_hash': s['content_hash']} for name, s in named_summaries],
+            'schema': schema,
+            'aligned': {'aligned': aligned, 'partial': partial, 'type_mismatch': mismatched},
+            'stat_deltas': deltas,
+        }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def after_fork(self):
+        self._executor = None
+        self._lock = threading.Lock()
+
+
+batch_analyzer = BatchAnalyzer()
@@ -0,0 +1,248 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from .utils import atomic_write
+
+
+class DatasetCache:
+    """
+    Process-wide LRU cache of parsed DataFrames.
+    Entries are keyed by file identity (path, mtime, size), so a rewritten
+    file never serves stale data. The memory budget counts
+    DataFrame.memory_usage(deep=True) bytes.
+
+    Cached frames are shared between requests: treat them as read-only
+    and call .copy() before mutating.
+    """
+
+    def __init__(self, max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (df, nbytes)
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def file_key(filepath):
+        st = os.stat(filepath)
+        return (os.path.abspath(filepath), st.st_mtime_ns, st.st_size)
+
+    def get_or_load(self, filepath, loader, variant=None):
+        """
+        Returns the cached frame for `filepath`, calling `loader(filepath)`
+        on a miss. `variant` separates different views of the same file.
+        """
+        key = self.file_key(filepath) + (variant,)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # Parse outside the lock so other datasets stay servable meanwhile
+        df = loader(filepath)
+        self.put(key, df)
+        return df
+
+    def peek(self, filepath, variant=None):
+        """Cached frame for `filepath`/`variant` if present, without loading."""
+        key = self.file_key(filepath) + (variant,)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, df):
+        nbytes = int(df.memory_usage(deep=True).sum())
+        # A frame bigger than the whole budget would just flush everything
+        if nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            self._entries[key] = (df, nbytes)
+            self.current_bytes += nbytes
+            self._evict()
+
+    def _evict(self):
+        while self.current_bytes > self.max_bytes and self._entries:
+            _, (_, nbytes) = self._entries.popitem(last=False)
+            self.current_bytes -= nbytes
+            self.evictions += 1
+
+    def invalidate(self, filepath):
+        """Drops every cached version of a file (all mtimes, all variants)."""
+        path = os.path.abspath(filepath)
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == path]:
+                _, nbytes = self._entries.pop(key)
+                self.current_bytes -= nbytes
+
+    def resize(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# Shared by every request handled in this worker process
+dataset_cache = DatasetCache()
+
+
+_digest_memo = {}
+
+
+def content_hash(filepath, block_size=1024 * 1024):
+    """SHA-256 of a file's bytes, memoised per file identity (path, mtime, size)."""
+    key = DatasetCache.file_key(filepath)
+    if key in _digest_memo:
+        return _digest_memo[key]
+
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as fh:
+        for block in iter(lambda: fh.read(block_size), b''):
+            digest.update(block)
+
+    if len(_digest_memo) > 1024:
+        _digest_memo.clear()
+    _digest_memo[key] = digest.hexdigest()
+    return _digest_memo[key]
+
+
+class PlotCache:
+    """
+    Content-addressed cache of rendered plot images.
+    Keys hash the dataset content, the plot parameters and the theme, so
+    identical requests hit regardless of filename and never go stale.
+    A small in-memory LRU sits in front of a shared on-disk store that
+    gunicorn workers and restarts all reuse; both are bounded by size.
+    """
+
+    def __init__(self, folder=None, max_memory_bytes=64 * 1024 * 1024, max_disk_bytes=512 * 1024 * 1024):
+        self.folder = folder
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def configure(self, folder, max_memory_bytes, max_disk_bytes):
+        self.folder = folder
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        os.makedirs(folder, exist_ok=True)
+
+    @staticmethod
+    def key(dataset_hash, params, theme):
+        payload = json.dumps({'data': dataset_hash, 'params': params, 'theme': theme}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.folder, key[:2], key)
+
+    def _remember(self, key, data):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return
+            self._memory[key] = data
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self.max_memory_bytes and self._memory:
+                _, old = self._memory.popitem(last=False)
+                self._memory_bytes -= len(old)
+
+    def get(self, key):
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return data
+
+        if self.folder:
+            path = self._path(key)
+            try:
+                with open(path, 'rb') as fh:
+                    data = fh.read()
+                os.utime(path)  # disk eviction is least-recently-used by mtime
+            except OSError:
+                data = None
+            if data is not None:
+                self.disk_hits += 1
+                self._remember(key, data)
+                return data
+
+        self.misses += 1
+        return None
+
+    def put(self, key, data):
+        self._remember(key, data)
+        if not self.folder:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        atomic_write(path, data)
+        self._evict_disk()
+
+    def _evict_disk(self):
+        entries, total = [], 0
+        for shard in os.scandir(self.folder):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass  # another worker got there first
+
+    def stats(self):
+        with self._lock:
+            return {
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
+
+
+plot_cache = PlotCache()
+
@@ -0,0 +1,152 @@
+import json
+import os
+from datetime import datetime
+
+import pandas as pd
+
+from .columnar import ColumnarStore
+from .ingest import StreamingIngestor
+from .models import db, DatasetMetadata
+from .preview import RowIndex
+from .warehouse import warehouse
+
+
+class DatasetCatalog:
+    """
+    Metadata catalog for uploads (one DatasetMetadata row per file), written
+    once at ingest: the schema with dtypes and nullability, the describe()
+    statistics, the preview, the content hash and where the derived
+    artifacts live. Dashboards, column dropdowns, the null report and the
+    dataset list are served from it without opening the data file.
+    Writes come from requests and from background threads alike, so the
+    catalog carries its own app reference and pushes a context as needed.
+    """
+    MAX_PLOTS = 50
+
+    def __init__(self, app=None):
+        self.app = app
+
+    def configure(self, app):
+        self.app = app
+
+    # --- 1. Building an entry ---
+    @staticmethod
+    def _schema(summary):
+        stats = summary['stats']['columns']
+        return [
+            {'name': col, 'dtype': summary['dtypes'][col], 'numeric': stats[col]['numeric'],
+             'nullable': summary['null_counts'][col] > 0, 'nulls': summary['null_counts'][col]}
+            for col in summary['columns']
+        ]
+
+    @staticmethod
+    def _stats(summary):
+        describe = StreamingIngestor.describe_table(summary)
+        return {
+            'describe': describe.to_dict(orient='split'),
+            # Same text the upload path sends to the AI, so its cache keys match
+            'summary_text': StreamingIngestor.summary_text(summary),
+        }
+
+    @staticmethod
+    def _artifacts(filepath, summary):
+        folder = os.path.dirname(filepath)
+        relative = lambda path: os.path.relpath(path, folder)
+        return {
+            'columnar': relative(ColumnarStore.sidecar_path(filepath)),
+            'summary': relative(ColumnarStore.summary_path(filepath)),
+            'comoments': relative(ColumnarStore.comoments_path(filepath)),
+            'row_index': relative(RowIndex.path(filepath)) if summary.get('row_index') else None,
+            'warehouse_table': warehouse.table_name(summary['content_hash']) if warehouse.enabled else None,
+            'plots': [],
+            'transforms': [],
+        }
+
+    def record(self, filepath, summary):
+        """Creates or replaces the entry for an ingested upload and returns it as a dict."""
+        filename = os.path.basename(filepath)
+        with self.app.app_context():
+            entry = DatasetMetadata.query.filter_by(filename=filename).first() or DatasetMetadata(filename=filename)
+            entry.rows = summary['rows']
+            entry.cols = len(summary['columns'])
+            entry.content_hash = summary['content_hash']
+            entry.schema_json = json.dumps(self._schema(summary))
+            entry.stats_json = json.dumps(self._stats(summary), default=str)
+            entry.preview_html = summary['preview_html']
+            entry.artifacts_json = json.dumps(self._artifacts(filepath, summary))
+            entry.search_text = ' '.join([filename] + summary['columns']).lower()
+            entry.timestamp = entry.updated = datetime.utcnow()
+            db.session.add(entry)
+            db.session.commit()
+            return entry.to_dict()
+
+    # --- 2. Reading ---
+    def get(self, filename):
+        with self.app.app_context():
+            entry = DatasetMetadata.query.filter_by(filename=filename).first()
+            return entry.to_dict() if entry else None
+
+    @staticmethod
+    def describe(entry):
+        """The describe() frame stored in an entry."""
+        split = entry['stats']['describe']
+        return pd.DataFrame(split['data'], index=split['index'], columns=split['columns'])
+
+    @staticmethod
+    def null_report(entry):
+        return {col['name']: col['nulls'] for col in entry['schema'] if col['nulls'] > 0}
+
+    @staticmethod
+    def numeric_columns(entry):
+        return [col['name'] for col in entry['schema'] if col['numeric']]
+
+    def search(self, query='', limit=50, offset=0):
+        """Newest first; `query` matches the filename or any column name."""
+        with self.app.app_context():
+            q = DatasetMetadata.query
+            for term in query.lower().split():
+                escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                q = q.filter(DatasetMetadata.search_text.like(f'%{escaped}%', escape='\\'))
+            total = q.count()
+            rows = q.order_by(DatasetMetadata.timestamp.desc()).offset(offset).limit(limit).all()
+            return total, [entry.to_dict(full=False) for entry in rows]
+
+    # --- 3. Derived artifacts ---
+    def _update_artifacts(self, filename, change):
+        with self.app.app_context():
+            entry = DatasetMetadata.query.filter_by(filename=filename).first()
+            if entry is None:
+                return
+            artifacts = json.loads(entry.artifacts_json or '{}')
+            change(artifacts)
+            entry.artifacts_json = json.dumps(artifacts)
+            entry.updated = datetime.utcnow()
+            db.session.commit()
+
+    def add_plot(self, filename, cache_key):
+        """Remembers a rendered plot's cache key (newest last, bounded)."""
+        def change(artifacts):
+            plots = [key for key in artifacts.setdefault('plots', []) if key != cache_key]
+            artifacts['plots'] = (plots + [cache_key])[-self.MAX_PLOTS:]
+        self._update_artifacts(filename, change)
+
+    def set_transform(self, filename, transformed_name, operations):
+        """Records the op log of a transformed dataset derived from `filename`."""
+        def change(artifacts):
+            transforms = [t for t in artifacts.setdefault('transforms', []) if t['filename'] != transformed_name]
+            artifacts['transforms'] = transforms + [{'filename': transformed_name, 'operations': operations}]
+        self._update_artifacts(filename, change)
+
+    def remove_transform(self, filename, transformed_name):
+        """Forgets a transformed dataset; its source stays catalogued."""
+        def change(artifacts):
+            artifacts['transforms'] = [t for t in artifacts.get('transforms', []) if t['filename'] != transformed_name]
+        self._update_artifacts(filename, change)
+
+    def remove(self, filename):
+        with self.app.app_context():
+            DatasetMetadata.query.filter_by(filename=filename).delete()
+            db.session.commit()
+
+
+catalog = DatasetCatalog()
@@ -0,0 +1,343 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+
+# Chart types of the configurator (keys feed the dashboard dropdown). The
+# browser draws them from ChartSpec data; /plot renders the same types as images.
+CHART_TYPES = {
+    'bar': {'desc': 'Mean of Y for each X category.'},
+    'scatter': {'desc': 'Relationship between two numeric variables.'},
+    'line': {'desc': 'Trend of Y along X.'},
+    'hist': {'desc': 'Frequency distribution of X (Histogram).'},
+}
+
+
+class ChartSpec:
+    """
+    Declarative chart specs compiled to the aggregated data a chart draws,
+    so the browser renders it and the server only runs one vectorized
+    groupby/histogram instead of a matplotlib render. A spec is a small
+    subset of Vega-Lite:
+
+        {"mark": "bar" | "line" | "scatter" | "hist",
+         "encoding": {"x": {"field": "city", "bin": false},
+                      "y": {"field": "price", "aggregate": "mean"},
+                      "color": {"field": "year"}},
+         "limit": 50}
+
+    "x": "city" is shorthand for {"field": "city"}, and `bin` may be true
+    or {"maxbins": n}. What each mark compiles to:
+      - hist:    counts per bin (numeric x) or per category
+      - bar:     y aggregated per x category (count without y), with a
+                 95% CI for means
+      - line:    y aggregated per x value, or per x bin with a min/max
+                 envelope when x has more than `maxbins` distinct values
+      - scatter: the points themselves up to MAX_POINTS, else the
+                 non-empty cells of a 2D density grid
+    The result is columnar: {'meta': {...}, 'data': {column: [values]}}.
+
+    Compiled against a stratified sample (sampling.Sample) instead, counts,
+    sums and means are weighted estimates for the full data, each with a
+    95% interval in 'ci', and meta['approximate'] describes the sample.
+    """
+    AGGREGATES = ('count', 'sum', 'mean', 'median', 'min', 'max')
+    HIST_BINS = 50
+    LINE_BINS = 500
+    DENSITY_BINS = 100
+    MAX_POINTS = 5000
+    MAX_CATEGORIES = 50
+    MAX_BINS = 2000
+
+    # --- 1. Validation ---
+    @classmethod
+    def normalize(cls, spec, columns):
+        """The spec with shorthands expanded and defaults filled in; ValueError if invalid.
+        `columns` are the dataset's column names (None skips that check)."""
+        if not isinstance(spec, dict):
+            raise ValueError("A chart spec must be a JSON object.")
+        mark = spec.get('mark')
+        if mark not in CHART_TYPES:
+            raise ValueError(f"No such plot can be plotted: '{mark}' is not supported.")
+
+        encoding = {}
+        for channel, value in (spec.get('encoding') or {}).items():
+            if channel not in ('x', 'y', 'color'):
+                raise ValueError(f"Unknown encoding channel '{channel}'.")
+            if value in (None, '', 'None'):
+                continue
+            value = {'field': value} if isinstance(value, str) else dict(value)
+            if not isinstance(value.get('field'), str) or (columns is not None and value['field'] not in columns):
+                raise ValueError(f"Column '{value.get('field')}' does not exist.")
+            if value.get('aggregate') is not None and value['aggregate'] not in cls.AGGREGATES:
+                raise ValueError(f"Unsupported aggregate '{value['aggregate']}'.")
+            bins = value.get('bin')
+            if isinstance(bins, dict):
+                bins = {'maxbins': min(max(int(bins.get('maxbins', cls.HIST_BINS)), 1), cls.MAX_BINS)}
+            value['bin'] = bins or False
+            encoding[channel] = value
+
+        if 'x' not in encoding:
+            raise ValueError("Please select an X column.")
+        if mark in ('scatter', 'line') and 'y' not in encoding:
+            raise ValueError(f"A {mark} chart needs a Y column.")
+        if mark == 'bar' and 'y' in encoding:
+            encoding['y'].setdefault('aggregate', 'mean')
+        if mark == 'line':
+            encoding['y'].setdefault('aggregate', 'mean')
+
+        limit = min(max(int(spec.get('limit', cls.MAX_CATEGORIES)), 1), 1000)
+        return {'mark': mark, 'encoding': encoding, 'limit': limit}
+
+    @staticmethod
+    def fields(spec):
+        return list(dict.fromkeys(channel['field'] for channel in spec['encoding'].values()))
+
+    # --- 2. Compilation ---
+    @staticmethod
+    def _is_numeric(series):
+        return pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+
+    @staticmethod
+    def _axis_type(series):
+        if pd.api.types.is_datetime64_any_dtype(series):
+            return 'temporal'
+        return 'quantitative' if ChartSpec._is_numeric(series) else 'nominal'
+
+    @staticmethod
+    def _maxbins(channel, default):
+        return channel['bin']['maxbins'] if isinstance(channel['bin'], dict) else default
+
+    @staticmethod
+    def _numbers(series):
+        """float64 values of a numeric or datetime column (datetimes as epoch milliseconds)."""
+        if pd.api.types.is_datetime64_any_dtype(series):
+            values = series.to_numpy(dtype='datetime64[ms]').astype(np.int64).astype(np.float64)
+            values[series.isna().to_numpy()] = np.nan
+            return values
+        if not ChartSpec._is_numeric(series):
+            raise ValueError(f"Column '{series.name}' is not numeric.")
+        return series.to_numpy(dtype=np.float64, na_value=np.nan)
+
+    @classmethod
+    def _top_categories(cls, keys, limit):
+        """Codes for the `limit` most frequent labels (others -1), the labels and how many were dropped."""
+        codes, labels = pd.factorize(keys, sort=False)
+        counts = np.bincount(codes[codes >= 0], minlength=len(labels))
+        if len(labels) <= limit:
+            order = np.argsort(labels.astype(str), kind='stable')
+            dropped = 0
+        else:
+            order = np.argsort(-counts, kind='stable')[:limit]
+            dropped = len(labels) - limit
+        remap = np.full(len(labels) + 1, -1, dtype=np.int64)
+        remap[order] = np.arange(len(order))
+        # -1 (missing) indexes the trailing -1
+        return remap[codes], labels[order], dropped
+
+    @classmethod
+    def _colors(cls, df, spec):
+        color = spec['encoding'].get('color')
+        if color is None:
+            return np.zeros(len(df), dtype=np.int64), None, 0
+        return cls._top_categories(df[color['field']].astype(str).where(df[color['field']].notna()), 10)
+
+    @classmethod
+    def compile(cls, df, spec, sample=None):
+        """
+        Aggregated data for a normalized spec: (meta dict, {column: numpy array}).
+        With a `sample`, `df` holds its rows and the aggregates are estimates.
+        """
+        compiler = {'hist': cls._hist, 'bar': cls._bar, 'line': cls._line, 'scatter': cls._scatter}[spec['mark']]
+        meta = {'mark': spec['mark'], 'spec': spec, 'rows': len(df), 'binned': False, 'truncated': 0,
+                'x_type': cls._axis_type(df[spec['encoding']['x']['field']])}
+        if sample is not None:
+            meta['rows'] = sample.rows
+            meta['approximate'] = sample.describe()
+        data = compiler(df, spec, meta, sample)
+        meta['points'] = len(next(iter(data.values()))) if data else 0
+        return meta, data
+
+    @staticmethod
+    def _counts(index, length, sample):
+        """Rows per bin index (estimated, with their interval, from a sample)."""
+        if sample is None:
+            return np.bincount(index, minlength=length), None
+        result = sample.estimate(index, np.ones(len(index)), 'count')
+        counts, ci = np.zeros(length), np.zeros(length)
+        counts[result.index] = result['y'].to_numpy()
+        ci[result.index] = result['ci'].to_numpy()
+        return counts, ci
+
+    @classmethod
+    def _hist(cls, df, spec, meta, sample=None):
+        x = spec['encoding']['x']
+        color_codes, color_labels, meta['color_truncated'] = cls._colors(df, spec)
+        groups = len(color_labels) if color_labels is not None else 1
+        series = df[x['field']]
+
+        if meta['x_type'] == 'nominal':
+            codes, labels, meta['truncated'] = cls._top_categories(series.astype(str).where(series.notna()), spec['limit'])
+            keep = (codes >= 0) & (color_codes >= 0)
+            index = np.where(keep, codes * groups + color_codes, -1)
+            counts, ci = cls._counts(index if sample is not None else index[keep], len(labels) * groups, sample)
+            data = {'x': np.repeat(labels.astype(str), groups), 'count': counts}
+        else:
+            values = cls._numbers(series)
+            keep = ~np.isnan(values) & (color_codes >= 0)
+            meta['binned'] = True
+            bins = cls._maxbins(x, cls.HIST_BINS)
+            if not keep.any():
+                return {'x0': np.array([]), 'x1': np.array([]), 'count': np.array([], dtype=np.int64)}
+            edges = np.histogram_bin_edges(values[keep], bins=bins)
+            # Same bin rule as np.histogram: right edge closed on the last bin
+            index = np.clip(np.searchsorted(edges, values, side='right') - 1, 0, len(edges) - 2)
+            index = np.where(keep, index * groups + color_codes, -1)
+            counts, ci = cls._counts(index if sample is not None else index[keep], (len(edges) - 1) * groups, sample)
+            data = {'x0': np.repeat(edges[:-1], groups), 'x1': np.repeat(edges[1:], groups), 'count': counts}
+
+        if ci is not None:
+            data['ci'] = ci
+        if color_labels is not None:
+            data['color'] = np.tile(color_labels.astype(str), len(counts) // groups)
+        return data
+
+    @classmethod
+    def _grouped(cls, keys, values, aggregate, color_codes, sample=None):
+        """
+        Aggregate `values` per (key code, color code), vectorized through one
+        groupby. Columns: key, color, y, ci (95% interval of means, and of
+        every estimate from a sample), min and max.
+        """
+        if sample is not None:
+            groups = max(int(color_codes.max()) if len(color_codes) else 0, 0) + 1
+            index = np.where((keys >= 0) & (color_codes >= 0), keys * groups + color_codes, -1)
+            result = sample.estimate(index, values, aggregate)
+            return result.assign(key=result.index // groups, color=result.index % groups).reset_index(drop=True)
+
+        frame = pd.DataFrame({'key': keys, 'color': color_codes, 'value': values})
+        frame = frame[(frame['key'] >= 0) & (frame['color'] >= 0)]
+        grouped = frame.groupby(['key', 'color'], sort=True)['value']
+        if aggregate == 'count':
+            return grouped.count().to_frame('y').reset_index()
+        result = grouped.agg([aggregate, 'std', 'count', 'min', 'max']).rename(columns={aggregate: 'y'})
+        if aggregate == 'mean':
+            result['ci'] = 1.96 * result['std'].fillna(0) / np.sqrt(result['count'])
+        return result.reset_index()
+
+    @classmethod
+    def _bar(cls, df, spec, meta, sample=None):
+        x, y = spec['encoding']['x'], spec['encoding'].get('y')
+        color_codes, color_labels, meta['color_truncated'] = cls._colors(df, spec)
+        series = df[x['field']]
+        if x['bin'] and meta['x_type'] != 'nominal':
+            # A binned numeric x: categories are the bins, labelled by their range
+            values = cls._numbers(series)
+            valid = ~np.isnan(values)
+            edges = np.histogram_bin_edges(values[valid], bins=cls._maxbins(x, 20)) if valid.any() else np.array([0, 1])
+            keys = np.where(valid, np.clip(np.searchsorted(edges, values, side='right') - 1, 0, len(edges) - 2), -1)
+            labels = np.array([f"{lo:.4g} – {hi:.4g}" for lo, hi in zip(edges[:-1], edges[1:])], dtype=object)
+            meta['binned'] = True
+        else:
+            keys, labels, meta['truncated'] = cls._top_categories(series.astype(str).where(series.notna()), spec['limit'])
+
+        aggregate = y['aggregate'] if y else 'count'
+        values = cls._numbers(df[y['field']]) if y and aggregate != 'count' else np.ones(len(df))
+        if y and aggregate == 'count':
+            values = np.where(df[y['field']].notna().to_numpy(), 1.0, np.nan)
+        result = cls._grouped(keys, values, aggregate, color_codes, sample)
+
+        data = {'x': labels[result['key'].to_numpy()].astype(str), 'y': result['y'].to_numpy(dtype=np.float64)}
+        if 'ci' in result and result['ci'].notna().any():
+            data['ci'] = result['ci'].to_numpy(dtype=np.float64)
+        if color_labels is not None:
+            data['color'] = color_labels[result['color'].to_numpy()].astype(str)
+        return data
+
+    @classmethod
+    def _line(cls, df, spec, meta, sample=None):
+        x, y = spec['encoding']['x'], spec['encoding']['y']
+        color_codes, color_labels, meta['color_truncated'] = cls._colors(df, spec)
+        values = cls._numbers(df[y['field']])
+        series = df[x['field']]
+
+        if meta['x_type'] == 'nominal':
+            keys, labels, meta['truncated'] = cls._top_categories(series.astype(str).where(series.notna()), spec['limit'])
+            result = cls._grouped(keys, values, y['aggregate'], color_codes, sample)
+            data = {'x': labels[result['key'].to_numpy()].astype(str)}
+        else:
+            xs = cls._numbers(series)
+            valid = ~np.isnan(xs)
+            distinct = np.unique(xs[valid])
+            bins = cls._maxbins(x, cls.LINE_BINS)
+            if len(distinct) <= bins and not x['bin']:
+                keys = np.where(valid, np.searchsorted(distinct, xs), -1)
+                centers = distinct
+            else:
+                # More x values than pixels to show them: aggregate per bucket, keep the envelope
+                edges = np.histogram_bin_edges(xs[valid], bins=bins)
+                keys = np.where(valid, np.clip(np.searchsorted(edges, xs, side='right') - 1, 0, len(edges) - 2), -1)
+                centers = (edges[:-1] + edges[1:]) / 2
+                meta['binned'] = True
+            result = cls._grouped(keys, values, y['aggregate'], color_codes, sample)
+            data = {'x': centers[result['key'].to_numpy()]}
+
+        data['y'] = result['y'].to_numpy(dtype=np.float64)
+        if meta['binned'] and 'min' in result:
+            data['y_min'] = result['min'].to_numpy(dtype=np.float64)
+            data['y_max'] = result['max'].to_numpy(dtype=np.float64)
+        if sample is not None and result['ci'].notna().any():
+            data['ci'] = result['ci'].to_numpy(dtype=np.float64)
+        if color_labels is not None:
+            data['color'] = color_labels[result['color'].to_numpy()].astype(str)
+        return data
+
+    @classmethod
+    def _scatter(cls, df, spec, meta, sample=None):
+        x, y = spec['encoding']['x'], spec['encoding']['y']
+        if meta['x_type'] == 'nominal' or not cls._is_numeric(df[y['field']]):
+            raise ValueError("A scatter chart needs two numeric columns.")
+        xs, ys = cls._numbers(df[x['field']]), cls._numbers(df[y['field']])
+        valid = ~(np.isnan(xs) | np.isnan(ys))
+
+        if valid.sum() <= cls.MAX_POINTS:
+            data = {'x': xs[valid], 'y': ys[valid]}
+            color = spec['encoding'].get('color')
+            if color is not None:
+                data['color'] = df[color['field']].astype(str).to_numpy()[valid]
+            return data
+
+        # Too many points to ship: the non-empty cells of a density grid
+        weights = sample.weights[valid] if sample is not None else None
+        counts, x_edges, y_edges = np.histogram2d(xs[valid], ys[valid], bins=cls.DENSITY_BINS, weights=weights)
+        cx, cy = np.nonzero(counts)
+        meta['binned'] = True
+        meta['x_step'] = float(x_edges[1] - x_edges[0])
+        meta['y_step'] = float(y_edges[1] - y_edges[0])
+        return {'x': (x_edges[cx] + x_edges[cx + 1]) / 2, 'y': (y_edges[cy] + y_edges[cy + 1]) / 2,
+                'count': np.round(counts[cx, cy]).astype(np.int64)}
+
+    # --- 3. Encoding ---
+    @staticmethod
+    def _json_column(values):
+        values = np.asarray(values)
+        if values.dtype.kind == 'f':
+            return [None if np.isnan(v) else float(v) for v in values.tolist()]
+        return values.tolist()
+
+    @classmethod
+    def to_json(cls, meta, data):
+        return json.dumps({'success': True, 'meta': meta,
+                           'data': {name: cls._json_column(values) for name, values in data.items()}}).encode('utf8')
+
+    @staticmethod
+    def to_arrow(meta, data):
+        """Arrow IPC stream; the meta dict travels as JSON in the schema metadata ('chart')."""
+        table = pa.table({name: pa.array(np.asarray(values)) for name, values in data.items()})
+        table = table.replace_schema_metadata({'chart': json.dumps(meta)})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
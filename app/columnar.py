@@ -0,0 +1,169 @@
+import json
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+
+from .utils import atomic_path, atomic_write
+
+
+class ColumnarStore:
+    """
+    Typed columnar sidecars for uploaded files.
+    Each CSV/Excel upload is parsed once and written as an uncompressed
+    Feather (Arrow IPC) file under uploads/.columnar/. Later reads are
+    memory-mapped and only touch the requested columns.
+    """
+    SIDECAR_DIR = '.columnar'
+    SUFFIX = '.feather'
+
+    @staticmethod
+    def sidecar_path(filepath):
+        folder, name = os.path.split(filepath)
+        return os.path.join(folder, ColumnarStore.SIDECAR_DIR, name + ColumnarStore.SUFFIX)
+
+    @staticmethod
+    def summary_path(filepath):
+        return ColumnarStore.sidecar_path(filepath)[:-len(ColumnarStore.SUFFIX)] + '.summary.json'
+
+    @staticmethod
+    def comoments_path(filepath):
+        """Correlation co-moments (stats.CoMoments) written at ingest."""
+        return ColumnarStore.sidecar_path(filepath)[:-len(ColumnarStore.SUFFIX)] + '.comoments.npz'
+
+    @staticmethod
+    def sample_path(filepath):
+        """Stratified row sample (sampling.StratifiedReservoir) written at ingest."""
+        return ColumnarStore.sidecar_path(filepath)[:-len(ColumnarStore.SUFFIX)] + '.sample' + ColumnarStore.SUFFIX
+
+    @staticmethod
+    def write_summary(filepath, summary):
+        atomic_write(ColumnarStore.summary_path(filepath), json.dumps(summary, default=str))
+
+    @staticmethod
+    def read_summary(filepath):
+        """Ingest summary for `filepath`, or None if missing or older than the source."""
+        path = ColumnarStore.summary_path(filepath)
+        if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(filepath):
+            return None
+        with open(path) as fh:
+            return json.load(fh)
+
+    @staticmethod
+    def read_source(filepath, columns=None):
+        """Slow path: parse the original text/Excel file."""
+        if filepath.endswith('.csv'):
+            return pd.read_csv(filepath, usecols=columns)
+        return pd.read_excel(filepath, usecols=columns)
+
+    @staticmethod
+    def is_fresh(filepath):
+        sidecar = ColumnarStore.sidecar_path(filepath)
+        return os.path.exists(sidecar) and os.path.getmtime(sidecar) >= os.path.getmtime(filepath)
+
+    @staticmethod
+    def _to_arrow(df):
+        df = df.reset_index(drop=True)
+        df.columns = [str(c) for c in df.columns]
+        try:
+            return pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Mixed-type object columns (e.g. ints and strings) have no Arrow type
+            for col in df.columns[df.dtypes == object]:
+                df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+            return pa.Table.from_pandas(df, preserve_index=False)
+
+    @staticmethod
+    def write(filepath, df):
+        """Writes the sidecar for `filepath` from an already-parsed frame."""
+        sidecar = ColumnarStore.sidecar_path(filepath)
+        os.makedirs(os.path.dirname(sidecar), exist_ok=True)
+        with atomic_path(sidecar) as tmp_path:
+            feather.write_feather(ColumnarStore._to_arrow(df), tmp_path, compression='uncompressed')
+        return sidecar
+
+    @staticmethod
+    def convert(filepath):
+        """Parses the source once and writes its sidecar. Returns the full frame."""
+        df = ColumnarStore.read_source(filepath)
+        ColumnarStore.write(filepath, df)
+        return df
+
+    @staticmethod
+    def schema(filepath):
+        """Arrow schema of the sidecar (converting first if it is stale)."""
+        if not ColumnarStore.is_fresh(filepath):
+            ColumnarStore.convert(filepath)
+        return ds.dataset(ColumnarStore.sidecar_path(filepath), format='ipc').schema
+
+    @staticmethod
+    def read(filepath, columns=None, filter=None):
+        """
+        Loads `filepath` from its sidecar, converting first if it is missing
+        or older than the source. `columns` limits the read to those columns;
+        `filter` is a pyarrow.compute expression applied during the scan, so
+        rejected rows never reach pandas.
+        """
+        if not ColumnarStore.is_fresh(filepath):
+            df = ColumnarStore.convert(filepath)
+            if filter is None:
+                return ColumnarStore._downcast(filepath, df[list(columns)] if columns else df)
+
+        columns = list(columns) if columns else None
+        if filter is not None:
+            table = ds.dataset(ColumnarStore.sidecar_path(filepath), format='ipc').to_table(
+                columns=columns, filter=filter
+            )
+        else:
+            table = feather.read_table(ColumnarStore.sidecar_path(filepath), columns=columns, memory_map=True)
+        return ColumnarStore._downcast(filepath, table.to_pandas())
+
+    @staticmethod
+    def _downcast(filepath, df):
+        # The sidecar keeps wide storage types; the ingest summary carries
+        # the downcast plan (smallest ints/floats, categories)
+        summary = ColumnarStore.read_summary(filepath)
+        if summary:
+            plan = summary.get('dtypes', {})
+            df = df.astype({col: plan[col] for col in df.columns if col in plan})
+        return df
+
+    @staticmethod
+    def read_sample(filepath):
+        """The stratified sample of `filepath`, typed like read()."""
+        table = feather.read_table(ColumnarStore.sample_path(filepath), memory_map=True)
+        return ColumnarStore._downcast(filepath, table.to_pandas())
+
+    @staticmethod
+    def _mapped_table(filepath, columns=None):
+        if not ColumnarStore.is_fresh(filepath):
+            ColumnarStore.convert(filepath)
+        return feather.read_table(ColumnarStore.sidecar_path(filepath), columns=columns, memory_map=True)
+
+    @staticmethod
+    def slice(filepath, offset, limit, columns=None):
+        """Rows [offset, offset + limit) without reading the rest of the file."""
+        return ColumnarStore._mapped_table(filepath, columns).slice(offset, limit).to_pandas()
+
+    @staticmethod
+    def take(filepath, indices, columns=None):
+        """The rows at `indices` (in that order), gathered from the mapped sidecar."""
+        table = ColumnarStore._mapped_table(filepath, columns)
+        return table.take(pa.array(indices, type=pa.int64())).to_pandas()
+
+    @staticmethod
+    def remove(filepath):
+        for path in (ColumnarStore.sidecar_path(filepath), ColumnarStore.summary_path(filepath),
+                     ColumnarStore.comoments_path(filepath), ColumnarStore.sample_path(filepath)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    @staticmethod
+    def move(filepath, new_filepath):
+        """Moves the sidecar, summary, co-moments and sample of `filepath` to those of `new_filepath`."""
+        for path_of in (ColumnarStore.sidecar_path, ColumnarStore.summary_path, ColumnarStore.comoments_path,
+                        ColumnarStore.sample_path):
+            if os.path.exists(path_of(filepath)):
+                os.makedirs(os.path.dirname(path_of(new_filepath)), exist_ok=True)
+                os.replace(path_of(filepath), path_of(new_filepath))
@@ -0,0 +1,272 @@
+import gc
+import os
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from .cache import content_hash
+from .columnar import ColumnarStore
+from .metrics import current_rss_bytes, metrics
+from .preview import RowIndex
+from .sampling import StratifiedReservoir
+from .stats import CoMoments, StatsAccumulator
+from .utils import atomic_path
+
+
+class IngestMemoryError(Exception):
+    """Raised when ingestion would push the worker past its RSS ceiling."""
+
+
+class _WidenColumn(Exception):
+    """Internal: a later chunk does not fit the storage type inferred so far."""
+    def __init__(self, column, storage):
+        super().__init__(column)
+        self.column = column
+        self.storage = storage
+
+
+# Storage types written to the sidecar, from narrowest to widest
+_ARROW_TYPES = {
+    'boolean': pa.bool_(),
+    'Int64': pa.int64(),
+    'float64': pa.float64(),
+    'string': pa.string(),
+}
+_WIDER = {'boolean': 'string', 'Int64': 'float64', 'float64': 'string'}
+
+
+class _ColumnTracker:
+    """Dtype-plan facts for one column; the statistics live in ColumnStats."""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.fits_float32 = True
+
+    def update(self, series):
+        if self.storage == 'float64' and self.fits_float32:
+            arr = series.dropna().to_numpy(dtype='float64')
+            self.fits_float32 = bool((arr.astype(np.float32).astype(np.float64) == arr).all())
+
+    def target_dtype(self, stats, rows, category_limit):
+        """Smallest pandas dtype that holds every value seen."""
+        if self.storage == 'Int64':
+            if stats.min is None:
+                return 'Int8'
+            for bits in (8, 16, 32, 64):
+                info = np.iinfo(f'int{bits}')
+                if info.min <= stats.min and stats.max <= info.max:
+                    return f'int{bits}' if stats.nulls == 0 else f'Int{bits}'
+        if self.storage == 'float64':
+            return 'float32' if self.fits_float32 else 'float64'
+        if self.storage == 'boolean':
+            return 'bool' if stats.nulls == 0 else 'boolean'
+        distinct = stats.distinct.estimate()
+        if distinct <= category_limit and distinct <= max(rows // 2, 1):
+            return 'category'
+        return 'string'
+
+
+class StreamingIngestor:
+    """
+    Chunked ingestion for uploads.
+    CSVs are read `chunk_rows` at a time and appended to the columnar
+    sidecar, so peak memory is bounded by one chunk rather than the file.
+    The mergeable StatsAccumulator state, the dtype plan, the preview and
+    a stratified row sample are all gathered during that same pass; all
+    but the sample are saved as a JSON summary.
+    """
+    PREVIEW_ROWS = 10
+    CATEGORY_LIMIT = 1000
+    MAX_RESTARTS = 20
+
+    def __init__(self, chunk_rows=100_000, max_rss_bytes=None, sample_rows=StratifiedReservoir.SAMPLE_ROWS):
+        self.chunk_rows = chunk_rows
+        self.max_rss_bytes = max_rss_bytes
+        self.sample_rows = sample_rows
+
+    # --- 1. Storage plan from a sample ---
+    @staticmethod
+    def _storage_for(series):
+        if pd.api.types.is_bool_dtype(series):
+            return 'boolean'
+        if pd.api.types.is_integer_dtype(series):
+            return 'Int64'
+        if pd.api.types.is_float_dtype(series):
+            return 'float64'
+        return 'string'
+
+    def _initial_plan(self, source):
+        with self._open(source) as handle:
+            sample = pd.read_csv(handle, nrows=min(self.chunk_rows, 10_000))
+        return {str(col): self._storage_for(sample[col]) for col in sample.columns}
+
+    # --- 2. Memory ceiling ---
+    def _check_memory(self, chunk_size):
+        """Halves the chunk size near the ceiling and aborts past it."""
+        if not self.max_rss_bytes:
+            return chunk_size
+        rss = current_rss_bytes()
+        if rss > self.max_rss_bytes:
+            gc.collect()
+            rss = current_rss_bytes()
+            if rss > self.max_rss_bytes:
+                raise IngestMemoryError(
+                    f"Ingestion stopped: worker RSS {rss // 2**20} MB exceeds the "
+                    f"{self.max_rss_bytes // 2**20} MB ceiling (INGEST_MAX_RSS_MB)."
+                )
+        if rss > 0.8 * self.max_rss_bytes:
+            return max(chunk_size // 2, 1000)
+        return chunk_size
+
+    # --- 3. Chunk conversion ---
+    def _to_batch(self, chunk, schema, plan):
+        try:
+            return pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, ValueError, TypeError):
+            for col, storage in plan.items():
+                if storage == 'string':
+                    continue
+                try:
+                    pa.array(chunk[col], type=_ARROW_TYPES[storage], from_pandas=True)
+                except (pa.ArrowInvalid, pa.ArrowTypeError, ValueError, TypeError):
+                    raise _WidenColumn(col, _WIDER[storage])
+            raise
+
+    def _find_misfit(self, source, plan, start, size):
+        """Re-reads a chunk the parser could not coerce and names the culprit column."""
+        with self._open(source) as handle:
+            raw = pd.read_csv(handle, skiprows=range(1, start + 1), nrows=size, dtype=str)
+        for col, storage in plan.items():
+            if storage == 'string':
+                continue
+            values = raw[col].dropna()
+            if storage == 'boolean':
+                if not values.str.lower().isin(['true', 'false']).all():
+                    return _WidenColumn(col, _WIDER[storage])
+                continue
+            numeric = pd.to_numeric(values, errors='coerce')
+            if numeric.isna().any():
+                return _WidenColumn(col, 'string')
+            if storage == 'Int64' and not (numeric == numeric.round()).all():
+                return _WidenColumn(col, 'float64')
+        return None
+
+    def _stream(self, source, sidecar_tmp, plan):
+        schema = pa.schema([(col, _ARROW_TYPES[storage]) for col, storage in plan.items()])
+        trackers = {col: _ColumnTracker(storage) for col, storage in plan.items()}
+        stats, comoments = StatsAccumulator(), CoMoments()
+        reservoir = StratifiedReservoir(self.sample_rows)
+        preview, rows, chunk_size = None, 0, self.chunk_rows
+
+        with self._open(source) as handle, pd.read_csv(handle, dtype=plan, chunksize=chunk_size) as reader, \
+                pa.OSFile(sidecar_tmp, 'wb') as sink, pa.ipc.new_file(sink, schema) as writer:
+            while True:
+                try:
+                    chunk = reader.get_chunk(chunk_size)
+                except StopIteration:
+                    break
+                except (ValueError, TypeError):
+                    misfit = self._find_misfit(source, plan, rows, chunk_size)
+                    if misfit is None:
+                        raise
+                    raise misfit
+
+                chunk.columns = [str(c) for c in chunk.columns]
+                writer.write_table(self._to_batch(chunk, schema, plan))
+                stats.update(chunk)
+                comoments.update(chunk)
+                reservoir.update(chunk)
+                for col, tracker in trackers.items():
+                    tracker.update(chunk[col])
+                if preview is None:
+                    preview = chunk.head(self.PREVIEW_ROWS)
+                rows += len(chunk)
+
+                del chunk
+                chunk_size = self._check_memory(chunk_size)
+
+        return trackers, stats, comoments, reservoir, preview, rows
+
+    @staticmethod
+    @contextmanager
+    def _open(source):
+        """A path string or a file object from the `source()` opener, closed afterwards."""
+        handle = source()
+        try:
+            yield handle
+        finally:
+            if hasattr(handle, 'close'):
+                handle.close()
+
+    # --- 4. Public entry point ---
+    def ingest(self, filepath, opener=None, digest=None):
+        """
+        Writes the columnar sidecar and summary for `filepath` and returns
+        the summary dict. Excel files have no chunked reader, so they are
+        parsed whole and profiled through the same accumulator.
+        A CSV is parsed from `opener()` when given: a file object that may
+        still be growing (see uploads.GrowingFile). Everything after the
+        parse (hash, row index) reads `filepath` itself, except that a
+        `digest()` computed while the bytes arrived replaces the hash pass.
+        """
+        source = opener or (lambda: filepath)
+        sidecar = ColumnarStore.sidecar_path(filepath)
+        os.makedirs(os.path.dirname(sidecar), exist_ok=True)
+
+        with metrics.span('parse'):
+            if filepath.endswith('.csv'):
+                with atomic_path(sidecar) as sidecar_tmp:
+                    plan = self._initial_plan(source)
+                    for _ in range(self.MAX_RESTARTS):
+                        try:
+                            trackers, stats, comoments, reservoir, preview, rows = self._stream(source, sidecar_tmp, plan)
+                            break
+                        except _WidenColumn as widen:
+                            # Rare: a late chunk holds a wider type, so restart with it
+                            print(f"--- ↺ Widening '{widen.column}' to {widen.storage} ---")
+                            plan[widen.column] = widen.storage
+                    else:
+                        raise ValueError("Could not settle on column types for this file.")
+            else:
+                df = ColumnarStore.convert(filepath)
+                df.columns = [str(c) for c in df.columns]
+                trackers = {col: _ColumnTracker(self._storage_for(df[col])) for col in df.columns}
+                for col, tracker in trackers.items():
+                    tracker.update(df[col])
+                stats = StatsAccumulator().update(df)
+                comoments = CoMoments().update(df)
+                reservoir = StratifiedReservoir(self.sample_rows).update(df)
+                preview, rows = df.head(self.PREVIEW_ROWS), len(df)
+
+        # Content hash and row index re-read the file
+        with metrics.span('index'):
+            summary = {
+                'content_hash': digest() if digest else content_hash(filepath),
+                'rows': rows,
+                'columns': list(trackers),
+                'dtypes': {
+                    col: t.target_dtype(stats.columns[col], rows, self.CATEGORY_LIMIT)
+                    for col, t in trackers.items()
+                },
+                'null_counts': {col: c.nulls for col, c in stats.columns.items()},
+                'stats': stats.to_dict(),
+                'preview_html': preview.to_html(classes='table table-sm', index=False),
+                # Byte offsets for O(1) paging of the raw CSV (see RowIndex)
+                'row_index': filepath.endswith('.csv') and RowIndex.build(filepath, rows),
+                # Rows for approximate answers (None when the data is no bigger)
+                'sample': reservoir.save(filepath),
+            }
+            comoments.save(ColumnarStore.comoments_path(filepath))
+            ColumnarStore.write_summary(filepath, summary)
+        return summary
+
+    @staticmethod
+    def describe_table(summary, numeric_only=False):
+        """describe()-shaped frame (stats x columns) built from a summary."""
+        return StatsAccumulator.from_dict(summary['stats']).describe(numeric_only=numeric_only)
+
+    @staticmethod
+    def summary_text(summary):
+        return StreamingIngestor.describe_table(summary, numeric_only=True).to_string()
@@ -0,0 +1,164 @@
+import json
+import os
+import re
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from .utils import atomic_write
+
+
+_JOB_ID = re.compile(r'^[A-Za-z0-9_-]{1,128}$')
+
+
+class JobQueue:
+    """
+    Background jobs for work that should not hold an HTTP request open.
+    Jobs run on a small thread pool; their status (state, progress,
+    message, result) is kept in memory and mirrored to a JSON file, so a
+    poll that lands on another gunicorn worker still sees the outcome.
+    Finished jobs are forgotten (memory and file) `ttl` seconds after they
+    end; a forgotten job id can be submitted again.
+    """
+
+    def __init__(self, workers=2, folder=None, ttl=3600):
+        self.workers = workers
+        self.folder = folder
+        self.ttl = ttl
+        self._executor = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._finished = threading.Condition(self._lock)
+        os.register_at_fork(after_in_child=self.after_fork)
+
+    def configure(self, folder, workers, ttl):
+        self.folder = folder
+        self.workers = workers
+        self.ttl = ttl
+        os.makedirs(folder, exist_ok=True)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='job')
+            return self._executor
+
+    def _path(self, job_id):
+        return os.path.join(self.folder, f"{job_id}.json")
+
+    def _save(self, job_id, job):
+        if not self.folder:
+            return
+        atomic_write(self._path(job_id), json.dumps(job, default=str))
+
+    def _register(self, job_id):
+        """Adds a queued job; False if the id is already queued, running or finished."""
+        self._evict_finished()
+        with self._lock:
+            if job_id in self._jobs and self._jobs[job_id]['state'] != 'failed':
+                return False
+            job = {'id': job_id, 'state': 'queued', 'progress': 0.0, 'message': '',
+                   'result': None, 'error': None, 'updated': time.time()}
+            self._jobs[job_id] = job
+        self._save(job_id, job)
+        return True
+
+    def submit(self, fn, *args, job_id=None, **kwargs):
+        """
+        Runs fn(*args, **kwargs) in the background and returns the job id.
+        A job id that is already queued, running or finished is not re-run.
+        """
+        job_id = job_id or uuid.uuid4().hex
+        if self._register(job_id):
+            self._get_executor().submit(self._run, job_id, fn, args, kwargs)
+        return job_id
+
+    def spawn(self, fn, *args, job_id=None, **kwargs):
+        """
+        submit() on a thread of its own, for long drivers that mostly wait
+        on another pool (e.g. a batch of files): they must not hold one of
+        the few shared job threads for their whole run.
+        """
+        job_id = job_id or uuid.uuid4().hex
+        if self._register(job_id):
+            threading.Thread(target=self._run, args=(job_id, fn, args, kwargs),
+                             name=f'job-{job_id}', daemon=True).start()
+        return job_id
+
+    def _evict_finished(self):
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job['state'] in ('done', 'failed') and job['updated'] < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+        for job_id in expired:
+            if self.folder and os.path.exists(self._path(job_id)):
+                os.remove(self._path(job_id))
+
+    def _run(self, job_id, fn, args, kwargs):
+        self.report(job_id, state='running')
+        try:
+            result = fn(*args, **kwargs)
+            self.report(job_id, state='done', progress=1.0, result=result)
+        except Exception as e:
+            print(f"--- ❌ JOB {job_id} FAILED ---")
+            print(traceback.format_exc())
+            self.report(job_id, state='failed', error=str(e))
+
+    def report(self, job_id, **fields):
+        """Updates a job's status, e.g. report(job_id, progress=0.5, message='3/6 files')."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.update(fields, updated=time.time())
+            snapshot = dict(job)
+            if job['state'] in ('done', 'failed'):
+                self._finished.notify_all()
+        self._save(job_id, snapshot)
+
+    def status(self, job_id):
+        """Latest status from this worker, else from the shared status file."""
+        if not _JOB_ID.match(job_id):
+            return None
+        with self._lock:
+            if job_id in self._jobs:
+                return dict(self._jobs[job_id])
+        if self.folder and os.path.exists(self._path(job_id)):
+            try:
+                with open(self._path(job_id)) as fh:
+                    return json.load(fh)
+            except (OSError, ValueError):
+                return None
+        return None
+
+    def wait(self, job_id, timeout):
+        """Blocks until a job submitted by this worker finishes or `timeout` seconds pass; True if it finished."""
+        with self._finished:
+            return self._finished.wait_for(
+                lambda: job_id not in self._jobs or self._jobs[job_id]['state'] in ('done', 'failed'), timeout
+            )
+
+    def is_local(self, job_id):
+        with self._lock:
+            return job_id in self._jobs
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def after_fork(self):
+        """In a forked (e.g. preloaded gunicorn) worker: the parent's pool
+        threads and jobs did not come along, so start from scratch."""
+        self._executor = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._finished = threading.Condition(self._lock)
+
+
+job_queue = JobQueue()
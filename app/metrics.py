@@ -0,0 +1,325 @@
+import glob
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+
+from .utils import atomic_write
+
+
+def current_rss_bytes():
+    """Resident set size of this process right now (Linux /proc, else peak RSS)."""
+    try:
+        with open('/proc/self/statm') as fh:
+            return int(fh.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Metrics:
+    """
+    Phase timing for the data path and a Prometheus text endpoint.
+
+    `with metrics.span('parse'):` times one stage (parse, load, transform,
+    stats, prepare, render, encode, ai...) and how much this process's RSS
+    grew meanwhile (process-wide, so approximate under concurrency). Spans
+    feed per-phase histograms; inside a request they are also collected
+    for its Server-Timing header and the slow-request log line.
+
+    Each worker keeps its own registry and mirrors it to a JSON file at
+    most once per FLUSH_SECONDS, so a scrape that lands on any worker
+    reports the sum over all of them. Files of workers that have exited
+    are dropped, and gunicorn's master clears the folder on start (see
+    reset()): totals go down when a worker is replaced and start from zero
+    with each server run, which Prometheus treats as a counter reset.
+    """
+    FLUSH_SECONDS = 1.0
+    SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+    BYTES_BUCKETS = tuple(2 ** p for p in range(20, 33, 2))  # 1 MB .. 4 GB
+    HELP = {
+        'eda_phase_seconds': ('histogram', 'Time spent in one data-path phase.'),
+        'eda_phase_rss_growth_bytes': ('histogram', 'Resident memory growth of the process during a phase.'),
+        'eda_request_seconds': ('histogram', 'HTTP request latency by endpoint.'),
+        'eda_requests_total': ('counter', 'HTTP requests by endpoint and status.'),
+        'eda_slow_requests_total': ('counter', 'Requests slower than SLOW_REQUEST_MS.'),
+        'eda_render_rejected_total': ('counter', 'Renders refused because the queue was full or timed out.'),
+    }
+
+    def __init__(self):
+        self.folder = None
+        self.slow_request_ms = 1000
+        self._lock = threading.Lock()
+        self._histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+        self._counters = Counter()  # (name, labels) -> value
+        self._flushed = 0.0
+        os.register_at_fork(after_in_child=self.after_fork)
+
+    def configure(self, app, folder, slow_request_ms):
+        self.folder = folder
+        self.slow_request_ms = slow_request_ms
+        os.makedirs(folder, exist_ok=True)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.teardown_request(lambda exc: profiler.discard())
+
+    def after_fork(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = Counter()
+        self._flushed = 0.0
+
+    # --- 1. Recording ---
+    def _buckets(self, name):
+        return self.BYTES_BUCKETS if name.endswith('_bytes') else self.SECONDS_BUCKETS
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        buckets = self._buckets(name)
+        with self._lock:
+            series = self._histograms.setdefault(key, [0] * (len(buckets) + 3))
+            index = next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            self._counters[(name, tuple(sorted(labels.items())))] += value
+
+    def record_phase(self, phase, seconds, rss_growth=0):
+        """Records a phase timed elsewhere (e.g. inside a render process)."""
+        self.observe('eda_phase_seconds', seconds, phase=phase)
+        self.observe('eda_phase_rss_growth_bytes', max(rss_growth, 0), phase=phase)
+        if has_request_context() and hasattr(g, 'metric_spans'):
+            g.metric_spans.append((phase, seconds, rss_growth))
+
+    @contextmanager
+    def span(self, phase):
+        started, rss = time.perf_counter(), current_rss_bytes()
+        try:
+            yield
+        finally:
+            self.record_phase(phase, time.perf_counter() - started, current_rss_bytes() - rss)
+
+    # --- 2. Requests ---
+    def _start_request(self):
+        g.metric_started = time.perf_counter()
+        g.metric_spans = []
+        profiler.start()
+
+    def _finish_request(self, response):
+        if not hasattr(g, 'metric_started'):
+            return response
+        seconds = time.perf_counter() - g.metric_started
+        endpoint = request.endpoint or 'unmatched'
+        self.observe('eda_request_seconds', seconds, endpoint=endpoint)
+        self.inc('eda_requests_total', endpoint=endpoint, status=str(response.status_code))
+        profiler.stop(seconds, endpoint)
+
+        spans = g.metric_spans
+        if spans:
+            totals = Counter()
+            for phase, phase_seconds, _ in spans:
+                totals[phase] += phase_seconds
+            response.headers['Server-Timing'] = ', '.join(
+                f"{phase};dur={total * 1000:.1f}" for phase, total in totals.items())
+        if seconds * 1000 >= self.slow_request_ms:
+            self.inc('eda_slow_requests_total', endpoint=endpoint)
+            print("--- 🐢 SLOW REQUEST " + json.dumps({
+                'endpoint': endpoint, 'path': request.path, 'status': response.status_code,
+                'ms': round(seconds * 1000, 1),
+                'spans': [{'phase': p, 'ms': round(s * 1000, 1), 'rss_growth_mb': round(r / 2 ** 20, 1)}
+                          for p, s, r in spans],
+            }) + " ---")
+        self.flush()
+        return response
+
+    # --- 3. Sharing between workers ---
+    def _path(self, pid):
+        return os.path.join(self.folder, f"{pid}.json")
+
+    def _snapshot(self):
+        with self._lock:
+            return {
+                'histograms': [[name, list(labels), list(series)] for (name, labels), series in self._histograms.items()],
+                'counters': [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+            }
+
+    def flush(self, force=False):
+        if not self.folder or (not force and time.time() - self._flushed < self.FLUSH_SECONDS):
+            return
+        self._flushed = time.time()
+        atomic_write(self._path(os.getpid()), json.dumps(self._snapshot()))
+
+    @staticmethod
+    def reset(folder):
+        """Removes every worker file in `folder` (run once, before any worker starts)."""
+        for path in glob.glob(os.path.join(folder, '*.json')):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _merged(self):
+        """Every live worker's registry summed; files left by exited workers are removed."""
+        self.flush(force=True)
+        histograms, counters = {}, Counter()
+        for path in glob.glob(os.path.join(self.folder, '*.json')):
+            pid = os.path.basename(path)[:-len('.json')]
+            if pid.isdigit() and not self._alive(int(pid)):
+                # A reused pid would otherwise overwrite these totals with its own
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(path) as fh:
+                    snapshot = json.load(fh)
+            except (OSError, ValueError):
+                continue
+            for name, labels, series in snapshot['histograms']:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                merged = histograms.setdefault(key, [0] * len(series))
+                histograms[key] = [a + b for a, b in zip(merged, series)]
+            for name, labels, value in snapshot['counters']:
+                counters[(name, tuple(tuple(pair) for pair in labels))] += value
+        return histograms, counters
+
+    # --- 4. Prometheus text format ---
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ''
+        escape = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in pairs) + '}'
+
+    def prometheus(self):
+        histograms, counters = self._merged()
+        lines = []
+        for name, (kind, help_text) in self.HELP.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            if kind == 'counter':
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{self._labels(labels)} {value}")
+                continue
+            bounds = [*self._buckets(name), '+Inf']
+            for (metric, labels), series in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(bounds, series):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{self._labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{self._labels(labels)} {series[-2]}")
+                lines.append(f"{name}_count{self._labels(labels)} {series[-1]}")
+        return '\n'.join(lines) + '\n'
+
+
+class SamplingProfiler:
+    """
+    Opt-in (PROFILE_SLOW_MS > 0) sampling profiler for slow requests.
+    While a request runs, one background thread samples its stack every
+    `interval` seconds; requests slower than the threshold leave their
+    samples in `folder` as folded stacks ("frame;frame;frame count" per
+    line), the input of flamegraph.pl and speedscope. At most MAX_PROFILES
+    files are kept.
+    """
+    MAX_PROFILES = 100
+
+    def __init__(self):
+        self.folder = None
+        self.threshold_ms = 0
+        self.interval = 0.005
+        self._active = {}  # thread id -> Counter of folded stacks
+        self._lock = threading.Lock()
+        self._thread = None
+        os.register_at_fork(after_in_child=self.after_fork)
+
+    def configure(self, folder, threshold_ms, interval_ms):
+        self.folder = folder
+        self.threshold_ms = threshold_ms
+        self.interval = interval_ms / 1000
+        if threshold_ms > 0:
+            os.makedirs(folder, exist_ok=True)
+
+    def after_fork(self):
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def enabled(self):
+        return self.threshold_ms > 0
+
+    def start(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._active[threading.get_ident()] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample, name='profiler', daemon=True)
+                self._thread.start()
+
+    def stop(self, seconds, label):
+        if not self.enabled:
+            return
+        with self._lock:
+            stacks = self._active.pop(threading.get_ident(), None)
+        if stacks and seconds * 1000 >= self.threshold_ms:
+            self._save(stacks, seconds, label)
+
+    def discard(self):
+        """Stops sampling this thread (a request that ended in an unhandled error)."""
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+
+    @staticmethod
+    def _fold(frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def _sample(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, stacks in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[self._fold(frame)] += 1
+
+    def _save(self, stacks, seconds, label):
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{label.replace('.', '_')}-{int(seconds * 1000)}ms-{os.getpid()}.folded"
+        with open(os.path.join(self.folder, name), 'w') as fh:
+            fh.writelines(f"{stack} {count}\n" for stack, count in stacks.most_common())
+        print(f"--- 🔬 Profile of a {seconds:.2f}s {label} request: {name} ---")
+        profiles = sorted(glob.glob(os.path.join(self.folder, '*.folded')), key=os.path.getmtime)
+        for old in profiles[:-self.MAX_PROFILES]:
+            os.remove(old)
+
+
+metrics = Metrics()
+profiler = SamplingProfiler()
@@ -1,4 +1,6 @@
+import json
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect, text
 from datetime import datetime
 
 # Define db here, but initialize it in __init__.py
@@ -6,7 +8,50 @@ db = SQLAlchemy()
 
 class DatasetMetadata(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    filename = db.Column(db.String(100), nullable=False)
+    filename = db.Column(db.String(255), nullable=False, index=True)
     rows = db.Column(db.Integer)
     cols = db.Column(db.Integer)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    # Catalog fields, written once at ingest (see catalog.DatasetCatalog)
+    content_hash = db.Column(db.String(64), index=True)
+    schema_json = db.Column(db.Text)      # [{name, dtype, numeric, nullable, nulls}]
+    stats_json = db.Column(db.Text)       # describe() table and the AI summary text
+    preview_html = db.Column(db.Text)
+    artifacts_json = db.Column(db.Text)   # sidecar/summary/co-moments paths, warehouse table, plots, transforms
+    search_text = db.Column(db.Text)      # lower-cased filename and column names
+    updated = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self, full=True):
+        entry = {
+            'filename': self.filename,
+            'rows': self.rows,
+            'cols': self.cols,
+            'content_hash': self.content_hash,
+            'timestamp': self.timestamp.isoformat() if self.timestamp else None,
+            'columns': [c['name'] for c in json.loads(self.schema_json or '[]')],
+        }
+        if full:
+            entry.update(
+                schema=json.loads(self.schema_json or '[]'),
+                stats=json.loads(self.stats_json or '{}'),
+                preview_html=self.preview_html,
+                artifacts=json.loads(self.artifacts_json or '{}'),
+            )
+        return entry
+
+
+def migrate_catalog(engine):
+    """
+    Adds catalog columns (and their indexes) missing from an app.db created
+    before they existed: create_all() only creates tables, it never alters them.
+    """
+    table = DatasetMetadata.__table__
+    existing = {col['name'] for col in inspect(engine).get_columns(table.name)}
+    with engine.begin() as conn:
+        for column in table.columns:
+            if column.name not in existing:
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} '
+                                  f'{column.type.compile(engine.dialect)}'))
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
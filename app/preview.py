@@ -0,0 +1,175 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from .columnar import ColumnarStore
+from .utils import atomic_path
+
+
+class RowIndex:
+    """
+    Sparse row-offset index for an uploaded CSV: the byte offset of every
+    STRIDE-th data row, saved next to the columnar sidecar. A page is read
+    by seeking to the nearest indexed row and parsing at most STRIDE-1
+    extra lines, so its cost does not depend on how deep the page is.
+
+    Files with newlines inside quoted fields (or blank lines) cannot be
+    addressed by line, so no index is written for them.
+    """
+    STRIDE = 1024
+    BLOCK_SIZE = 8 * 1024 * 1024
+    SUFFIX = '.rowindex.npy'
+
+    @staticmethod
+    def path(filepath):
+        return ColumnarStore.sidecar_path(filepath)[:-len(ColumnarStore.SUFFIX)] + RowIndex.SUFFIX
+
+    @staticmethod
+    def build(filepath, expected_rows):
+        """Writes the index and returns True, or returns False if the file is not line-addressable."""
+        RowIndex.remove(filepath)
+        chunks, pos, lines, quotes, last = [], 0, 0, 0, b'\n'
+        with open(filepath, 'rb') as fh:
+            for block in iter(lambda: fh.read(RowIndex.BLOCK_SIZE), b''):
+                arr = np.frombuffer(block, dtype=np.uint8)
+                newlines = np.flatnonzero(arr == ord('\n'))
+                quote_pos = np.flatnonzero(arr == ord('"'))
+                if len(quote_pos):
+                    # An odd number of quotes before a newline means it sits inside a field
+                    if ((quotes + np.searchsorted(quote_pos, newlines)) % 2).any():
+                        return False
+                    quotes += len(quote_pos)
+
+                # Newline k ends line k (line 0 is the header), so data row k starts after it
+                rows = lines + np.arange(len(newlines))
+                chunks.append(pos + newlines[rows % RowIndex.STRIDE == 0] + 1)
+                lines += len(newlines)
+                pos += len(block)
+                last = block[-1:]
+
+        offsets = np.concatenate(chunks) if chunks else np.empty(0, dtype=np.int64)
+        # Without a trailing newline the last line still holds a row
+        data_rows = lines - 1 if last == b'\n' else lines
+        if data_rows != expected_rows:
+            return False  # blank lines or similar: line numbers are not row numbers
+
+        with atomic_path(RowIndex.path(filepath)) as tmp_path, open(tmp_path, 'wb') as fh:
+            np.save(fh, offsets.astype(np.int64))
+        return True
+
+    @staticmethod
+    def load(filepath):
+        path = RowIndex.path(filepath)
+        if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(filepath):
+            return None
+        return np.load(path, mmap_mode='r')
+
+    @staticmethod
+    def read_page(filepath, offsets, header, offset, limit, columns=None):
+        block = offset // RowIndex.STRIDE
+        if block >= len(offsets):
+            return pd.DataFrame(columns=columns or header)
+        with open(filepath, 'rb') as fh:
+            fh.seek(int(offsets[block]))
+            return pd.read_csv(fh, header=None, names=header, usecols=columns,
+                               skiprows=offset - block * RowIndex.STRIDE, nrows=limit)
+
+    @staticmethod
+    def remove(filepath):
+        if os.path.exists(RowIndex.path(filepath)):
+            os.remove(RowIndex.path(filepath))
+
+    @staticmethod
+    def move(filepath, new_filepath):
+        RowIndex.remove(new_filepath)
+        if os.path.exists(RowIndex.path(filepath)):
+            os.replace(RowIndex.path(filepath), RowIndex.path(new_filepath))
+
+
+class PreviewService:
+    """
+    Pages of rows for the dashboard's virtualized table.
+    Unsorted pages of a CSV upload come straight from the source file via
+    its RowIndex; everything else is sliced from the memory-mapped sidecar
+    or the cached (transformed) frame. A sort computes the row order once
+    per dataset version and column and keeps it for the following pages.
+    """
+    MAX_LIMIT = 500
+    SORT_ORDERS = 8
+
+    _orders = OrderedDict()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def parse_sort(sort):
+        """'col' sorts ascending, '-col' descending; '' keeps file order."""
+        if not sort:
+            return None, True
+        return (sort[1:], False) if sort.startswith('-') else (sort, True)
+
+    @classmethod
+    def _sort_order(cls, version, column, ascending, load):
+        key = (version, column, ascending)
+        with cls._lock:
+            if key in cls._orders:
+                cls._orders.move_to_end(key)
+                return cls._orders[key]
+        series = load([column])[column].reset_index(drop=True)
+        order = series.sort_values(ascending=ascending, na_position='last', kind='stable').index.to_numpy()
+        with cls._lock:
+            cls._orders[key] = order
+            while len(cls._orders) > cls.SORT_ORDERS:
+                cls._orders.popitem(last=False)
+        return order
+
+    @staticmethod
+    def _json_rows(df):
+        # to_json handles NaN/NaT/numpy scalars; the round trip gives plain lists
+        return json.loads(df.to_json(orient='values', date_format='iso'))
+
+    @classmethod
+    def page(cls, filepath, version, load, offset=0, limit=100, sort=None, columns=None, summary=None):
+        """
+        One page as {'columns', 'rows', 'offset', 'limit', 'total', 'sort'}.
+        `load(columns)` returns the dataset's frame. Plain uploads pass their
+        ingest `summary`, which gives the row count and schema and means the
+        columnar sidecar (and maybe a RowIndex) can serve pages directly.
+        """
+        offset = max(int(offset), 0)
+        limit = min(max(int(limit), 1), cls.MAX_LIMIT)
+        sort_col, ascending = cls.parse_sort(sort)
+
+        if summary is not None:
+            total, all_columns = summary['rows'], summary['columns']
+        else:
+            df = load(None)
+            total, all_columns = len(df), [str(c) for c in df.columns]
+        columns = [c for c in (columns or []) if c in all_columns] or list(all_columns)
+        if sort_col is not None and sort_col not in all_columns:
+            raise ValueError(f"Cannot sort by unknown column '{sort_col}'.")
+
+        row_index = RowIndex.load(filepath) if summary is not None and summary.get('row_index') else None
+        if offset >= total:
+            page = pd.DataFrame(columns=columns)
+        elif sort_col is not None:
+            rows = cls._sort_order(version, sort_col, ascending, load)[offset:offset + limit]
+            page = ColumnarStore.take(filepath, rows, columns) if summary is not None else load(columns).iloc[rows]
+        elif row_index is not None:
+            page = RowIndex.read_page(filepath, row_index, all_columns, offset, limit, columns)
+        elif summary is not None:
+            page = ColumnarStore.slice(filepath, offset, limit, columns)
+        else:
+            page = load(columns).iloc[offset:offset + limit]
+
+        return {
+            'columns': columns,
+            'rows': cls._json_rows(page[columns]),
+            'offset': offset,
+            'limit': limit,
+            'total': int(total),
+            'sort': sort or '',
+        }
@@ -1,182 +1,577 @@
-import pandas as pd
-import numpy as np
-import matplotlib
-# CRITICAL: Use the 'Agg' backend to prevent the server from trying 
-# to open a GUI window, which causes hangs and silent refreshes.
-matplotlib.use('Agg') 
-import matplotlib.pyplot as plt
-import seaborn as sns
-import io
 import base64
+import hashlib
+import json
+import operator
+import os
+import threading
+from collections import OrderedDict
 
 import pandas as pd
 import numpy as np
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import seaborn as sns
-import io, base64
+
+# matplotlib/seaborn are imported by render.plotting() inside the render
+# processes; the web workers that import this module never load them.
+from .stats import CoMoments, StatsAccumulator
+from .charts import CHART_TYPES
+from .metrics import metrics
+from .render import draw_chart, prepare_chart, plotting
+from .render_pool import render_pool
+from .cache import dataset_cache, content_hash
+from .columnar import ColumnarStore
+from .utils import atomic_write
+from .warehouse import warehouse
 
 class DataService:
-    PLOT_CONFIG = {
-        'countplot': {'lib': 'seaborn', 'desc': 'Shows counts of observations in categorical bins.'},
-        'boxplot': {'lib': 'seaborn', 'desc': 'Displays distribution and outliers.'},
-        'histplot': {'lib': 'seaborn', 'desc': 'Shows frequency distribution (Histogram).'},
-        'scatterplot': {'lib': 'seaborn', 'desc': 'Relationship between two numeric variables.'},
-        'pie': {'lib': 'matplotlib', 'desc': 'Numerical proportions in a circle.'}
-    }
+    @staticmethod
+    def _to_base64(image_bytes):
+        return base64.b64encode(image_bytes).decode('utf8')
+
+    # Wider data gets a ranked list of pairs instead of an unreadable n x n grid
+    HEATMAP_MAX_COLUMNS = 25
+    HEATMAP_ANNOT_COLUMNS = 12
+    TOP_PAIRS = 20
+
+    @staticmethod
+    def draw_heatmap(fig, corr):
+        ax = fig.add_subplot()
+        annot = len(corr.columns) <= DataService.HEATMAP_ANNOT_COLUMNS
+        plotting().heatmap(corr, annot=annot, cmap='coolwarm', fmt=".2f", vmin=-1, vmax=1, ax=ax)
+        ax.set_title("Correlation Heatmap")
+
+    @staticmethod
+    def draw_top_pairs(fig, pairs, column_count):
+        ax = fig.add_subplot()
+        labels = [f"{x} \u00d7 {y}" for x, y, _, _ in pairs][::-1]
+        values = [r for _, _, r, _ in pairs][::-1]
+        colors = plotting().color_palette('coolwarm', as_cmap=True)([(v + 1) / 2 for v in values])
+        ax.barh(labels, values, color=colors)
+        ax.set_xlim(-1, 1)
+        ax.axvline(0, color='grey', linewidth=0.8)
+        ax.set_xlabel("Pearson r")
+        ax.set_title(f"Top {len(pairs)} correlated pairs of {column_count} numeric columns")
+        fig.tight_layout()
+
+    @staticmethod
+    def heatmap_render_args(comoments):
+        """(draw, args, figsize) for the correlation visual, from co-moments alone."""
+        count = len(comoments.columns)
+        if count < 2:
+            return None
+        if count > DataService.HEATMAP_MAX_COLUMNS:
+            return DataService.draw_top_pairs, (comoments.top_pairs(DataService.TOP_PAIRS), count), (8, 6)
+        return DataService.draw_heatmap, (comoments.correlation(),), (8, 6)
 
     @staticmethod
-    def _fig_to_base64(plt_obj):
-        img = io.BytesIO()
-        plt_obj.savefig(img, format='png', bbox_inches='tight')
-        img.seek(0)
-        encoded = base64.b64encode(img.getvalue()).decode('utf8')
-        plt_obj.close()
-        return encoded
+    def draw_distribution(fig, prepared, col):
+        draw_chart(fig, prepared)
+        fig.axes[0].set_title(f"Distribution: {col}")
 
     @staticmethod
-    def analyze_dataframe(df):
+    def eda_render_args(df, kind):
+        """
+        (draw, args, figsize) for an auto-EDA visual ('heatmap' or
+        'distribution'), or None without enough numeric data. The heavy
+        numeric work happens here; the render worker only draws.
+        """
+        numeric_df = df.select_dtypes(include=[np.number])
+        if kind == 'heatmap':
+            return DataService.heatmap_render_args(CoMoments().update(numeric_df))
+        if kind == 'distribution' and numeric_df.shape[1] >= 1:
+            # Same binned histogram as the configurator, so large columns stay cheap
+            col = numeric_df.columns[0]
+            prepared = prepare_chart(numeric_df[[col]], 'hist', col)
+            return DataService.draw_distribution, (prepared, col), (8, 6)
+        return None
+
+    @staticmethod
+    def render_eda_plot(df, kind, fmt='png'):
+        """Encoded auto-EDA image, or None without enough numeric data."""
+        task = DataService.eda_render_args(df, kind)
+        if task is None:
+            return None
+        draw, args, figsize = task
+        return render_pool.render(draw, args, figsize=figsize, fmt=fmt)
+
+    @staticmethod
+    def stats_table(describe_df):
+        """HTML for a describe()-shaped frame, numbers rounded to 2 places."""
+        rounded = describe_df.apply(lambda col: col.map(lambda v: round(v, 2) if isinstance(v, float) else v))
+        return rounded.fillna('').to_html(classes='table table-sm table-hover border-0')
+
+    @staticmethod
+    def analyze_dataframe(df, stats=None, visual_url=None):
         """
         Calculates stats and generates initial Auto-EDA visuals.
         Ensures 'visuals' key ALWAYS exists to prevent Jinja2 errors.
+        Pass a precomputed StatsAccumulator as `stats` to skip the profiling scan.
+        With `visual_url(kind)` the visuals are image URLs the browser loads
+        lazily; without it they are rendered inline as base64.
         """
-        # 1. Stats Table
-        stats_table = df.describe(include='all').round(2).fillna('').to_html(
-            classes='table table-sm table-hover border-0'
-        )
+        # 1. Stats Table (one pass over every column)
+        with metrics.span('stats'):
+            if stats is None:
+                stats = StatsAccumulator().update(df)
+            stats_table = DataService.stats_table(stats.describe())
 
         # 2. Initialize Visuals Dictionary
         visuals = {}
         numeric_df = df.select_dtypes(include=[np.number])
 
         # 3. Generate Automatic Visuals if numeric data exists
-        if not numeric_df.empty:
-            # Heatmap
-            if numeric_df.shape[1] >= 2:
-                plt.figure(figsize=(8, 6))
-                sns.heatmap(numeric_df.corr(), annot=True, cmap='coolwarm', fmt=".2f")
-                plt.title("Correlation Heatmap")
-                visuals['heatmap'] = DataService._fig_to_base64(plt)
-            
-            # Distribution of first numeric column
-            plt.figure(figsize=(8, 6))
-            sns.histplot(numeric_df.iloc[:, 0], kde=True, color='blue')
-            plt.title(f"Distribution: {numeric_df.columns[0]}")
-            visuals['distribution'] = DataService._fig_to_base64(plt)
+        for kind, needed in (('heatmap', 2), ('distribution', 1)):
+            if numeric_df.shape[1] < needed:
+                continue
+            if visual_url:
+                visuals[kind] = visual_url(kind)
+            else:
+                visuals[kind] = DataService._to_base64(DataService.render_eda_plot(numeric_df, kind))
 
         # 4. Return the complete dictionary structure
         return {
             "all_cols": list(df.columns),
-            "plot_options": DataService.PLOT_CONFIG,
+            "plot_options": CHART_TYPES,
             "stats_table": stats_table,
             "visuals": visuals  # <--- THIS MUST BE PRESENT
         }
 
 
+class TransformationService:
+    """
+    Transformations as data: every dashboard action becomes one op dict
+    (filter, dropna, fillna, drop_col, groupby, agg) that TransformPipeline
+    records, optimizes and replays. apply_op() never mutates its input,
+    so it is safe to run on frames shared through the dataset cache.
+    """
+    FILTER_OPERATORS = {
+        '==': operator.eq, '!=': operator.ne,
+        '>': operator.gt, '>=': operator.ge,
+        '<': operator.lt, '<=': operator.le,
+    }
+    AGG_FUNCS = ('mean', 'sum', 'count', 'min', 'max', 'median', 'std', 'nunique')
+
     @staticmethod
-    def generate_custom_plot(df, plot_type, x_col, y_col=None):
-        """
-        Dynamic Plot Engine with 'Debug Mode' Exception Handling.
-        Validates the plot type and parameter compatibility.
-        """
-        # 1. Validation: Does the plot exist in our supported library?
-        if plot_type not in DataService.PLOT_CONFIG:
-            raise Exception(f"No such plot can be plotted: '{plot_type}' is not supported.")
+    def get_null_report(df):
+        null_counts = df.isnull().sum()
+        return {col: int(count) for col, count in null_counts.items() if count > 0}
 
-        plt.figure(figsize=(10, 6))
-        sns.set_style("whitegrid") # Sets a professional theme for Seaborn plots
-        
-        try:
-            config = DataService.PLOT_CONFIG[plot_type]
-            
-            # 2. Logic for Seaborn Library
-            if config['lib'] == 'seaborn':
-                # Dynamically retrieve the function from the seaborn module
-                plot_func = getattr(sns, plot_type)
-                
-                if y_col and y_col != "None":
-                    plot_func(data=df, x=x_col, y=y_col)
-                else:
-                    plot_func(data=df, x=x_col)
-            
-            # 3. Logic for Matplotlib Library (e.g., Pie Charts)
-            elif config['lib'] == 'matplotlib':
-                if plot_type == 'pie':
-                    counts = df[x_col].value_counts()
-                    plt.pie(counts, labels=counts.index, autopct='%1.1f%%', startangle=140)
-                    plt.axis('equal') # Ensures pie is drawn as a circle
-                else:
-                    plt.plot(df[x_col])
-
-            plt.title(f"{plot_type.capitalize()} Analysis of {x_col}", fontsize=14, pad=20)
-            
-            # 4. Success: Return encoded image
-            return DataService._fig_to_base64(plt)
+    # --- 1. Dashboard actions -> ops ---
+    @staticmethod
+    def op_from_request(action, params):
+        """Builds the op for a /transform request, raising ValueError on bad input."""
+        column = params.get('column')
 
-        except Exception as e:
-            plt.close()
-            # This is the detailed exception you requested for debugging
-            raise Exception(f"No such plot can be plotted: Technical Error -> {str(e)}")
-        
+        if action == 'filter':
+            op_name = params.get('operator', '==')
+            if not column or op_name not in TransformationService.FILTER_OPERATORS:
+                raise ValueError("Filter needs a column and one of: " + ", ".join(TransformationService.FILTER_OPERATORS))
+            return {'op': 'filter', 'conditions': [
+                {'column': column, 'operator': op_name, 'value': params.get('value', '')}
+            ]}
+        if action in ('drop_na', 'dropna', 'dropna_col'):
+            # No column means "any column", like DataFrame.dropna()
+            return {'op': 'dropna', 'columns': [column] if column else None}
+        if action in ('fillna', 'fillna_col'):
+            if not column:
+                raise ValueError("Please select a column to fill.")
+            return {'op': 'fillna', 'column': column, 'value': params.get('value', 0)}
+        if action == 'drop_col':
+            if not column:
+                raise ValueError("Please select a column to drop.")
+            return {'op': 'drop_col', 'columns': [column]}
 
+        agg_func = (params.get('agg_func') or 'mean').lower()
+        if agg_func not in TransformationService.AGG_FUNCS:
+            raise ValueError(f"Unsupported aggregation '{agg_func}'.")
+        if action == 'groupby':
+            # The dashboard sends group_by; older clients sent group_col
+            group_col = params.get('group_col') or params.get('group_by')
+            agg_col = params.get('agg_col')
+            if not group_col or not agg_col:
+                raise ValueError("Please select both a Category and a Numeric column.")
+            return {'op': 'groupby', 'group_col': group_col, 'agg_col': agg_col, 'agg_func': agg_func}
+        if action == 'agg':
+            columns = [c for c in (params.get('columns') or '').split(',') if c]
+            return {'op': 'agg', 'columns': columns or None, 'agg_func': agg_func}
 
+        raise ValueError(f"Unknown transformation '{action}'.")
 
-    
-import pandas as pd
-import os
+    # --- 2. Executing one op ---
+    @staticmethod
+    def _require(df, columns):
+        missing = [c for c in columns if c not in df.columns]
+        if missing:
+            raise ValueError(f"Column(s) not found: {', '.join(map(str, missing))}")
 
-class TransformationService:
     @staticmethod
-    def get_null_report(df):
-        null_counts = df.isnull().sum()
-        return {col: int(count) for col, count in null_counts.items() if count > 0}
+    def coerce(value, series):
+        """Casts a form value (always a string) to the column's type."""
+        if pd.api.types.is_bool_dtype(series):
+            return str(value).lower() in ('1', 'true', 'yes')
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            series = series.cat.categories.to_series()
+        if pd.api.types.is_numeric_dtype(series):
+            return pd.to_numeric(value)
+        if pd.api.types.is_datetime64_any_dtype(series):
+            return pd.Timestamp(value)
+        return value
+
+    @staticmethod
+    def filter_mask(df, conditions):
+        mask = np.ones(len(df), dtype=bool)
+        for cond in conditions:
+            series = df[cond['column']]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                series = series.astype(series.cat.categories.dtype)
+            compare = TransformationService.FILTER_OPERATORS[cond['operator']]
+            value = TransformationService.coerce(cond['value'], series)
+            # SQL semantics: a null never matches, not even for '!='
+            hit = compare(series, value) & series.notna()
+            mask &= hit.fillna(False).to_numpy(dtype=bool)
+        return mask
+
+    @staticmethod
+    def apply_op(df, op):
+        kind = op['op']
+        if kind == 'filter':
+            TransformationService._require(df, [c['column'] for c in op['conditions']])
+            return df[TransformationService.filter_mask(df, op['conditions'])].reset_index(drop=True)
+        if kind == 'dropna':
+            if op['columns']:
+                TransformationService._require(df, op['columns'])
+            return df.dropna(subset=op['columns']).reset_index(drop=True)
+        if kind == 'fillna':
+            col = op['column']
+            TransformationService._require(df, [col])
+            series = df[col]
+            value = TransformationService.coerce(op['value'], series)
+            if isinstance(series.dtype, pd.CategoricalDtype) and value not in series.cat.categories:
+                series = series.cat.add_categories([value])
+            return df.assign(**{col: series.fillna(value)})
+        if kind == 'drop_col':
+            return df.drop(columns=[c for c in op['columns'] if c in df.columns])
+        if kind == 'groupby':
+            TransformationService._require(df, [op['group_col'], op['agg_col']])
+            # Grouping creates a new dataframe structure
+            return df.groupby(op['group_col'], observed=True)[op['agg_col']].agg(op['agg_func']).reset_index()
+        if kind == 'agg':
+            columns = op['columns'] or list(df.select_dtypes('number').columns)
+            TransformationService._require(df, columns)
+            result = df[columns].agg([op['agg_func']])
+            return result.rename_axis('statistic').reset_index()
+        raise ValueError(f"Unknown operation '{kind}'.")
 
     @staticmethod
     def apply_transform(df, action, params):
+        """Eager one-shot transform: returns (new_df, None) or (None, error)."""
         try:
-            df_copy = df.copy()
-            if action == 'dropna_col':
-                col = params.get('column')
-                df_copy = df_copy.dropna(subset=[col])
-            elif action == 'fillna_col':
-                col = params.get('column')
-                val = params.get('value', 0)
-                df_copy[col] = df_copy[col].fillna(val)
-            elif action == 'drop_col':
-                col = params.get('column')
-                if col in df_copy.columns:
-                    df_copy = df_copy.drop(columns=[col])
-            elif action == 'groupby':
-                g_col = params.get('group_by')
-                a_col = params.get('agg_col')
-                func = params.get('agg_func', 'mean')
-                # Grouping creates a new dataframe structure
-                df_copy = df_copy.groupby(g_col)[a_col].agg(func).reset_index()
-
-
-
-
-
-            work_df = df.copy() 
-        
-            try:
-                if action == 'groupby':
-                    group_col = params.get('group_col')
-                    agg_col = params.get('agg_col')
-                    agg_func = params.get('agg_func', 'mean').lower()
-                
-                    if group_col and agg_col:
-                        work_df = work_df.groupby(group_col)[agg_col].agg(agg_func).reset_index()
-                        return work_df, None
-                    else:
-                        return None, "Please select both a Category and a Numeric column."
-
-
-            
-            except Exception as e:
-                return None, f"Transformation Error: {str(e)}"
-                return df_copy, None
+            op = TransformationService.op_from_request(action, params)
+            return TransformationService.apply_op(df, op), None
         except Exception as e:
+            return None, f"Transformation Error: {str(e)}"
+
+
+class TransformPipeline:
+    """
+    A derived dataset: a source upload plus an operation log, stored as
+    uploads/.pipelines/<name>.json instead of a materialized CSV.
+    Nothing runs until a preview, plot or export asks for rows; then the
+    log is optimized (filters pushed towards the scan, only the needed
+    columns read, neighbouring ops fused) and the result is cached.
+    """
+    FOLDER = '.pipelines'
+
+    def __init__(self, source, ops=None):
+        self.source = source
+        self.ops = list(ops or [])
+
+    # --- 1. Persistence ---
+    @staticmethod
+    def path(upload_dir, name):
+        return os.path.join(upload_dir, TransformPipeline.FOLDER, name + '.json')
+
+    @classmethod
+    def load(cls, upload_dir, name):
+        """The pipeline stored under `name`, or None for a plain upload."""
+        path = cls.path(upload_dir, name)
+        if not os.path.exists(path):
+            return None
+        with open(path) as fh:
+            data = json.load(fh)
+        return cls(data['source'], data['ops'])
+
+    def save(self, upload_dir, name):
+        path = self.path(upload_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        atomic_write(path, json.dumps({'source': self.source, 'ops': self.ops}))
+
+    @classmethod
+    def remove(cls, upload_dir, name):
+        path = cls.path(upload_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def then(self, op):
+        return TransformPipeline(self.source, self.ops + [op])
+
+    def digest(self):
+        payload = json.dumps({'source': self.source, 'ops': self.ops}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf8')).hexdigest()
+
+    # --- 2. Optimizer ---
+    @staticmethod
+    def _commutes(flt, prev):
+        """True if filter `flt` may run before `prev` with the same result."""
+        cols = {c['column'] for c in flt['conditions']}
+        kind = prev['op']
+        if kind == 'dropna':
+            return True
+        if kind == 'fillna':
+            return prev['column'] not in cols
+        if kind == 'drop_col':
+            return not cols & set(prev['columns'])
+        if kind == 'groupby':
+            # Filtering on the group key removes whole groups either way
+            return cols <= {prev['group_col']}
+        return False
+
+    @staticmethod
+    def _fuse(a, b):
+        if a['op'] == 'filter':
+            return {'op': 'filter', 'conditions': a['conditions'] + b['conditions']}
+        if a['op'] == 'dropna':
+            if a['columns'] is None or b['columns'] is None:
+                return {'op': 'dropna', 'columns': None}
+            return {'op': 'dropna', 'columns': list(dict.fromkeys(a['columns'] + b['columns']))}
+        return {'op': 'drop_col', 'columns': list(dict.fromkeys(a['columns'] + b['columns']))}
+
+    @staticmethod
+    def optimize(ops):
+        # 1. Predicate pushdown: each filter moves as early as it stays valid
+        plan = []
+        for op in ops:
+            plan.append(op)
+            i = len(plan) - 1
+            while op['op'] == 'filter' and i > 0 and TransformPipeline._commutes(op, plan[i - 1]):
+                plan[i - 1], plan[i] = plan[i], plan[i - 1]
+                i -= 1
+
+        # 2. Fuse neighbours of the same kind into a single pass
+        fused = []
+        for op in plan:
+            if fused and fused[-1]['op'] == op['op'] and op['op'] in ('filter', 'dropna', 'drop_col'):
+                fused[-1] = TransformPipeline._fuse(fused[-1], op)
+            else:
+                fused.append(op)
+        return fused
+
+    @staticmethod
+    def project(plan, columns=None):
+        """
+        Projection pushdown. Returns (plan, source_columns): the plan without
+        ops that cannot affect `columns`, and the source columns it reads
+        (None = all of them).
+        """
+        needed = set(columns) if columns else None
+        kept = []
+        for op in reversed(plan):
+            kind = op['op']
+            if kind == 'groupby':
+                needed = {op['group_col'], op['agg_col']}
+            elif kind == 'agg':
+                needed = set(op['columns']) if op['columns'] else None
+            elif needed is None:
+                pass
+            elif kind == 'filter':
+                needed |= {c['column'] for c in op['conditions']}
+            elif kind == 'dropna':
+                needed = None if op['columns'] is None else needed | set(op['columns'])
+            elif kind == 'fillna' and op['column'] not in needed:
+                continue  # fills a column nothing downstream reads
+            elif kind == 'drop_col' and not needed & set(op['columns']):
+                continue  # the dropped columns are never read anyway
+            kept.append(op)
+        return kept[::-1], (sorted(needed) if needed is not None else None)
+
+    @staticmethod
+    def _scan_filter(source_path, conditions):
+        """
+        Splits filter conditions into an Arrow expression evaluated while
+        scanning the columnar sidecar and the rest, which run in pandas.
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        schema = ColumnarStore.schema(source_path)
+        expr, rest = None, []
+        for cond in conditions:
+            field = schema.field(cond['column']) if cond['column'] in schema.names else None
+            value = None
+            try:
+                if field is None:
+                    pass
+                elif pa.types.is_integer(field.type) or pa.types.is_floating(field.type):
+                    value = float(pd.to_numeric(cond['value']))
+                elif pa.types.is_string(field.type) or pa.types.is_large_string(field.type):
+                    value = str(cond['value'])
+            except (TypeError, ValueError):
+                value = None
+            if value is None:
+                rest.append(cond)
+                continue
+            compare = TransformationService.FILTER_OPERATORS[cond['operator']]
+            term = compare(pc.field(cond['column']), pc.scalar(value))
+            expr = term if expr is None else expr & term
+        return expr, rest
+
+    # --- 3. Execution ---
+    def execute(self, source_path, columns=None):
+        """
+        The pipeline's result (only `columns`, if given). Results are kept in
+        the dataset cache under the source file's identity, so re-uploading
+        the source invalidates them. Treat the frame as read-only.
+        """
+        columns = list(dict.fromkeys(columns)) if columns else None
+        variant = ('pipeline', self.digest(), tuple(columns) if columns else None)
+        return dataset_cache.get_or_load(source_path, lambda path: self._run(path, columns), variant=variant)
+
+    def _run(self, source_path, columns):
+        # Chained transforms: the previous step's full result is usually still cached
+        if columns is None and len(self.ops) > 1:
+            parent = TransformPipeline(self.source, self.ops[:-1])
+            previous = dataset_cache.peek(source_path, ('pipeline', parent.digest(), None))
+            if previous is not None:
+                return TransformationService.apply_op(previous, self.ops[-1])
+
+        plan, source_columns = self.project(self.optimize(self.ops), columns)
+
+        # Aggregating plans run inside the SQL warehouse when the source is loaded there
+        if any(op['op'] in warehouse.AGGREGATING for op in plan):
+            df = warehouse.query(content_hash(source_path), plan, source_columns)
+            if df is not None:
+                return df[columns] if columns else df
+
+        scan_filter = None
+        if plan and plan[0]['op'] == 'filter':
+            scan_filter, rest = self._scan_filter(source_path, plan[0]['conditions'])
+            plan = ([{'op': 'filter', 'conditions': rest}] if rest else []) + plan[1:]
+
+        if scan_filter is not None:
+            df = ColumnarStore.read(source_path, columns=source_columns, filter=scan_filter)
+        else:
+            df = dataset_cache.get_or_load(
+                source_path, lambda path: ColumnarStore.read(path, columns=source_columns),
+                variant=tuple(source_columns) if source_columns else None
+            )
+
+        for op in plan:
+            df = TransformationService.apply_op(df, op)
+        return df[columns] if columns else df
+
+    # --- 4. Approximation ---
+    def approximate(self, sample):
+        """
+        Replays the log on a stratified sample (sampling.Sample) instead of
+        the source. Row-level ops run as usual and keep each row's weight; a
+        final groupby/agg becomes a weighted estimate with the half-width of
+        its 95% interval in an extra '±95%' column (or row, for agg).
+        Returns (frame, sample): the estimated table and None after an
+        aggregation, else the surviving rows and their sample. None if an op
+        runs on aggregated rows, which the sample cannot stand in for.
+        """
+        df = sample.frame
+        for i, op in enumerate(self.ops):
+            if op['op'] in ('groupby', 'agg'):
+                if i != len(self.ops) - 1:
+                    return None
+                return self._estimate(sample.replace(df), op), None
+            df = TransformationService.apply_op(df, op)
+        rows = sample.replace(df)
+        return rows.data(), rows
+
+    @staticmethod
+    def _sample_values(series, agg_func):
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            return series.to_numpy(dtype=np.float64, na_value=np.nan)
+        if agg_func in ('count', 'nunique'):
+            codes = pd.factorize(series)[0].astype(np.float64)
+            codes[codes < 0] = np.nan
+            return codes
+        raise ValueError(f"Column '{series.name}' is not numeric.")
+
+    @staticmethod
+    def _estimate(sample, op):
+        df, agg_func = sample.frame, op['agg_func']
+        if op['op'] == 'groupby':
+            TransformationService._require(df, [op['group_col'], op['agg_col']])
+            keys, labels = pd.factorize(df[op['group_col']], sort=True)
+            values = TransformPipeline._sample_values(df[op['agg_col']], agg_func)
+            result = sample.estimate(keys, values, agg_func)
+            return pd.DataFrame({
+                op['group_col']: labels[result.index.to_numpy()],
+                op['agg_col']: result['y'].to_numpy(),
+                f"{op['agg_col']} ±95%": result['ci'].to_numpy(),
+            })
+
+        data = sample.data()
+        columns = op['columns'] or list(data.select_dtypes('number').columns)
+        TransformationService._require(df, columns)
+        keys = np.zeros(len(df), dtype=np.int64)
+        estimates = {}
+        for col in columns:
+            result = sample.estimate(keys, TransformPipeline._sample_values(df[col], agg_func), agg_func)
+            estimates[col] = result[['y', 'ci']].iloc[0].tolist() if len(result) else [np.nan, np.nan]
+        table = pd.DataFrame(estimates, index=[agg_func, '±95%'])
+        return table.rename_axis('statistic').reset_index()
+
+
+class CorrelationService:
+    """
+    Correlation statistics (stats.CoMoments) per dataset version.
+    Uploads read the co-moments written at ingest. A transformed dataset
+    whose last ops only drop columns reuses its parent's co-moments minus
+    those rows/columns; any other pipeline is profiled once per version.
+    """
+    MEMO_ENTRIES = 16
+
+    _memo = OrderedDict()
+    _lock = threading.Lock()
+
+    @classmethod
+    def _cached(cls, key, compute):
+        with cls._lock:
+            if key in cls._memo:
+                cls._memo.move_to_end(key)
+                return cls._memo[key]
+        with metrics.span('stats'):
+            value = compute()
+        with cls._lock:
+            cls._memo[key] = value
+            while len(cls._memo) > cls.MEMO_ENTRIES:
+                cls._memo.popitem(last=False)
+        return value
+
+    @staticmethod
+    def _profile_source(source_path):
+        path = ColumnarStore.comoments_path(source_path)
+        if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(source_path):
+            return CoMoments.load(path)
+        df = dataset_cache.get_or_load(source_path, lambda p: ColumnarStore.read(p))
+        return CoMoments().update(df)
+
+    @classmethod
+    def for_source(cls, source_path, version):
+        return cls._cached((version, None), lambda: cls._profile_source(source_path))
+
+    @classmethod
+    def for_pipeline(cls, pipeline, source_path, source_version):
+        ops, dropped = list(pipeline.ops), []
+        while ops and ops[-1]['op'] == 'drop_col':
+            dropped = ops.pop()['columns'] + dropped
 
-            return df, str(e)
+        if not ops:
+            base = cls.for_source(source_path, source_version)
+        else:
+            parent = TransformPipeline(pipeline.source, ops)
+            base = cls._cached((source_version, parent.digest()),
+                               lambda: CoMoments().update(parent.execute(source_path)))
+        return base.drop(dropped) if dropped else base
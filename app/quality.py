@@ -0,0 +1,212 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from .columnar import ColumnarStore
+from .jobs import job_queue
+from .metrics import metrics
+from .storage import storage
+from .stats import HyperLogLog, StatsAccumulator
+from .utils import atomic_write
+
+
+class QualityProfiler:
+    """
+    Data-quality profile for the cleaning panel, built in one pass over the
+    memory-mapped sidecar (or a transformed frame), batch by batch:
+
+    - null counts, and pairwise missingness co-occurrence (the nulls
+      indicator matrix multiplied by its transpose, per batch)
+    - type violations in text columns: numbers stored as text, or text
+      in a column that is mostly numbers
+    - outliers outside the 1.5 IQR fences; for uploads the quartiles come
+      from the ingest sketch (approximate, but no extra pass is needed)
+    - duplicate rows from 64-bit row hashes: exact up to
+      EXACT_DUPLICATE_ROWS rows, then a HyperLogLog estimate
+
+    The report is saved next to the sidecar, tagged with the dataset
+    version, and uploads are profiled in the background right after
+    ingest.
+    """
+    SUFFIX = '.quality.json'
+    BATCH_ROWS = 65_536
+    EXACT_DUPLICATE_ROWS = 2_000_000
+    TOP_PAIRS = 20
+
+    @staticmethod
+    def path(filepath):
+        return ColumnarStore.sidecar_path(filepath)[:-len(ColumnarStore.SUFFIX)] + QualityProfiler.SUFFIX
+
+    @staticmethod
+    def cached(filepath, version):
+        """The saved report for this dataset version, or None."""
+        path = QualityProfiler.path(filepath)
+        if not os.path.exists(path):
+            return None
+        with open(path) as fh:
+            report = json.load(fh)
+        return report if report.get('version') == version else None
+
+    @staticmethod
+    def remove(filepath):
+        if os.path.exists(QualityProfiler.path(filepath)):
+            os.remove(QualityProfiler.path(filepath))
+
+    @staticmethod
+    def _save(filepath, report):
+        path = QualityProfiler.path(filepath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        atomic_write(path, json.dumps(report))
+
+    # --- 1. Outlier fences ---
+    @staticmethod
+    def _fences(q1, q3):
+        if q1 is None or q3 is None or np.isnan(q1) or np.isnan(q3):
+            return None
+        iqr = q3 - q1
+        return float(q1 - 1.5 * iqr), float(q3 + 1.5 * iqr)
+
+    @staticmethod
+    def fences_from_summary(summary):
+        fences = {}
+        for col, stats in StatsAccumulator.from_dict(summary['stats']).columns.items():
+            if stats.numeric:
+                described = stats.summary()
+                fences[col] = QualityProfiler._fences(described.get('25%'), described.get('75%'))
+        return fences
+
+    @staticmethod
+    def fences_from_frame(df):
+        fences = {}
+        for col in df.columns:
+            if pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col]):
+                q1, q3 = df[col].quantile([0.25, 0.75])
+                fences[str(col)] = QualityProfiler._fences(q1, q3)
+        return fences
+
+    # --- 2. The pass ---
+    @classmethod
+    def profile(cls, batches, columns, fences):
+        """Report for an iterable of DataFrame batches with these columns."""
+        k = len(columns)
+        nulls = np.zeros(k, dtype=np.int64)
+        co_missing = np.zeros((k, k), dtype=np.int64)
+        numeric_text = dict.fromkeys(columns, 0)
+        text_values = dict.fromkeys(columns, 0)
+        outliers = dict.fromkeys(columns, 0)
+        distinct_rows, exact_hashes, rows = HyperLogLog(p=14), [], 0
+
+        for batch in batches:
+            if not len(batch):
+                continue
+            batch.columns = columns
+            # float32 counts are exact per batch (BATCH_ROWS < 2**24)
+            missing = batch.isna().to_numpy(dtype=np.float32)
+            nulls += missing.sum(axis=0).astype(np.int64)
+            co_missing += (missing.T @ missing).astype(np.int64)
+
+            for col in columns:
+                series = batch[col]
+                if col in fences:
+                    if fences[col] is not None:
+                        lo, hi = fences[col]
+                        values = series.to_numpy(dtype='float64', na_value=np.nan)
+                        outliers[col] += int(np.count_nonzero((values < lo) | (values > hi)))
+                elif not pd.api.types.is_bool_dtype(series):
+                    present = series.dropna().astype(str)
+                    text_values[col] += len(present)
+                    numeric_text[col] += int(pd.to_numeric(present, errors='coerce').notna().sum())
+
+            hashes = pd.util.hash_pandas_object(batch, index=False).to_numpy(dtype=np.uint64)
+            distinct_rows.update_hashes(hashes)
+            if exact_hashes is not None:
+                exact_hashes.append(hashes)
+                if rows + len(hashes) > cls.EXACT_DUPLICATE_ROWS:
+                    exact_hashes = None
+            rows += len(batch)
+
+        if exact_hashes is not None:
+            distinct = len(np.unique(np.concatenate(exact_hashes))) if exact_hashes else 0
+        else:
+            distinct = min(distinct_rows.estimate(), rows)
+
+        report_columns = {}
+        for i, col in enumerate(columns):
+            entry = {'nulls': int(nulls[i]), 'null_pct': float(nulls[i] / rows * 100) if rows else 0.0}
+            if col in fences:
+                entry['outliers'] = outliers[col]
+                entry['fences'] = fences[col]
+            elif text_values[col]:
+                numbers = numeric_text[col]
+                mostly_numbers = numbers > text_values[col] / 2
+                entry['numbers_as_text'] = numbers
+                # The minority type is the violation
+                entry['type_violations'] = text_values[col] - numbers if mostly_numbers else numbers
+                entry['expected_type'] = 'number' if mostly_numbers else 'text'
+            report_columns[col] = entry
+
+        pairs = [
+            {'x': columns[i], 'y': columns[j], 'both_missing': int(co_missing[i, j]),
+             # Jaccard overlap of the two columns' missing rows
+             'overlap': float(co_missing[i, j] / (nulls[i] + nulls[j] - co_missing[i, j]))}
+            for i in range(k) for j in range(i + 1, k) if co_missing[i, j]
+        ]
+        pairs.sort(key=lambda p: (-p['overlap'], -p['both_missing']))
+
+        return {
+            'rows': rows,
+            'columns': report_columns,
+            'null_report': {col: int(nulls[i]) for i, col in enumerate(columns) if nulls[i]},
+            'co_missing': pairs[:cls.TOP_PAIRS],
+            'duplicates': {'rows': rows - distinct, 'exact': exact_hashes is not None},
+        }
+
+    # --- 3. Sources ---
+    @classmethod
+    def _sidecar_batches(cls, filepath):
+        with pa.memory_map(ColumnarStore.sidecar_path(filepath)) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                for offset in range(0, batch.num_rows, cls.BATCH_ROWS):
+                    yield batch.slice(offset, cls.BATCH_ROWS).to_pandas()
+
+    @classmethod
+    def profile_upload(cls, filepath, version):
+        """Profiles an ingested upload from its sidecar and saves the report."""
+        # The version being profiled stays on disk even if a newer upload replaces it meanwhile
+        with storage.holding(filepath):
+            summary = ColumnarStore.read_summary(filepath)
+            with metrics.span('quality'):
+                report = cls.profile(cls._sidecar_batches(filepath), summary['columns'], cls.fences_from_summary(summary))
+            report['version'] = version
+            cls._save(filepath, report)
+        print(f"--- 🧹 Quality profile for {os.path.basename(filepath)}: "
+              f"{report['duplicates']['rows']} duplicate rows ---")
+        return report
+
+    @classmethod
+    def profile_frame(cls, df, filepath, version):
+        """Profiles an in-memory (e.g. transformed) frame and saves the report."""
+        columns = [str(c) for c in df.columns]
+        batches = (df.iloc[i:i + cls.BATCH_ROWS].copy() for i in range(0, len(df), cls.BATCH_ROWS))
+        with metrics.span('quality'):
+            report = cls.profile(batches, columns, cls.fences_from_frame(df))
+        report['version'] = version
+        cls._save(filepath, report)
+        return report
+
+    @staticmethod
+    def job_id(filepath, version):
+        """Per content and path: the same bytes under another name or version directory get their own report."""
+        where = hashlib.sha256(os.path.abspath(filepath).encode('utf8')).hexdigest()[:16]
+        return f"quality-{version[:32]}-{where}"
+
+    @classmethod
+    def submit(cls, filepath, version):
+        """Profiles an upload in the background; returns the job id."""
+        return job_queue.submit(cls.profile_upload, filepath, version, job_id=cls.job_id(filepath, version))
@@ -0,0 +1,228 @@
+import io
+import time
+
+import numpy as np
+import pandas as pd
+
+# Seaborn style used for every server-rendered chart (part of the plot cache key)
+PLOT_THEME = 'whitegrid'
+
+_themed = False
+
+
+def plotting():
+    """
+    The seaborn module, with matplotlib on the Agg backend and the theme
+    applied on first use. Web workers only prepare data for charts, so
+    they never pay this import; render processes pay it once at start
+    (see render_pool._warm_worker).
+    """
+    global _themed
+    import matplotlib
+    if not _themed:
+        matplotlib.use('Agg')
+    import seaborn as sns
+    if not _themed:
+        sns.set_theme(style=PLOT_THEME)
+        _themed = True
+    return sns
+
+
+class PlotPreparer:
+    """
+    Reduces a frame to what a chart actually needs before it reaches
+    seaborn/matplotlib, so render cost tracks the output size rather than
+    the row count:
+      - scatter: 2D binned density
+      - line:    min/max decimation per x bucket
+      - hist:    pre-binned counts plus a binned KDE curve
+      - bar:     per-category mean with a 95% normal-approximation CI
+    Frames at or under `exact_max_rows` are passed through untouched and
+    drawn by seaborn as before. exact=True asks for that on larger frames
+    too, up to EXACT_CAP times `exact_max_rows`; beyond it the frame is
+    reduced anyway rather than shipped whole to a render process.
+    """
+    EXACT_CAP = 10
+    DENSITY_BINS = 200
+    LINE_BUCKETS = 2000
+    HIST_BINS = 50
+    KDE_GRID = 512
+
+    def __init__(self, exact_max_rows=20_000):
+        self.exact_max_rows = exact_max_rows
+
+    def prepare(self, df, plot_type, x_col, y_col=None, exact=False):
+        if y_col == 'None':
+            y_col = None
+        limit = self.exact_max_rows * (self.EXACT_CAP if exact else 1)
+        if len(df) <= limit:
+            return {'kind': 'exact', 'plot_type': plot_type, 'data': df, 'x': x_col, 'y': y_col}
+
+        if plot_type == 'scatter' and y_col and self._numeric(df, x_col, y_col):
+            return self._density(df, x_col, y_col)
+        if plot_type == 'line' and y_col and self._numeric(df, y_col):
+            return self._decimate(df, x_col, y_col)
+        if plot_type == 'hist':
+            return self._histogram(df, x_col)
+        if plot_type == 'bar' and y_col and self._numeric(df, y_col):
+            return self._bar_means(df, x_col, y_col)
+        # Nothing cheaper applies (e.g. categorical scatter): draw the real data
+        return {'kind': 'exact', 'plot_type': plot_type, 'data': df, 'x': x_col, 'y': y_col}
+
+    @staticmethod
+    def _numeric(df, *cols):
+        return all(pd.api.types.is_numeric_dtype(df[c]) and not pd.api.types.is_bool_dtype(df[c]) for c in cols)
+
+    def _density(self, df, x_col, y_col):
+        xy = df[[x_col, y_col]].dropna().to_numpy(dtype=np.float64)
+        counts, x_edges, y_edges = np.histogram2d(xy[:, 0], xy[:, 1], bins=self.DENSITY_BINS)
+        return {'kind': 'density', 'counts': counts, 'x_edges': x_edges, 'y_edges': y_edges,
+                'x': x_col, 'y': y_col, 'rows': len(xy)}
+
+    def _decimate(self, df, x_col, y_col):
+        data = df[[x_col, y_col]].dropna()
+        if data.empty:
+            return {'kind': 'line', 'xs': np.array([]), 'ys': np.array([]), 'x': x_col, 'y': y_col}
+        if not (pd.api.types.is_numeric_dtype(data[x_col]) or pd.api.types.is_datetime64_any_dtype(data[x_col])):
+            # Categorical x: seaborn would aggregate to the mean per category anyway
+            means = data.groupby(x_col, observed=True)[y_col].mean()
+            return {'kind': 'line', 'xs': means.index.to_numpy(), 'ys': means.to_numpy(), 'x': x_col, 'y': y_col}
+
+        data = data.sort_values(x_col)
+        xs, ys = data[x_col].to_numpy(), data[y_col].to_numpy(dtype=np.float64)
+        # Keep the min and max of every bucket so spikes survive the reduction
+        starts = np.linspace(0, len(ys), self.LINE_BUCKETS + 1, dtype=np.int64)[:-1]
+        starts = np.unique(starts)
+        lo = np.minimum.reduceat(ys, starts)
+        hi = np.maximum.reduceat(ys, starts)
+        bucket_x = xs[starts]
+        return {'kind': 'line', 'xs': np.repeat(bucket_x, 2), 'ys': np.column_stack([lo, hi]).ravel(),
+                'x': x_col, 'y': y_col}
+
+    def _histogram(self, df, x_col):
+        series = df[x_col].dropna()
+        if not self._numeric(df, x_col):
+            counts = series.value_counts().head(self.HIST_BINS)
+            return {'kind': 'counts', 'labels': counts.index.astype(str).to_numpy(),
+                    'counts': counts.to_numpy(), 'x': x_col}
+
+        values = series.to_numpy(dtype=np.float64)
+        counts, edges = np.histogram(values, bins=self.HIST_BINS)
+
+        # KDE from a fine histogram convolved with a Gaussian (Scott's rule)
+        fine, fine_edges = np.histogram(values, bins=self.KDE_GRID)
+        step = fine_edges[1] - fine_edges[0]
+        bandwidth = 1.06 * values.std() * len(values) ** (-1 / 5)
+        kde = None
+        if step > 0 and bandwidth > 0:
+            offsets = np.arange(-4 * bandwidth, 4 * bandwidth + step, step)
+            kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2)
+            smooth = np.convolve(fine, kernel / kernel.sum(), mode='same')
+            # Scale the density to the coarse bins so both share one y-axis
+            kde = (0.5 * (fine_edges[:-1] + fine_edges[1:]), smooth * (edges[1] - edges[0]) / step)
+        return {'kind': 'hist', 'counts': counts, 'edges': edges, 'kde': kde, 'x': x_col}
+
+    def _bar_means(self, df, x_col, y_col):
+        grouped = df.groupby(x_col, observed=True)[y_col].agg(['mean', 'std', 'count'])
+        ci = 1.96 * grouped['std'].fillna(0) / np.sqrt(grouped['count'])
+        return {'kind': 'bar', 'labels': grouped.index.astype(str).to_numpy(),
+                'means': grouped['mean'].to_numpy(), 'ci': ci.to_numpy(), 'x': x_col, 'y': y_col}
+
+
+def draw_prepared(prepared, ax):
+    """Draws the output of PlotPreparer.prepare() onto a matplotlib Axes."""
+    kind = prepared['kind']
+
+    if kind == 'exact':
+        sns = plotting()
+        df, x, y, plot_type = prepared['data'], prepared['x'], prepared['y'], prepared['plot_type']
+        if plot_type == 'bar':
+            sns.barplot(data=df, x=x, y=y, ax=ax)
+        elif plot_type == 'scatter':
+            sns.scatterplot(data=df, x=x, y=y, ax=ax)
+        elif plot_type == 'line':
+            # No bootstrapped confidence band: it costs seconds on a few thousand rows
+            sns.lineplot(data=df, x=x, y=y, errorbar=None, ax=ax)
+        elif plot_type == 'hist':
+            sns.histplot(data=df, x=x, kde=True, ax=ax)
+        return
+
+    if kind == 'density':
+        from matplotlib.colors import LogNorm
+        mesh = ax.pcolormesh(prepared['x_edges'], prepared['y_edges'], prepared['counts'].T,
+                             norm=LogNorm(vmin=1), cmap='viridis')
+        ax.figure.colorbar(mesh, ax=ax, label='points per bin')
+        ax.set_title(f"{prepared['rows']:,} points (binned)", fontsize=10)
+    elif kind == 'line':
+        ax.plot(prepared['xs'], prepared['ys'], linewidth=1)
+        ax.set_ylabel(prepared['y'])
+    elif kind == 'hist':
+        edges = prepared['edges']
+        ax.stairs(prepared['counts'], edges, fill=True, alpha=0.6)
+        if prepared['kde'] is not None:
+            ax.plot(*prepared['kde'])
+        ax.set_ylabel('Count')
+    elif kind == 'counts':
+        ax.bar(prepared['labels'], prepared['counts'])
+        ax.set_ylabel('Count')
+    elif kind == 'bar':
+        ax.bar(prepared['labels'], prepared['means'], yerr=prepared['ci'], capsize=3)
+        ax.set_ylabel(prepared['y'])
+    ax.set_xlabel(prepared['x'])
+
+
+def new_figure(figsize=(10, 6)):
+    """
+    Standalone Figure on its own Agg canvas. Nothing touches pyplot's global
+    figure manager, so figures can be drawn from any thread or process.
+    """
+    plotting()
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def figure_bytes(fig, fmt='png'):
+    img = io.BytesIO()
+    fig.savefig(img, format=fmt, bbox_inches='tight')
+    return img.getvalue()
+
+
+def draw_chart(fig, prepared):
+    """Draw callable for configurator charts (see RenderPool.render)."""
+    ax = fig.add_subplot()
+    draw_prepared(prepared, ax)
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+
+
+def render_image(draw, args=(), figsize=(10, 6), fmt='png'):
+    """Runs `draw(fig, *args)` on a fresh Figure and returns the encoded image."""
+    fig = new_figure(figsize)
+    draw(fig, *args)
+    return figure_bytes(fig, fmt)
+
+
+def timed_render_image(draw, args=(), figsize=(10, 6), fmt='png'):
+    """
+    render_image() that also reports its phases, measured in the process
+    that draws: (image bytes, {'render': (seconds, rss growth), 'encode': ...}).
+    """
+    from .metrics import current_rss_bytes
+
+    started, rss = time.perf_counter(), current_rss_bytes()
+    fig = new_figure(figsize)
+    draw(fig, *args)
+    drawn, drawn_rss = time.perf_counter(), current_rss_bytes()
+    data = figure_bytes(fig, fmt)
+    phases = {'render': (drawn - started, drawn_rss - rss),
+              'encode': (time.perf_counter() - drawn, current_rss_bytes() - drawn_rss)}
+    return data, phases
+
+
+def prepare_chart(df, plot_type, x_col, y_col=None, exact=False, preparer=None):
+    """Reduced data for one dashboard chart, ready to ship to a render worker."""
+    preparer = preparer or PlotPreparer()
+    return preparer.prepare(df, plot_type, x_col, y_col, exact=exact)
@@ -0,0 +1,150 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from .metrics import metrics
+from .render import timed_render_image
+
+
+class RenderBusyError(Exception):
+    """The render queue is full; the caller should retry later (HTTP 503)."""
+
+
+class RenderTimeoutError(Exception):
+    """A render did not finish within RENDER_TIMEOUT (HTTP 504)."""
+
+
+class RenderCrashedError(RuntimeError):
+    """The render process died twice in a row while drawing a chart."""
+
+
+def _warm_worker():
+    """Runs once per render process: pay the matplotlib/seaborn import and
+    font-cache cost before the first real request arrives."""
+    from .render import new_figure, figure_bytes
+    fig = new_figure((2, 2))
+    fig.add_subplot().plot([0, 1], [0, 1])
+    figure_bytes(fig)
+
+
+class RenderPool:
+    """
+    Dedicated processes for matplotlib work.
+    Web threads submit draw callables (top-level functions, so they pickle
+    by reference) plus their small prepared data; workers return encoded
+    image bytes. A bounded semaphore caps queued renders and every render
+    has a timeout, so a slow chart can no longer pin a whole web worker.
+    With workers=0 rendering happens inline in the calling thread.
+    """
+
+    QUEUE_WAIT = 1.0  # seconds a request may wait for a free queue slot
+
+    def __init__(self, workers=2, queue_size=16, timeout=30):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self.after_fork)
+
+    def configure(self, workers, queue_size, timeout):
+        self.shutdown()
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(queue_size)
+
+    def _get_executor(self):
+        # Started lazily so forked web workers each get their own pool
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_warm_worker
+                )
+            return self._executor
+
+    def render(self, draw, args=(), figsize=(10, 6), fmt='png'):
+        """Encoded image bytes for `draw(fig, *args)`."""
+        started = time.perf_counter()
+        if self.workers <= 0:
+            data, phases = timed_render_image(draw, args, figsize, fmt)
+        else:
+            data, phases = self._render_in_pool(draw, args, figsize, fmt)
+
+        # Drawing and encoding are timed inside the render process; the rest is queueing and IPC
+        for phase, (seconds, rss_growth) in phases.items():
+            metrics.record_phase(phase, seconds, rss_growth)
+        metrics.record_phase('render_queue', max(time.perf_counter() - started - sum(s for s, _ in phases.values()), 0))
+        return data
+
+    def _render_in_pool(self, draw, args, figsize, fmt, retry=True):
+        slots = self._slots
+        if not slots.acquire(timeout=self.QUEUE_WAIT):
+            metrics.inc('eda_render_rejected_total', reason='busy')
+            raise RenderBusyError("Render queue is full, please retry shortly.")
+        executor = self._get_executor()
+        try:
+            future = executor.submit(timed_render_image, draw, args, figsize, fmt)
+        except BrokenProcessPool:
+            slots.release()
+            return self._restart(executor, draw, args, figsize, fmt, retry)
+        # The slot is held until the render process is actually free again, not just until we stop waiting
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # cancel() cannot stop a running render: kill the pool so the hung process goes with it
+            self._recycle(executor, terminate=True)
+            metrics.inc('eda_render_rejected_total', reason='timeout')
+            raise RenderTimeoutError(f"Rendering took longer than {self.timeout}s.")
+        except BrokenProcessPool:
+            return self._restart(executor, draw, args, figsize, fmt, retry)
+
+    def _restart(self, executor, draw, args, figsize, fmt, retry):
+        """A render process died (OOM kill, segfault): start a new pool and try once more."""
+        self._recycle(executor)
+        metrics.inc('eda_render_pool_restarts_total')
+        print("--- ⚠️ Render process died; restarting the render pool ---")
+        if not retry:
+            raise RenderCrashedError("The render process died while drawing this chart.")
+        return self._render_in_pool(draw, args, figsize, fmt, retry=False)
+
+    def _recycle(self, executor, terminate=False):
+        """Drops `executor` (unless another thread already replaced it); the next render starts a fresh pool."""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        if terminate:
+            # Renders still running in it fail with BrokenProcessPool, which releases their slots
+            for process in list((executor._processes or {}).values()):
+                process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def warm(self):
+        """Starts the render processes now instead of on the first chart."""
+        if self.workers > 0:
+            executor = self._get_executor()
+            for future in [executor.submit(int) for _ in range(self.workers)]:
+                future.result(timeout=self.timeout)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def after_fork(self):
+        """In a forked worker: the parent's render processes belong to the
+        parent, so this worker starts its own pool on first use."""
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(self.queue_size)
+        self._lock = threading.Lock()
+
+
+render_pool = RenderPool()
@@ -0,0 +1,286 @@
+import base64
+import html
+import io
+import os
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from werkzeug.utils import secure_filename
+
+from .columnar import ColumnarStore
+from .jobs import job_queue
+from .metrics import metrics
+from .processor import DataService
+from .render import PlotPreparer, draw_chart, prepare_chart
+from .render_pool import render_pool, RenderBusyError, RenderCrashedError, RenderTimeoutError
+from .stats import CoMoments, StatsAccumulator
+from .storage import storage
+from .utils import atomic_write
+
+
+def draw_titled(fig, prepared, title):
+    """Draw callable for report charts: a configurator chart with its own title."""
+    draw_chart(fig, prepared)
+    fig.axes[0].set_title(title)
+
+
+class EDAReport:
+    """
+    The full auto-EDA report of a dataset, built by one background job:
+    a chart for every column (histogram, or counts of the top categories)
+    plus the pairwise visuals (correlation heatmap, the most correlated
+    numeric pairs, numeric means per low-cardinality category).
+
+    The job parses the frame once and takes all statistics from one
+    profile (an upload's ingest summary and co-moments, else a single
+    StatsAccumulator/CoMoments pass), so no chart re-reads the data. Each
+    chart is reduced in the job thread and handed to the render pool as
+    soon as it is ready, with as many renders in flight as there are
+    render processes, so preparing the next chart overlaps drawing the
+    last ones. The result is saved as one self-contained HTML page and a
+    ZIP (page, PNGs and the statistics as CSV) named after the dataset
+    hash, so a version is only ever rendered once.
+    """
+    FORMATS = {'html': 'text/html', 'zip': 'application/zip'}
+    MAX_CATEGORIES = 20
+    # Text columns with more distinct values than this share of rows are identifiers
+    IDENTIFIER_RATIO = 0.5
+    BUSY_RETRIES = 10
+    BUSY_WAIT = 0.5
+
+    def __init__(self, folder=None, max_pairs=20, max_entries=32):
+        self.folder = folder
+        self.max_pairs = max_pairs
+        self.max_entries = max_entries
+
+    def configure(self, folder, max_pairs, max_entries):
+        self.folder = folder
+        self.max_pairs = max_pairs
+        self.max_entries = max_entries
+        os.makedirs(folder, exist_ok=True)
+
+    # --- 1. Artifacts ---
+    def path(self, version, fmt):
+        return os.path.join(self.folder, f"{version}.{fmt}")
+
+    def cached(self, version, fmt='html'):
+        """Path of the saved report for this dataset version, or None."""
+        path = self.path(version, fmt)
+        return path if os.path.exists(path) else None
+
+    @staticmethod
+    def job_id(version):
+        return 'report-' + version[:32]
+
+    def _write(self, version, fmt, data):
+        atomic_write(self.path(version, fmt), data)
+
+    def _evict(self):
+        """Keeps the `max_entries` most recently built reports."""
+        reports = sorted(
+            (os.path.getmtime(os.path.join(self.folder, name)), name[:-len('.html')])
+            for name in os.listdir(self.folder) if name.endswith('.html')
+        )
+        for _, version in reports[:max(len(reports) - self.max_entries, 0)]:
+            for fmt in self.FORMATS:
+                if os.path.exists(self.path(version, fmt)):
+                    os.remove(self.path(version, fmt))
+
+    # --- 2. Planning ---
+    def plan(self, df, stats, comoments, preparer):
+        """
+        Every visual of the report as (section, name, title, prepare) with
+        `prepare()` returning (draw, args, figsize) or None, plus the
+        columns left out and why. Nothing is computed until prepare() runs.
+        """
+        charts, skipped = [], []
+        numeric, categories = [], []
+
+        for col in df.columns:
+            key = str(col)
+            col_stats = stats.columns.get(key)
+            if col_stats is None or col_stats.count == 0:
+                skipped.append((key, 'no values'))
+                continue
+            distinct = col_stats.distinct.estimate()
+            if col_stats.numeric:
+                numeric.append(col)
+                charts.append(('Columns', f"hist_{key}", f"Distribution: {key}",
+                               lambda col=col: (draw_titled, (prepare_chart(df[[col]], 'hist', col, preparer=preparer),
+                                                              f"Distribution: {col}"), (8, 5))))
+            elif distinct > self.MAX_CATEGORIES and distinct > self.IDENTIFIER_RATIO * col_stats.count:
+                skipped.append((key, f"about {distinct:,} distinct values (identifier-like)"))
+            else:
+                if 2 <= distinct <= self.MAX_CATEGORIES:
+                    categories.append(col)
+                title = f"Top {self.MAX_CATEGORIES} values: {key}" if distinct > self.MAX_CATEGORIES else f"Values: {key}"
+                charts.append(('Columns', f"counts_{key}", title,
+                               lambda col=col, title=title: (draw_titled, (self._counts(df, col), title), (8, 5))))
+
+        if comoments is not None and len(comoments.columns) >= 2:
+            charts.append(('Relationships', 'correlation', 'Correlation',
+                           lambda: DataService.heatmap_render_args(comoments)))
+            for x, y, r, _ in comoments.top_pairs(self.max_pairs):
+                title = f"{y} vs {x} (r = {r:.2f})"
+                charts.append(('Relationships', f"scatter_{x}_{y}", title,
+                               lambda x=x, y=y, title=title: (draw_titled, (prepare_chart(df[[x, y]], 'scatter', x, y,
+                                                                                          preparer=preparer), title), (8, 6))))
+
+        pairs = [(cat, col) for cat in categories for col in numeric][:self.max_pairs]
+        for cat, col in pairs:
+            title = f"Mean {col} by {cat}"
+            charts.append(('Relationships', f"bar_{cat}_{col}", title,
+                           lambda cat=cat, col=col, title=title: (draw_titled, (prepare_chart(df[[cat, col]], 'bar', cat, col,
+                                                                                              preparer=preparer), title), (8, 5))))
+        return charts, skipped
+
+    def _counts(self, df, col):
+        """Counts of the most frequent values, drawn as bars (same shape as PlotPreparer's)."""
+        counts = df[col].value_counts().head(self.MAX_CATEGORIES)
+        return {'kind': 'counts', 'labels': counts.index.astype(str).to_numpy(),
+                'counts': counts.to_numpy(), 'x': str(col)}
+
+    # --- 3. The report job ---
+    def _render(self, draw, args, figsize):
+        for attempt in range(self.BUSY_RETRIES):
+            try:
+                return render_pool.render(draw, args, figsize=figsize)
+            except RenderBusyError:
+                # Dashboard requests share the queue: back off rather than fail the report
+                if attempt == self.BUSY_RETRIES - 1:
+                    raise
+                time.sleep(self.BUSY_WAIT)
+
+    def build(self, job_id, path, version, title, load, summary=None, exact_max_rows=20_000):
+        """
+        Runs as a job: renders and saves the report of the dataset that
+        `load()` parses. `path` is the file pinned meanwhile, `summary` an
+        upload's ingest summary whose statistics are reused.
+        """
+        with storage.holding(path):
+            job_queue.report(job_id, progress=0.02, message='Loading data')
+            df = load()
+
+            job_queue.report(job_id, progress=0.05, message='Profiling columns')
+            with metrics.span('stats'):
+                stats = StatsAccumulator.from_dict(summary['stats']) if summary else StatsAccumulator().update(df)
+                comoments_path = ColumnarStore.comoments_path(path)
+                if summary and os.path.exists(comoments_path):
+                    comoments = CoMoments.load(comoments_path)
+                else:
+                    comoments = CoMoments().update(df)
+
+            charts, skipped = self.plan(df, stats, comoments, PlotPreparer(exact_max_rows=exact_max_rows))
+            images, failed, unrendered = self._render_all(job_id, charts)
+        if unrendered:
+            # The render pool was overloaded or broken, not the chart: fail so the next request retries
+            title, error = unrendered[0]
+            raise RuntimeError(f"{len(unrendered)} charts could not be rendered (first: {title}: {error}); "
+                               f"the report was not saved, please retry.")
+
+        job_queue.report(job_id, progress=0.97, message='Writing report')
+        describe = stats.describe()
+        page = self._html(title, df.shape, describe, charts, images, skipped + failed, inline=True)
+        self._write(version, 'zip', self._zip(title, df.shape, describe, charts, images, skipped + failed))
+        self._write(version, 'html', page.encode('utf8'))
+        self._evict()
+        print(f"--- 📑 Report for {title}: {len(images)} charts, {len(skipped) + len(failed)} skipped ---")
+        return {'charts': len(images), 'skipped': [{'name': n, 'reason': r} for n, r in skipped + failed]}
+
+    def _render_all(self, job_id, charts):
+        """
+        Prepares the charts one by one in this thread while up to one per
+        render process draws. Returns the images, the charts whose data
+        could not be drawn, and those the render pool failed to draw.
+        """
+        images, failed, unrendered = {}, [], []
+        with ThreadPoolExecutor(max_workers=max(render_pool.workers, 1)) as renderers:
+            futures = {}
+            for section, name, title, prepare in charts:
+                try:
+                    with metrics.span('prepare'):
+                        task = prepare()
+                except Exception as e:
+                    failed.append((title, str(e)))
+                    continue
+                if task is not None:
+                    futures[renderers.submit(self._render, *task)] = (name, title)
+
+            for done, future in enumerate(as_completed(futures), 1):
+                name, title = futures[future]
+                try:
+                    images[name] = future.result()
+                except (RenderBusyError, RenderTimeoutError, RenderCrashedError) as e:
+                    unrendered.append((title, str(e)))
+                except Exception as e:
+                    failed.append((title, str(e)))
+                job_queue.report(job_id, progress=0.1 + 0.85 * done / len(futures),
+                                 message=f"{done}/{len(futures)} charts rendered (last: {title})")
+        return images, failed, unrendered
+
+    # --- 4. Output ---
+    STYLE = (
+        "body{font-family:system-ui,sans-serif;margin:2rem auto;max-width:1100px;color:#212529}"
+        "h1{font-size:1.6rem}h2{font-size:1.25rem;margin-top:2rem;border-bottom:1px solid #dee2e6}"
+        "table{border-collapse:collapse;font-size:.8rem}td,th{border:1px solid #dee2e6;padding:.25rem .5rem}"
+        ".grid{display:grid;grid-template-columns:repeat(auto-fill,minmax(480px,1fr));gap:1rem}"
+        "figure{margin:0}figure img{width:100%}figcaption{font-size:.85rem;color:#6c757d}"
+        ".stats{overflow-x:auto}"
+    )
+
+    @staticmethod
+    def _image_name(index, name):
+        return f"images/{index:03d}_{secure_filename(name) or 'chart'}.png"
+
+    def _html(self, title, shape, describe, charts, images, skipped, inline):
+        """The report page; images are embedded as base64 or linked to the ZIP's images/ folder."""
+        sections = {}
+        for index, (section, name, chart_title, _) in enumerate(charts):
+            if name not in images:
+                continue
+            src = (f"data:image/png;base64,{base64.b64encode(images[name]).decode('ascii')}" if inline
+                   else self._image_name(index, name))
+            sections.setdefault(section, []).append(
+                f'<figure><img src="{src}" alt="{html.escape(chart_title)}">'
+                f'<figcaption>{html.escape(chart_title)}</figcaption></figure>'
+            )
+
+        parts = [
+            f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>EDA report: {html.escape(title)}</title>",
+            f"<style>{self.STYLE}</style></head><body>",
+            f"<h1>EDA report: {html.escape(title)}</h1>",
+            f"<p>{shape[0]:,} rows &middot; {shape[1]} columns &middot; generated {time.strftime('%Y-%m-%d %H:%M')}</p>",
+            "<h2>Statistics</h2>", f'<div class="stats">{DataService.stats_table(describe)}</div>',
+        ]
+        for section, figures in sections.items():
+            parts.append(f"<h2>{section}</h2><div class=\"grid\">{''.join(figures)}</div>")
+        if skipped:
+            items = ''.join(f"<li><strong>{html.escape(n)}</strong>: {html.escape(r)}</li>" for n, r in skipped)
+            parts.append(f"<h2>Not charted</h2><ul>{items}</ul>")
+        parts.append("</body></html>")
+        return ''.join(parts)
+
+    def _zip(self, title, shape, describe, charts, images, skipped):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('report.html', self._html(title, shape, describe, charts, images, skipped, inline=False))
+            archive.writestr('statistics.csv', describe.to_csv())
+            for index, (_, name, _, _) in enumerate(charts):
+                if name in images:
+                    # PNGs are already compressed
+                    archive.writestr(self._image_name(index, name), images[name], compress_type=zipfile.ZIP_STORED)
+        return buffer.getvalue()
+
+    def submit(self, path, version, title, load, summary=None, exact_max_rows=20_000):
+        """Builds the report in the background unless it is saved already; returns the job id."""
+        job_id = self.job_id(version)
+        status = job_queue.status(job_id)
+        if status is not None and status['state'] == 'done' and not self.cached(version):
+            # Built before, but evicted since
+            job_id = f"{job_id}-{os.urandom(4).hex()}"
+        return job_queue.submit(self.build, job_id, path, version, title, load, summary, exact_max_rows,
+                                job_id=job_id)
+
+
+eda_report = EDAReport()
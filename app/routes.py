@@ -1,47 +1,335 @@
 import os
 import io
-import base64
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import google.generativeai as genai
-from flask import Blueprint, render_template, request, current_app, jsonify
+import hashlib
+import json
+import zipfile
+from flask import Blueprint, render_template, request, current_app, jsonify, send_file, url_for, Response, stream_with_context
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
-from .models import db, DatasetMetadata
+from .ai_service import AIService
+from .batch import batch_analyzer
+from .catalog import catalog
+from .charts import CHART_TYPES, ChartSpec
+from .cache import dataset_cache, plot_cache, content_hash
+from .columnar import ColumnarStore
+from .ingest import StreamingIngestor, IngestMemoryError
+from .preview import PreviewService, RowIndex
+from .quality import QualityProfiler
+from .processor import DataService, TransformationService, TransformPipeline, CorrelationService
+from .render import PlotPreparer, prepare_chart, draw_chart, PLOT_THEME
+from .jobs import job_queue
+from .metrics import metrics
+from .render_pool import render_pool, RenderBusyError, RenderTimeoutError
+from .report import eda_report
+from .sampling import Sample
+from .storage import storage
+from .uploads import chunked_uploads, UploadError
+from .warehouse import warehouse
 import traceback
 
 
-# Configuration for plots
-plt.switch_backend('Agg') 
-sns.set_theme(style="whitegrid")
-
 main_bp = Blueprint('main', __name__)
 
-# --- HELPER LOGIC: AI ANALYST ---
-def get_gemini_analysis(data_summary, context="initial upload"):
-    """Internal logic to talk to Gemini without a separate file."""
-    api_key = os.environ.get("GEMINI_API_KEY")
-    if not api_key:
-        return "AI Insights: API Key missing in Environment Variables."
-    
-    try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        prompt = f"""
-        Context: {context}
-        System: You are a professional data scientist.
-        Data Summary: {data_summary}
-        
-        Task: Provide 3-4 bullet points of high-level insights. 
-        Focus on trends, potential outliers, and a suggestion for a visualization.
-        """
-        response = model.generate_content(prompt)
-        return response.text
-    except Exception as e:
-        return f"AI Error: {str(e)}"
+# --- HELPER LOGIC: DATASET LOADING ---
+def find_pipeline(filepath):
+    """The operation log behind a transformed_ dataset (None for uploads)."""
+    return TransformPipeline.load(*os.path.split(filepath))
+
+def load_dataset(filepath, columns=None):
+    """Parsed DataFrame for an uploaded file, served from the in-process cache.
+    Reads go through the columnar sidecar and only load `columns` when given.
+    Transformed datasets are executed lazily from their operation log.
+    The result is shared between requests, so copy it before mutating."""
+    if columns:
+        columns = list(dict.fromkeys(c for c in columns if c and c != 'None'))
+    pipeline = find_pipeline(filepath)
+    if pipeline is not None:
+        with metrics.span('transform'):
+            return pipeline.execute(storage.path(pipeline.source), columns)
+    variant = tuple(columns) if columns else None
+    with metrics.span('load'):
+        return dataset_cache.get_or_load(
+            filepath, lambda path: ColumnarStore.read(path, columns=columns), variant=variant
+        )
+
+def dataset_hash(filepath):
+    """Content hash recorded at ingest, or hashed (and memoised) on demand.
+    A transformed dataset's version combines its source hash and its op log."""
+    pipeline = find_pipeline(filepath)
+    if pipeline is not None:
+        source_hash = dataset_hash(storage.path(pipeline.source))
+        return hashlib.sha256(f"{source_hash}:{pipeline.digest()}".encode('utf8')).hexdigest()
+    summary = ColumnarStore.read_summary(filepath)
+    if summary and summary.get('content_hash'):
+        return summary['content_hash']
+    return content_hash(filepath)
+
+# --- HELPER LOGIC: PLOT IMAGES ---
+PLOT_FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml', 'webp': 'image/webp'}
+
+# Encodings of /chart_data responses
+CHART_FORMATS = {'json': 'application/json', 'arrow': 'application/vnd.apache.arrow.stream'}
+
+# Auto-EDA visuals rendered by DataService rather than the chart configurator
+EDA_PLOTS = ('heatmap', 'distribution')
+
+def plot_params(source):
+    """Normalised chart parameters from request.form or request.args."""
+    y_col = source.get('y_col')
+    return {
+        'plot_type': source.get('plot_type'),
+        'x': source.get('x_col'),
+        'y': None if y_col in (None, '', 'None') else y_col,
+        'exact': source.get('exact', '').lower() in ('1', 'true', 'on'),
+        'exact_max_rows': current_app.config['PLOT_EXACT_MAX_ROWS'],
+        'fmt': source.get('fmt', 'png').lower(),
+    }
+
+def plot_url(filename, params):
+    """Image URL for a chart, pinned to the dataset's current content hash."""
+    filepath = storage.path(filename)
+    args = {'plot_type': params['plot_type'], 'fmt': params['fmt'], 'v': dataset_hash(filepath)}
+    if params['x']:
+        args['x_col'] = params['x']
+    if params['y']:
+        args['y_col'] = params['y']
+    if params['exact']:
+        args['exact'] = '1'
+    return url_for('main.plot_image', filename=filename, **args)
+
+def load_sample(filepath):
+    """
+    The stratified sample kept at ingest behind `filepath`, or None. For a
+    transformed dataset it is its source's sample with the row-level ops
+    replayed on it (None if the pipeline aggregates).
+    """
+    pipeline = find_pipeline(filepath)
+    source_path = storage.path(pipeline.source) if pipeline else filepath
+    sample = Sample.load(source_path, read=lambda path: dataset_cache.get_or_load(
+        path, ColumnarStore.read_sample, variant=('sample',)
+    ))
+    if sample is None or pipeline is None:
+        return sample
+    estimate = pipeline.approximate(sample)
+    return estimate[1] if estimate else None
+
+def wants_approximate(source):
+    return str(source.get('approximate', '')).lower() in ('1', 'true', 'on')
+
+def within_budget(job_id):
+    """Waits up to APPROX_BUDGET_MS for the job computing an exact result; True if it finished."""
+    return job_queue.wait(job_id, current_app.config['APPROX_BUDGET_MS'] / 1000)
+
+def dataset_columns(filepath):
+    """Column names from the catalog or the ingest summary (None if unknown)."""
+    if find_pipeline(filepath) is not None:
+        return None
+    entry = catalog.get(os.path.basename(filepath))
+    if entry is not None:
+        return entry['columns']
+    summary = ColumnarStore.read_summary(filepath)
+    if not summary or 'stats' not in summary:
+        return None
+    return list(summary['stats']['columns'])
+
+def numeric_columns(filepath):
+    """Numeric column names from the catalog or the ingest summary (None if unknown)."""
+    if find_pipeline(filepath) is not None:
+        return None
+    entry = catalog.get(os.path.basename(filepath))
+    if entry is not None:
+        return catalog.numeric_columns(entry)
+    summary = ColumnarStore.read_summary(filepath)
+    if not summary or 'stats' not in summary:
+        return None
+    return [col for col, st in summary['stats']['columns'].items() if st['numeric']]
+
+def dataset_comoments(filepath):
+    """Correlation co-moments for an upload or a transformed dataset."""
+    pipeline = find_pipeline(filepath)
+    if pipeline is None:
+        return CorrelationService.for_source(filepath, dataset_hash(filepath))
+    source_path = storage.path(pipeline.source)
+    return CorrelationService.for_pipeline(pipeline, source_path, dataset_hash(source_path))
+
+def render_cached_plot(filepath, params):
+    """Returns (cache_key, image bytes), rendering only on a plot-cache miss."""
+    if params['fmt'] not in PLOT_FORMATS:
+        raise ValueError(f"Unsupported image format '{params['fmt']}'.")
+    if params['plot_type'] not in CHART_TYPES and params['plot_type'] not in EDA_PLOTS:
+        raise ValueError(f"No such plot can be plotted: '{params['plot_type']}' is not supported.")
+
+    cache_key = plot_cache.key(dataset_hash(filepath), params, PLOT_THEME)
+    data = plot_cache.get(cache_key)
+    if data is not None:
+        return cache_key, data
+
+    if params['plot_type'] == 'heatmap':
+        # Drawn from the stored co-moments: no pass over the rows
+        task = DataService.heatmap_render_args(dataset_comoments(filepath))
+        if task is None:
+            raise ValueError("Not enough numeric columns for this visual.")
+        draw, args, figsize = task
+    elif params['plot_type'] in EDA_PLOTS:
+        # Only the numeric columns are read for the auto-EDA visuals
+        df = load_dataset(filepath, columns=numeric_columns(filepath))
+        with metrics.span('prepare'):
+            task = DataService.eda_render_args(df, params['plot_type'])
+        if task is None:
+            raise ValueError("Not enough numeric columns for this visual.")
+        draw, args, figsize = task
+    else:
+        df = load_dataset(filepath, columns=[params['x'], params['y']])
+        # Large frames are binned/decimated first; 'exact' asks for the raw seaborn render (within a row cap)
+        preparer = PlotPreparer(exact_max_rows=params['exact_max_rows'])
+        with metrics.span('prepare'):
+            prepared = prepare_chart(df, params['plot_type'], params['x'], params['y'],
+                                     exact=params['exact'], preparer=preparer)
+        draw, args, figsize = draw_chart, (prepared,), (10, 6)
+
+    # Drawing happens in the render pool; this thread only waits for the bytes
+    data = render_pool.render(draw, args, figsize=figsize, fmt=params['fmt'])
+    plot_cache.put(cache_key, data)
+    if find_pipeline(filepath) is None:
+        catalog.add_plot(os.path.basename(filepath), cache_key)
+    return cache_key, data
+
+def compile_chart(filepath, spec, fmt, sample=None, exact_job=None):
+    """Encoded /chart_data body for a spec over the dataset, or estimated from its `sample`."""
+    if sample is not None:
+        df = sample.data(ChartSpec.fields(spec))
+    else:
+        df = load_dataset(filepath, columns=ChartSpec.fields(spec))
+    with metrics.span('aggregate'):
+        meta, columns = ChartSpec.compile(df, spec, sample)
+        if exact_job:
+            meta['exact_job'] = exact_job
+        encode = ChartSpec.to_arrow if fmt == 'arrow' else ChartSpec.to_json
+        return encode(meta, columns)
+
+def exact_chart(filepath, spec, fmt, cache_key):
+    """Background job: the exact chart data, left in the plot cache for the next request."""
+    with storage.holding(filepath):
+        plot_cache.put(cache_key, compile_chart(filepath, spec, fmt))
+    return {'cache_key': cache_key}
+
+def approximate_chart(filepath, spec, fmt, cache_key):
+    """
+    (cache key, body) within the latency budget: the exact chart if its
+    background job finishes in time, else one estimated from the sample
+    whose meta names that job. None to answer exactly (no sample, or the
+    job finished earlier and its result has since left the cache).
+    """
+    sample = load_sample(filepath)
+    if sample is None:
+        return None
+    job_id = 'chart-' + cache_key[:32]
+
+    # Estimated before the exact job starts competing for this worker
+    approx_key = plot_cache.key(dataset_hash(filepath), {'engine': 'chart', 'spec': spec, 'fmt': fmt,
+                                                        'approximate': sample.describe()}, None)
+    approx = plot_cache.get(approx_key)
+    if approx is None:
+        approx = compile_chart(filepath, spec, fmt, sample, exact_job=job_id)
+        plot_cache.put(approx_key, approx)
+
+    job_queue.submit(exact_chart, filepath, spec, fmt, cache_key, job_id=job_id)
+    if not within_budget(job_id):
+        return approx_key, approx
+    data = plot_cache.get(cache_key)
+    return (cache_key, data) if data is not None else None
+
+def transform_result(new_df, new_filename, visuals, rows=None):
+    """The part of a /transform response computed from the result frame."""
+    analysis = DataService.analyze_dataframe(new_df, visual_url=visuals.get)
+    return {
+        "new_table": new_df.head(10).to_html(classes='table table-sm', index=False),
+        "analysis": analysis,
+        "new_rows": len(new_df) if rows is None else rows,
+        "new_cols": len(new_df.columns),
+        "all_cols": list(new_df.columns)
+    }
+
+def exact_transform(pipeline, source_path, new_filename, visuals):
+    """Background job: the exact /transform result behind an approximate one."""
+    with storage.holding(source_path):
+        with metrics.span('transform'):
+            new_df = pipeline.execute(source_path)
+        return transform_result(new_df, new_filename, visuals)
+
+def report_source(filepath):
+    """(path to pin, loader, ingest summary or None) a report job reads the dataset through."""
+    pipeline = find_pipeline(filepath)
+    if pipeline is not None:
+        source_path = storage.path(pipeline.source)
+        return source_path, lambda: pipeline.execute(source_path), None
+    return (filepath, lambda: dataset_cache.get_or_load(filepath, lambda path: ColumnarStore.read(path)),
+            ColumnarStore.read_summary(filepath))
+
+def report_urls(filename):
+    return {fmt: url_for('main.download_report', filename=filename, fmt=fmt) for fmt in eda_report.FORMATS}
+
+def eda_params(kind, exact_max_rows):
+    """The plot_params() an auto-EDA image URL resolves to."""
+    return {'plot_type': kind, 'x': None, 'y': None, 'exact': False,
+            'exact_max_rows': exact_max_rows, 'fmt': 'png'}
+
+def eda_plot_url(filename, kind):
+    return plot_url(filename, eda_params(kind, current_app.config['PLOT_EXACT_MAX_ROWS']))
+
+def eda_visual_urls(filename, numeric_count):
+    """Lazy-loaded auto-EDA image URLs for the dashboard."""
+    visuals = {'heatmap': None, 'distribution': None}
+    for kind, needed in (('heatmap', 2), ('distribution', 1)):
+        if numeric_count >= needed:
+            visuals[kind] = eda_plot_url(filename, kind)
+    return visuals
+
+def render_dashboard(entry):
+    """The dashboard page for an ingested upload, built from its catalog entry alone."""
+    filename = entry['filename']
+    stats_df = catalog.describe(entry)
+
+    # AI runs in the background; the dashboard polls /ai_insights/<job>
+    ai_job = AIService.submit(entry['stats']['summary_text'])
+
+    analysis = {
+        "columns": entry['columns'],
+        "all_cols": entry['columns'],
+        "visuals": eda_visual_urls(filename, len(catalog.numeric_columns(entry))),
+        "stats": stats_df.to_dict(),
+        "stats_table": DataService.stats_table(stats_df),
+        "null_counts": {col['name']: col['nulls'] for col in entry['schema']},
+        "plot_options": CHART_TYPES
+    }
+
+    print("--- ✅ SUCCESS: Rendering Dashboard ---")
+    return render_template(
+        'dashboard.html',
+        filename=filename,
+        ai_insights="AI is still processing...",
+        ai_job=ai_job,
+        table=entry['preview_html'],
+        analysis=analysis,
+        dataset_version=entry['content_hash'],
+        rows=entry['rows'],
+        cols=entry['cols']
+    )
 
 # --- ROUTES ---
 
+@main_bp.app_errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    limit = current_app.config['MAX_CONTENT_LENGTH'] // 2**20
+    message = f"Request is larger than {limit} MB. Large files are uploaded in chunks from the upload page."
+    if request.path == '/upload':
+        return render_template('index.html', error=message), 413
+    return jsonify({"success": False, "error": message}), 413
+
+@main_bp.errorhandler(UploadError)
+def upload_error(e):
+    return jsonify({"success": False, "error": str(e), "offset": e.offset}), e.status
+
 @main_bp.route('/')
 def index():
     return render_template('index.html')
@@ -55,173 +343,517 @@ def upload_file():
         if not file or file.filename == '':
             return render_template('index.html', error="No file selected.")
 
-        # 1. Save logic
+        # 1. Save logic: a new version is staged next to (not over) the current one
         filename = secure_filename(file.filename)
-        upload_dir = current_app.config['UPLOAD_FOLDER']
-        os.makedirs(upload_dir, exist_ok=True)
-        filepath = os.path.join(upload_dir, filename)
-        file.save(filepath)
-
-        # 2. Check size immediately (Log it so we see it in Render)
-        filesize = os.path.getsize(filepath)
-        print(f"--- 📂 File Saved: {filename} ({filesize} bytes) ---")
-
-        # 3. Pandas Read
-        df = pd.read_csv(filepath) if filename.endswith('.csv') else pd.read_excel(filepath)
-        
-        ai_insights = "AI is still processing..." 
+        staged = storage.stage(filename)
         try:
-            data_summary = df.describe().to_string()
-            # Set a 'short' timeout if possible in your ai_service
-            ai_insights = get_gemini_analysis(data_summary) 
-        except Exception as ai_err:
-            print(f"--- 🤖 AI TIMEOUT/ERROR: {ai_err} ---")
-
-        # --- THE FIX: Add 'plot_options' to the dictionary ---
-        analysis = {
-            "columns": list(df.columns),
-            "visuals": {"heatmap": None},
-            "stats": df.describe().to_dict(),
-            # Add this so the HTML finds the attribute it's looking for
-            "plot_options": {
-                "available_charts": ['bar', 'scatter', 'line', 'hist'],
-                "suggested_x": list(df.columns)[0] if len(df.columns) > 0 else None
-            }
-        }
-
-        print("--- ✅ SUCCESS: Rendering Dashboard ---")
-        return render_template(
-            'dashboard.html',
-            filename=filename,
-            ai_insights=ai_insights,
-            table=df.head(10).to_html(classes='table table-sm', index=False),
-            analysis=analysis, # This now contains plot_options
-            rows=len(df),
-            cols=len(df.columns)
-        )
-
-        print("--- ✅ SUCCESS: Rendering Dashboard ---")
-        return render_template(
-            'dashboard.html',
-            filename=filename,
-            ai_insights=ai_insights,
-            table=df.head(10).to_html(classes='table table-sm', index=False),
-            analysis=analysis,
-            rows=len(df),
-            cols=len(df.columns)
-        )
-
+            with metrics.span('receive'):
+                file.save(staged)
+
+            # 2. Check size immediately (Log it so we see it in Render)
+            filesize = os.path.getsize(staged)
+            print(f"--- 📂 File Saved: {filename} ({filesize} bytes) ---")
+
+            # 3. Stream the file into the columnar sidecar in one chunked pass.
+            # Nothing below touches the full frame: the dashboard renders from the summary.
+            ingestor = StreamingIngestor(
+                chunk_rows=current_app.config['INGEST_CHUNK_ROWS'],
+                max_rss_bytes=current_app.config['INGEST_MAX_RSS_MB'] * 1024 * 1024,
+                sample_rows=current_app.config['SAMPLE_ROWS']
+            )
+            summary = ingestor.ingest(staged)
+        except IngestMemoryError as mem_err:
+            storage.discard(staged)
+            return render_template('index.html', error=str(mem_err)), 413
+        except BaseException:
+            storage.discard(staged)
+            raise
+
+        # Readers switch to the new version atomically; the old one goes once they are done
+        filepath = storage.publish(staged)
+
+        # Bulk-load into the SQL warehouse (if enabled) while the user looks around
+        warehouse.submit_load(ColumnarStore.sidecar_path(filepath), summary['content_hash'])
+        chunked_uploads.remember(filename, summary['content_hash'])
+        QualityProfiler.submit(filepath, summary['content_hash'])
+
+        # Everything the dashboard shows from now on comes from the catalog
+        return render_dashboard(catalog.record(filepath, summary))
+
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
         print("--- ❌ CRITICAL ERROR ---")
         print(traceback.format_exc())
         return f"System Crash: {str(e)}", 500
 
+@main_bp.route('/dashboard/<path:filename>')
+def dashboard(filename):
+    """Dashboard for an upload that is already ingested, served from the catalog."""
+    filename = secure_filename(filename)
+    entry = catalog.get(filename)
+    if entry is None:
+        # Uploads ingested before the catalog existed are added on first view
+        filepath = storage.path(filename)
+        summary = ColumnarStore.read_summary(filepath) if os.path.exists(filepath) else None
+        if summary is None:
+            return render_template('index.html', error=f"'{filename}' has not been uploaded."), 404
+        entry = catalog.record(filepath, summary)
+    return render_dashboard(entry)
+
+@main_bp.route('/datasets')
+def list_datasets():
+    """Catalog listing, newest first: ?q= matches file and column names; ?limit= and ?offset= page."""
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except ValueError:
+        return jsonify({"success": False, "error": "limit and offset must be integers."}), 400
+    total, datasets = catalog.search(request.args.get('q', ''), limit=limit, offset=offset)
+    for entry in datasets:
+        entry['dashboard_url'] = url_for('main.dashboard', filename=entry['filename'])
+    return jsonify({"total": total, "offset": offset, "limit": limit, "datasets": datasets})
+
+@main_bp.route('/datasets/<path:filename>')
+def dataset_entry(filename):
+    """Full catalog entry: schema, statistics and artifact pointers."""
+    entry = catalog.get(secure_filename(filename))
+    if entry is None:
+        return jsonify({"success": False, "error": "Unknown dataset."}), 404
+    return jsonify(entry)
+
+@main_bp.route('/check_nulls', methods=['POST'])
+def check_nulls():
+    """
+    Data-quality report for the cleaning panel (see QualityProfiler).
+    Uploads are profiled in the background after ingest; until that is
+    done the catalog's null counts are returned with state 'running'
+    (or 'failed' with the job's error, which is not retried until the
+    dataset changes). Transformed datasets are profiled on request.
+    """
+    filename = secure_filename(request.form.get('filename', ''))
+    filepath = storage.path(filename)
+    is_upload = find_pipeline(filepath) is None
+    if is_upload and not os.path.exists(filepath):
+        return jsonify({"success": False, "error": "Unknown dataset.", "null_report": {}}), 404
+
+    version = dataset_hash(filepath)
+    report = QualityProfiler.cached(filepath, version)
+    if report is None and is_upload:
+        entry = catalog.get(filename)
+        null_report = catalog.null_report(entry) if entry else {}
+        job = job_queue.status(QualityProfiler.job_id(filepath, version))
+        if job and job['state'] == 'failed':
+            return jsonify({"success": True, "state": "failed", "error": job['error'],
+                            "quality": None, "null_report": null_report})
+        QualityProfiler.submit(filepath, version)
+        return jsonify({"success": True, "state": "running", "quality": None,
+                        "null_report": null_report})
+    if report is None:
+        report = QualityProfiler.profile_frame(load_dataset(filepath), filepath, version)
+    return jsonify({"success": True, "state": "done", "quality": report, "null_report": report['null_report']})
+
+@main_bp.route('/uploads', methods=['POST'])
+def start_upload():
+    """
+    Opens a resumable upload: {"filename", "size"} in, the session status out.
+    The client then PATCHes /uploads/<id> with raw chunks (Upload-Offset
+    header) and polls GET /uploads/<id> until the state is 'done'.
+    """
+    data = request.get_json(silent=True) or {}
+    status = chunked_uploads.start(data.get('filename'), data.get('size'))
+    return jsonify(status), 201
+
+@main_bp.route('/uploads/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    """Offset to resume from, and once processed the dashboard to open."""
+    status = chunked_uploads.status(upload_id)
+    if status['state'] == 'done':
+        status['dashboard_url'] = url_for('main.dashboard', filename=status['result']['filename'])
+    return jsonify(status)
+
+@main_bp.route('/uploads/<upload_id>', methods=['PATCH'])
+def upload_chunk(upload_id):
+    """Appends the raw request body at the Upload-Offset header's position."""
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+    except ValueError:
+        raise UploadError("The Upload-Offset header is required.")
+    return jsonify(chunked_uploads.write_chunk(upload_id, offset, request.stream))
+
+@main_bp.route('/uploads/<upload_id>', methods=['DELETE'])
+def cancel_upload(upload_id):
+    chunked_uploads.abort(upload_id)
+    return jsonify({"success": True})
+
+@main_bp.route('/batch_upload', methods=['POST'])
+def batch_upload():
+    """
+    Accepts several CSV/Excel files and/or ZIP archives of them. Each file is
+    ingested, profiled and gets its auto-EDA images in a worker process;
+    poll /batch_status/<job_id> for progress and the comparison.
+    """
+    try:
+        # Each file is staged as a new version and published once it is analyzed
+        paths = batch_analyzer.save_uploads(request.files.getlist('files'), storage.stage, storage.discard)
+    except (ValueError, zipfile.BadZipFile) as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    if not paths:
+        return jsonify({"success": False, "error": "No CSV or Excel files found in the upload."}), 400
+
+    exact_max_rows = current_app.config['PLOT_EXACT_MAX_ROWS']
+
+    def seed_caches(path, summary, images):
+        path = storage.publish(path)
+        # Images rendered by the workers land under the keys the dashboard URLs use
+        for kind, data in images.items():
+            plot_cache.put(plot_cache.key(summary['content_hash'], eda_params(kind, exact_max_rows), PLOT_THEME), data)
+        warehouse.submit_load(ColumnarStore.sidecar_path(path), summary['content_hash'])
+        catalog.record(path, summary)
+        QualityProfiler.submit(path, summary['content_hash'])
+
+    job_id = batch_analyzer.submit(
+        paths,
+        chunk_rows=current_app.config['INGEST_CHUNK_ROWS'],
+        max_rss_bytes=current_app.config['INGEST_MAX_RSS_MB'] * 1024 * 1024,
+        sample_rows=current_app.config['SAMPLE_ROWS'],
+        on_file=seed_caches,
+        on_error=storage.discard
+    )
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "files": [os.path.basename(p) for p in paths],
+        "view_url": url_for('main.batch_view', job_id=job_id)
+    })
+
+@main_bp.route('/batch/<job_id>')
+def batch_view(job_id):
+    return render_template('batch.html', job_id=job_id)
+
+@main_bp.route('/batch_status/<job_id>')
+def batch_status(job_id):
+    """Progress of a batch job; its result holds the comparison once done."""
+    status = job_queue.status(job_id)
+    if status is None:
+        return jsonify({"state": "missing"}), 404
+    return jsonify(status)
+
+@main_bp.route('/report/<path:filename>', methods=['POST'])
+def start_report(filename):
+    """
+    Full auto-EDA report of a dataset (see EDAReport): returns its download
+    URLs if this version was reported before, else the job to poll on
+    /report_status/<job_id>.
+    """
+    filename = secure_filename(filename)
+    try:
+        filepath = storage.path(filename)
+        if find_pipeline(filepath) is None and not os.path.exists(filepath):
+            return jsonify({"success": False, "error": "Dataset not found."}), 404
+        version = dataset_hash(filepath)
+        if eda_report.cached(version):
+            return jsonify({"success": True, "state": "done", "urls": report_urls(filename)})
+        path, loader, summary = report_source(filepath)
+        job_id = eda_report.submit(path, version, filename, loader, summary,
+                                   exact_max_rows=current_app.config['PLOT_EXACT_MAX_ROWS'])
+        return jsonify({"success": True, "state": "queued", "job_id": job_id, "urls": report_urls(filename)})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+@main_bp.route('/report_status/<job_id>')
+def report_status(job_id):
+    """Progress of a report job; its result lists the charts that were left out."""
+    status = job_queue.status(job_id)
+    if status is None:
+        return jsonify({"state": "missing"}), 404
+    return jsonify(status)
+
+@main_bp.route('/report/<path:filename>')
+def download_report(filename):
+    """The saved report of the dataset's current version: ?fmt=html (self-contained page) or zip."""
+    filename = secure_filename(filename)
+    fmt = request.args.get('fmt', 'html').lower()
+    if fmt not in eda_report.FORMATS:
+        return jsonify({"success": False, "error": f"Unsupported report format '{fmt}'."}), 400
+    try:
+        version = dataset_hash(storage.path(filename))
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 404
+    path = eda_report.cached(version, fmt)
+    if path is None:
+        return jsonify({"success": False, "error": "No report for this version yet; start one first."}), 404
+    download_name = f"{os.path.splitext(filename)[0]}_report.{fmt}"
+    return send_file(path, mimetype=eda_report.FORMATS[fmt], etag=version, conditional=True,
+                     as_attachment=fmt == 'zip', download_name=download_name)
+
+@main_bp.route('/exact_status/<job_id>')
+def exact_status(job_id):
+    """Polled after an approximate answer until its exact result ('exact_job') is ready."""
+    status = job_queue.status(job_id)
+    if status is None:
+        return jsonify({"state": "missing"}), 404
+    return jsonify(status)
+
 @main_bp.route('/transform', methods=['POST'])
 def transform_data():
-    """Handles the 'Group By' and 'Filter' logic directly."""
-    filename = request.form.get('filename')
+    """
+    Appends one operation (filter, dropna, fillna, drop_col, groupby, agg) to
+    the dataset's lazy pipeline. No transformed file is written: the result
+    is computed from the source on demand and cached.
+    With approximate=1 a result not ready within APPROX_BUDGET_MS is first
+    answered from the source's sample; the response then carries
+    'approximate' (the sample) and 'exact_job' to poll for the exact result.
+    """
+    filename = secure_filename(request.form.get('filename', ''))
     action = request.form.get('action')
-    
-    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-    
-    try:
-        df = pd.read_csv(filepath) if filename.endswith('.csv') else pd.read_excel(filepath)
-        
-        # --- TRANSFORMATION LOGIC ---
-        new_df = df.copy() # Protect original data
-        
-        if action == 'groupby':
-            group_col = request.form.get('group_col')
-            agg_col = request.form.get('agg_col')
-            agg_func = request.form.get('agg_func', 'mean').lower()
-            
-            if group_col and agg_col:
-                new_df = new_df.groupby(group_col)[agg_col].agg(agg_func).reset_index()
-            else:
-                return jsonify({"success": False, "error": "Missing columns for aggregation."})
-
-        elif action == 'drop_na':
-            new_df = new_df.dropna()
+    upload_dir = current_app.config['UPLOAD_FOLDER']
 
-        # Save the result
-        new_filename = f"transformed_{filename}"
-        new_path = os.path.join(current_app.config['UPLOAD_FOLDER'], new_filename)
-        new_df.to_csv(new_path, index=False) if new_filename.endswith('.csv') else new_df.to_excel(new_path, index=False)
-
-        # Re-run AI for the new data shape
-        ai_update = get_gemini_analysis(new_df.head(20).to_string(), context=f"Analysis after {action} operation")
+    try:
+        filepath = storage.path(filename)
+        op = TransformationService.op_from_request(action, request.form)
+
+        # Chained transforms extend the same log rather than re-parsing a copy
+        pipeline = (find_pipeline(filepath) or TransformPipeline(filename)).then(op)
+        new_filename = f"transformed_{pipeline.source}"
+        new_path = os.path.join(upload_dir, new_filename)
+
+        source_path = storage.path(pipeline.source)
+
+        # Approximate mode: replay the log on the sample unless the result is cached
+        estimate = None
+        if wants_approximate(request.form) and dataset_cache.peek(source_path, ('pipeline', pipeline.digest(), None)) is None:
+            sample = load_sample(source_path)
+            estimate = sample and pipeline.approximate(sample)
+
+        if estimate:
+            pipeline.save(upload_dir, new_filename)
+            catalog.set_transform(pipeline.source, new_filename, pipeline.ops)
+            visuals = {kind: eda_plot_url(new_filename, kind) for kind in EDA_PLOTS}
+            job_id = 'transform-' + dataset_hash(new_path)[:32]
+            new_df, rows = estimate
+            new_rows, rows_ci = rows.estimated_rows() if rows is not None else (len(new_df), 0.0)
+            result = transform_result(new_df, new_filename, visuals, rows=new_rows)
+            result["approximate"] = {**sample.describe(), "new_rows_ci": rows_ci}
+            result["exact_job"] = job_id
+
+            job_queue.submit(exact_transform, pipeline, source_path, new_filename, visuals, job_id=job_id)
+            status = job_queue.status(job_id) if within_budget(job_id) else None
+            if status and status['state'] == 'done':
+                result = status['result']
+        else:
+            # The preview needs the rows, so this is where the plan actually runs
+            with metrics.span('transform'):
+                new_df = pipeline.execute(source_path)
+            pipeline.save(upload_dir, new_filename)
+            catalog.set_transform(pipeline.source, new_filename, pipeline.ops)
+            result = transform_result(new_df, new_filename, {kind: eda_plot_url(new_filename, kind) for kind in EDA_PLOTS})
+
+        # Re-run AI for the new data shape (in the background)
+        ai_job = AIService.submit(new_df.head(20).to_string(), context=f"Analysis after {action} operation")
 
         return jsonify({
             "success": True,
-            "new_table": new_df.head(10).to_html(classes='table table-sm', index=False),
             "new_filename": new_filename,
-            "ai_insights": ai_update,
-            "new_rows": len(new_df),
-            "new_cols": len(new_df.columns),
-            "all_cols": list(new_df.columns)
+            "dataset_version": dataset_hash(new_path),
+            "ai_job": ai_job,
+            "operations": pipeline.ops,
+            **result
         })
 
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
+@main_bp.route('/preview/<path:filename>')
+def preview_rows(filename):
+    """
+    One page of rows as JSON for the virtualized table.
+    Query args: offset, limit (max 500), sort ('col' or '-col') and
+    columns (comma-separated subset).
+    """
+    try:
+        filepath = storage.path(secure_filename(filename))
+        is_upload = find_pipeline(filepath) is None
+        if is_upload and not os.path.exists(filepath):
+            return jsonify({"success": False, "error": "Dataset not found."}), 404
+        columns = [c for c in request.args.get('columns', '').split(',') if c]
+        page = PreviewService.page(
+            filepath, dataset_hash(filepath),
+            load=lambda cols: load_dataset(filepath, columns=cols),
+            offset=request.args.get('offset', 0),
+            limit=request.args.get('limit', 100),
+            sort=request.args.get('sort'),
+            columns=columns,
+            summary=ColumnarStore.read_summary(filepath) if is_upload else None,
+        )
+        return jsonify({"success": True, **page})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+@main_bp.route('/correlations/<path:filename>')
+def correlations(filename):
+    """
+    Top-k correlated column pairs (?top=20), plus the full matrix when the
+    data is narrow enough for the heatmap.
+    """
+    try:
+        filepath = storage.path(secure_filename(filename))
+        comoments = dataset_comoments(filepath)
+        top = min(max(request.args.get('top', DataService.TOP_PAIRS, type=int), 1), 500)
+        result = {
+            "success": True,
+            "columns": comoments.columns,
+            "top_pairs": [{"x": x, "y": y, "r": r, "rows": n} for x, y, r, n in comoments.top_pairs(top)],
+            "matrix": None,
+        }
+        if len(comoments.columns) <= DataService.HEATMAP_MAX_COLUMNS:
+            corr = comoments.correlation().round(4)
+            result["matrix"] = json.loads(corr.to_json(orient='split'))
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+@main_bp.route('/export/<path:filename>')
+def export_dataset(filename):
+    """Streams a dataset (uploaded or transformed) as CSV, chunk by chunk."""
+    filename = secure_filename(filename)
+    filepath = storage.path(filename)
+    if find_pipeline(filepath) is None and not os.path.exists(filepath):
+        return jsonify({"success": False, "error": "Dataset not found."}), 404
+    df = load_dataset(filepath)
+
+    def generate(chunk_rows=50_000):
+        for start in range(0, max(len(df), 1), chunk_rows):
+            yield df.iloc[start:start + chunk_rows].to_csv(index=False, header=start == 0)
+
+    download_name = os.path.splitext(filename)[0] + '.csv'
+    return Response(stream_with_context(generate()), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename="{download_name}"'})
+
 @main_bp.route('/generate_plot', methods=['POST'])
 def generate_plot():
-    """Handles the Matplotlib/Seaborn logic directly."""
+    """Renders (or finds in the cache) a chart and returns the URL of its image."""
     filename = request.form.get('filename')
-    plot_type = request.form.get('plot_type')
-    x_col = request.form.get('x_col')
-    y_col = request.form.get('y_col')
 
-    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-    
     try:
-        df = pd.read_csv(filepath) if filename.endswith('.csv') else pd.read_excel(filepath)
-        
-        # --- PLOTTING LOGIC ---
-        plt.figure(figsize=(10, 6))
-        
-        if plot_type == 'bar':
-            sns.barplot(data=df, x=x_col, y=y_col)
-        elif plot_type == 'scatter':
-            sns.scatterplot(data=df, x=x_col, y=y_col)
-        elif plot_type == 'line':
-            sns.lineplot(data=df, x=x_col, y=y_col)
-        elif plot_type == 'hist':
-            sns.histplot(data=df, x=x_col, kde=True)
-
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-
-        # Convert plot to Base64 String
-        img = io.BytesIO()
-        plt.savefig(img, format='png')
-        img.seek(0)
-        plot_url = base64.b64encode(img.getvalue()).decode('utf8')
-        plt.close()
-
-        return jsonify({"success": True, "plot_data": f"data:image/png;base64,{plot_url}"})
+        filepath = storage.path(secure_filename(filename))
+        params = plot_params(request.form)
+        render_cached_plot(filepath, params)
+        return jsonify({"success": True, "plot_url": plot_url(filename, params)})
 
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
+@main_bp.route('/plot/<path:filename>')
+def plot_image(filename):
+    """
+    Serves a chart as raw image bytes (png, svg or webp) instead of base64 JSON.
+    The response carries an ETag for conditional GETs; URLs that pin the
+    current dataset version with ?v=<hash> are cacheable as immutable.
+    """
+    try:
+        filepath = storage.path(secure_filename(filename))
+        params = plot_params(request.args)
+        cache_key, data = render_cached_plot(filepath, params)
+    except RenderBusyError as e:
+        return jsonify({"success": False, "error": str(e)}), 503
+    except RenderTimeoutError as e:
+        return jsonify({"success": False, "error": str(e)}), 504
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    response = send_file(
+        io.BytesIO(data), mimetype=PLOT_FORMATS[params['fmt']], etag=cache_key, conditional=True
+    )
+    if request.args.get('v') == dataset_hash(filepath):
+        response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    else:
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@main_bp.route('/chart_data', methods=['POST'])
+def chart_data():
+    """
+    Compiles a declarative chart spec (see ChartSpec) against a dataset and
+    returns the aggregated data for the browser to draw: columnar JSON, or an
+    Arrow IPC stream with "format": "arrow". Results share the plot cache.
+    With "approximate": true a chart not ready within APPROX_BUDGET_MS is
+    estimated from the dataset's sample instead; meta.approximate then
+    describes the sample and meta.exact_job is the job to poll.
+    """
+    body = request.get_json(silent=True) or {}
+    filename = secure_filename(body.get('filename') or '')
+    fmt = body.get('format', 'json')
+    try:
+        filepath = storage.path(filename)
+        if fmt not in CHART_FORMATS:
+            raise ValueError(f"Unsupported data format '{fmt}'.")
+        spec = ChartSpec.normalize(body.get('spec'), dataset_columns(filepath))
+        cache_key = plot_cache.key(dataset_hash(filepath), {'engine': 'chart', 'spec': spec, 'fmt': fmt}, None)
+        data = plot_cache.get(cache_key)
+        if data is None and wants_approximate(body):
+            # Estimated from the sample unless the exact data is ready within the budget
+            cache_key, data = approximate_chart(filepath, spec, fmt, cache_key) or (cache_key, None)
+        if data is None:
+            data = compile_chart(filepath, spec, fmt)
+            plot_cache.put(cache_key, data)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    response = send_file(io.BytesIO(data), mimetype=CHART_FORMATS[fmt], etag=cache_key)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 @main_bp.route('/delete_dataset', methods=['POST'])
 def delete_dataset():
-    filename = request.form.get('filename')
+    filename = secure_filename(request.form.get('filename', ''))
     try:
-        # File deletion logic
-        path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+        # File deletion logic: the source upload and its transformation log
+        upload_dir = current_app.config['UPLOAD_FOLDER']
+        pipeline = find_pipeline(os.path.join(upload_dir, filename))
+        if pipeline is not None:
+            # A transformed dataset is only its op log: the source upload stays
+            QualityProfiler.remove(os.path.join(upload_dir, filename))
+            TransformPipeline.remove(upload_dir, filename)
+            catalog.remove_transform(pipeline.source, filename)
+            return jsonify({"success": True})
+
+        path = storage.path(filename)
+        dataset_cache.invalidate(path)
         if os.path.exists(path):
-            os.remove(path)
+            warehouse.drop(dataset_hash(path))
+        # Requests still reading a version keep it until they finish
+        storage.delete(filename)
+        QualityProfiler.remove(os.path.join(upload_dir, f"transformed_{filename}"))
+        TransformPipeline.remove(upload_dir, f"transformed_{filename}")
+
+        # Uploads from before the versioned layout sit directly in the folder
+        legacy = os.path.join(upload_dir, filename)
+        ColumnarStore.remove(legacy)
+        RowIndex.remove(legacy)
+        QualityProfiler.remove(legacy)
+        if os.path.exists(legacy):
+            os.remove(legacy)
             
-        # DB deletion logic
-        DatasetMetadata.query.filter_by(filename=filename.replace('transformed_', '')).delete()
-        db.session.commit()
+        # Catalog entry (its transforms and plots go with it)
+        catalog.remove(filename)
         
         return jsonify({"success": True})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
-
-
-
-
+@main_bp.route('/cache_stats')
+def cache_stats():
+    """Hit/miss/eviction counters for sizing DATASET_CACHE_MB and the plot cache, plus warehouse usage."""
+    return jsonify({"datasets": dataset_cache.stats(), "plots": plot_cache.stats(), "warehouse": warehouse.stats(),
+                    "storage": storage.stats()})
+
+@main_bp.route('/metrics')
+def prometheus_metrics():
+    """Phase and request histograms in the Prometheus text format, summed over all workers."""
+    return Response(metrics.prometheus(), mimetype='text/plain; version=0.0.4')
+
+@main_bp.route('/ai_insights/<job_id>')
+def ai_insights(job_id):
+    """Polled by the dashboard until the background AI job is done."""
+    return jsonify(AIService.status(job_id))
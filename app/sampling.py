@@ -0,0 +1,265 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+
+from .columnar import ColumnarStore
+from .utils import atomic_path
+
+
+STRATUM = '__stratum'
+WEIGHT = '__weight'
+_PRIORITY = '__priority'
+
+
+class StratifiedReservoir:
+    """
+    A stratified reservoir sample gathered in the same pass as ingestion.
+    Rows are split into strata by one low-cardinality text column, picked
+    from the first chunk, so rare categories keep rows of their own. Each
+    stratum keeps the `cap` rows with the smallest random priority seen so
+    far: a uniform sample without replacement of that stratum however many
+    chunks follow. Only rows that beat their stratum's cut-off are copied,
+    so once the reservoir is full a chunk costs one draw per row; those
+    candidates are merged in batches, and a cut-off that lags behind a
+    batch only lets in rows the next merge drops again.
+    """
+    SAMPLE_ROWS = 100_000
+    MAX_STRATA = 50
+    MIN_STRATUM_ROWS = 500
+    ALL = '__all__'
+    OTHER = '__other__'
+    MISSING = '__null__'
+
+    def __init__(self, sample_rows=SAMPLE_ROWS, seed=0):
+        self.sample_rows = sample_rows
+        self.rng = np.random.default_rng(seed)
+        self.column = None
+        self.cap = None
+        self.labels = {}  # stratum label -> code
+        self.population = np.zeros(0, dtype=np.int64)
+        self.cutoff = np.zeros(0)
+        self.kept = None
+        self._pending, self._pending_rows = [], 0
+
+    # --- 1. Strata ---
+    def _pick_column(self, chunk):
+        """The text/boolean column with the most distinct values that still fits MAX_STRATA."""
+        best, best_distinct = None, 1
+        for col in chunk.columns:
+            series = chunk[col]
+            if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+                continue
+            distinct = series.nunique(dropna=True)
+            if best_distinct < distinct <= self.MAX_STRATA:
+                best, best_distinct = col, distinct
+        return best
+
+    def _code(self, label):
+        if label not in self.labels:
+            self.labels[label] = len(self.labels)
+            self.population = np.append(self.population, 0)
+            self.cutoff = np.append(self.cutoff, np.inf)
+        return self.labels[label]
+
+    def _codes(self, chunk):
+        if self.column is None:
+            return np.full(len(chunk), self._code(self.ALL), dtype=np.int64)
+        index, uniques = pd.factorize(chunk[self.column])
+        labels = [str(u) for u in uniques] + ([self.MISSING] if (index < 0).any() else [])
+        lookup = np.zeros(len(uniques) + 1, dtype=np.int64)
+        for i, label in enumerate(labels):
+            # Values first seen after MAX_STRATA share one overflow stratum
+            if label not in self.labels and len(self.labels) >= self.MAX_STRATA:
+                label = self.OTHER
+            lookup[i] = self._code(label)
+        return lookup[index]  # -1 (missing) picks the trailing MISSING code
+
+    # --- 2. Sampling ---
+    def update(self, chunk):
+        if len(chunk) == 0:
+            return self
+        if self.cap is None:
+            self.column = self._pick_column(chunk)
+            strata = chunk[self.column].nunique(dropna=False) if self.column else 1
+            self.cap = max(self.MIN_STRATUM_ROWS, self.sample_rows // strata)
+
+        codes = self._codes(chunk)
+        self.population += np.bincount(codes, minlength=len(self.labels))
+        priority = self.rng.random(len(chunk))
+        take = priority < self.cutoff[codes]
+        if not take.any():
+            return self
+
+        self._pending.append(chunk[take].assign(**{_PRIORITY: priority[take], STRATUM: codes[take]}))
+        self._pending_rows += int(take.sum())
+        if self._pending_rows >= self.sample_rows:
+            self._merge()
+        return self
+
+    def _merge(self):
+        """Keeps the `cap` smallest priorities per stratum of the sample plus the pending candidates."""
+        if not self._pending:
+            return
+        pool = pd.concat(([self.kept] if self.kept is not None else []) + self._pending, ignore_index=True)
+        self._pending, self._pending_rows = [], 0
+        strata, priority = pool[STRATUM].to_numpy(), pool[_PRIORITY].to_numpy()
+        order = np.lexsort((priority, strata))
+        rank = np.arange(len(order)) - np.searchsorted(strata[order], strata[order], side='left')
+        self.kept = pool.take(order[rank < self.cap]).reset_index(drop=True)
+
+        # A full stratum only admits rows with a smaller priority than its largest kept one
+        last = order[rank == self.cap - 1]
+        self.cutoff[strata[last]] = priority[last]
+
+    # --- 3. Output ---
+    def save(self, filepath):
+        """
+        Writes the sample next to the sidecar of `filepath` and returns its
+        description for the ingest summary: None when every row fits in the
+        sample anyway, as the data itself is then as fast to scan.
+        """
+        self._merge()
+        rows = int(self.population.sum())
+        if self.kept is None or len(self.kept) >= rows:
+            return None
+        frame = self.kept.drop(columns=_PRIORITY)
+        sizes = np.bincount(frame[STRATUM], minlength=len(self.labels))
+        # Each sampled row stands for N_h / n_h rows of its stratum
+        frame[WEIGHT] = (self.population / np.maximum(sizes, 1))[frame[STRATUM].to_numpy()]
+
+        path = ColumnarStore.sample_path(filepath)
+        with atomic_path(path) as tmp_path:
+            feather.write_feather(ColumnarStore._to_arrow(frame), tmp_path, compression='uncompressed')
+        labels = sorted(self.labels, key=self.labels.get)
+        return {'column': self.column, 'rows': len(frame), 'strata': labels,
+                'population': self.population.tolist(), 'sizes': sizes.tolist()}
+
+
+class Sample:
+    """
+    A stratified sample loaded for estimation: the sampled rows with their
+    stratum code and weight, plus the per-stratum sizes the estimators need.
+    Row-level ops (filters, fills) may run on `frame` directly; pass the
+    result to replace() and the estimates cover the surviving rows.
+    """
+    CONFIDENCE = 0.95
+    Z = 1.96
+    # Aggregates with a design-based confidence interval
+    ESTIMATED = ('count', 'sum', 'mean')
+
+    def __init__(self, frame, info):
+        self.frame = frame
+        self.info = info
+        self.sizes = np.asarray(info['sizes'], dtype=np.float64)
+
+    @classmethod
+    def load(cls, filepath, read=None):
+        """The sample kept at ingest for `filepath`, or None. `read(path)` loads its rows."""
+        summary = ColumnarStore.read_summary(filepath)
+        info = summary and summary.get('sample')
+        if not info or not os.path.exists(ColumnarStore.sample_path(filepath)):
+            return None
+        return cls((read or ColumnarStore.read_sample)(filepath), info)
+
+    @property
+    def rows(self):
+        """Rows of the full dataset."""
+        return int(sum(self.info['population']))
+
+    @property
+    def weights(self):
+        return self.frame[WEIGHT].to_numpy()
+
+    def replace(self, frame):
+        return Sample(frame, self.info)
+
+    def data(self, columns=None):
+        """The sampled rows without the stratum and weight columns."""
+        if columns:
+            return self.frame[list(columns)]
+        return self.frame.drop(columns=[STRATUM, WEIGHT])
+
+    def describe(self):
+        return {'sample_rows': len(self.frame), 'rows': self.rows,
+                'stratified_by': self.info['column'], 'confidence': self.CONFIDENCE}
+
+    # --- 1. Estimators ---
+    def estimate(self, keys, values, aggregate):
+        """
+        Population estimates of `aggregate` per key. `keys` are int codes
+        (-1 = excluded) and `values` floats (NaN = missing), one per row of
+        `frame`. Returns a frame indexed by key with 'y', 'ci' (half-width
+        of the 95% interval, NaN where there is none), 'count' (estimated
+        non-null rows) and the sampled 'min' and 'max'.
+
+        count and sum are Horvitz-Thompson totals and mean is their ratio.
+        Their variance is the stratified one, the sum over strata of
+        N_h^2 (1 - n_h/N_h) s_h^2 / n_h, where s_h^2 runs over all n_h
+        sampled rows of the stratum (rows outside the key count as zero),
+        linearized for the ratio. The other aggregates are weighted sample
+        statistics without a bound.
+        """
+        valid = (keys >= 0) & ~np.isnan(values)
+        frame = pd.DataFrame({
+            'key': keys[valid], 'h': self.frame[STRATUM].to_numpy()[valid],
+            'w': self.weights[valid],
+            'y': np.ones(valid.sum()) if aggregate == 'count' else values[valid],
+        })
+        grouped = frame.groupby('key', sort=True)
+        result = grouped['y'].agg(['min', 'max'])
+        result['count'] = grouped['w'].sum()
+        if aggregate in self.ESTIMATED:
+            result['y'], variance = self._total(frame, aggregate, result['count'])
+            result['ci'] = self.Z * np.sqrt(variance)
+        else:
+            result['y'] = self._statistic(frame, grouped, aggregate)
+            result['ci'] = np.nan
+        return result
+
+    def _total(self, frame, aggregate, count):
+        cells = frame.assign(y2=frame['y'] ** 2).groupby(['key', 'h'], sort=True).agg(
+            c=('y', 'size'), s1=('y', 'sum'), s2=('y2', 'sum'), w=('w', 'first')
+        )
+        key = cells.index.get_level_values('key')
+        n = self.sizes[cells.index.get_level_values('h').to_numpy()]
+        w, c = cells['w'].to_numpy(), cells['c'].to_numpy()
+        s1, s2 = cells['s1'].to_numpy(), cells['s2'].to_numpy()
+        total = pd.Series(w * s1, index=key).groupby(level=0).sum()
+
+        estimate = total
+        if aggregate == 'mean':
+            estimate = total / count
+            # Linearized: z = y - R for the key's rows, 0 elsewhere
+            ratio = estimate.reindex(key).to_numpy()
+            s1, s2 = s1 - ratio * c, s2 - 2 * ratio * s1 + ratio ** 2 * c
+        spread = np.clip((s2 - s1 ** 2 / n) / np.maximum(n - 1, 1), 0, None)
+        variance = pd.Series(w * w * n * (1 - 1 / w) * spread, index=key).groupby(level=0).sum()
+        if aggregate == 'mean':
+            variance = variance / count ** 2
+        return estimate, variance
+
+    @staticmethod
+    def _statistic(frame, grouped, aggregate):
+        if aggregate in ('min', 'max', 'nunique'):
+            return grouped['y'].agg(aggregate)
+        weight = grouped['w'].sum()
+        if aggregate == 'std':
+            mean = (frame['w'] * frame['y']).groupby(frame['key']).sum() / weight
+            square = (frame['w'] * frame['y'] ** 2).groupby(frame['key']).sum() / weight
+            return np.sqrt(np.clip(square - mean ** 2, 0, None) * weight / (weight - 1))
+        if aggregate == 'median':
+            # Weighted median: the first value whose cumulative weight reaches half
+            ordered = frame.sort_values(['key', 'y'], kind='stable')
+            reached = ordered.groupby('key')['w'].cumsum() >= weight.reindex(ordered['key']).to_numpy() / 2
+            return ordered[reached.to_numpy()].groupby('key')['y'].first()
+        raise ValueError(f"Unsupported aggregation '{aggregate}'.")
+
+    def estimated_rows(self):
+        """(rows, 95% half-width) of the full data that `frame`'s rows stand for."""
+        keys = np.zeros(len(self.frame), dtype=np.int64)
+        result = self.estimate(keys, np.ones(len(self.frame)), 'count')
+        if result.empty:
+            return 0, 0.0
+        return int(round(result['y'].iloc[0])), float(result['ci'].iloc[0])
@@ -0,0 +1,406 @@
+import base64
+
+import numpy as np
+import pandas as pd
+
+from .utils import atomic_path
+
+
+def hash_values(series):
+    """Stable 64-bit hashes for a Series (vectorized, NaNs excluded by caller)."""
+    return pd.util.hash_pandas_object(series, index=False).to_numpy(dtype=np.uint64)
+
+
+def _bit_length(x):
+    """Vectorized int.bit_length() for uint64 arrays, exact for every value."""
+    hi = (x >> np.uint64(32)).astype(np.float64)
+    lo = (x & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    bl_hi = np.frexp(hi)[1]
+    bl_lo = np.frexp(lo)[1]
+    return np.where(hi > 0, 32 + bl_hi, bl_lo)
+
+
+class HyperLogLog:
+    """Approximate distinct counter (about 1.6% error at p=12)."""
+
+    def __init__(self, p=12, registers=None):
+        self.p = p
+        self.registers = registers if registers is not None else np.zeros(1 << p, dtype=np.uint8)
+
+    def update_hashes(self, hashes):
+        if len(hashes) == 0:
+            return
+        tail_bits = 64 - self.p
+        idx = (hashes >> np.uint64(tail_bits)).astype(np.int64)
+        tail = hashes & np.uint64((1 << tail_bits) - 1)
+        rank = (tail_bits - _bit_length(tail) + 1).astype(np.uint8)
+        np.maximum.at(self.registers, idx, rank)
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            return int(round(m * np.log(m / zeros)))  # linear counting for small sets
+        return int(round(raw))
+
+    def to_dict(self):
+        return {'p': self.p, 'registers': base64.b64encode(self.registers.tobytes()).decode('ascii')}
+
+    @classmethod
+    def from_dict(cls, d):
+        registers = np.frombuffer(base64.b64decode(d['registers']), dtype=np.uint8).copy()
+        return cls(d['p'], registers)
+
+
+class KLLSketch:
+    """
+    Mergeable quantile sketch (KLL compactor hierarchy).
+    Level h holds items of weight 2**h; a full level is sorted and every
+    other item is promoted, so memory stays O(k log n).
+    """
+
+    def __init__(self, k=200, levels=None):
+        self.k = k
+        self.levels = levels if levels is not None else [np.empty(0)]
+
+    def _capacity(self, h):
+        depth = len(self.levels) - h - 1
+        return max(int(np.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def _compress(self):
+        h = 0
+        while h < len(self.levels):
+            if len(self.levels[h]) > self._capacity(h):
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(self.levels[h])
+                # Odd leftovers stay behind so no weight is lost
+                keep = items[-1:] if len(items) % 2 else items[:0]
+                pairs = items[:len(items) - len(keep)]
+                promoted = pairs[np.random.randint(2)::2]
+                self.levels[h] = keep
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+            h += 1
+
+    def update(self, values):
+        if len(values):
+            self.levels[0] = np.concatenate([self.levels[0], np.asarray(values, dtype=np.float64)])
+            self._compress()
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        self._compress()
+        return self
+
+    def quantiles(self, qs):
+        items = np.concatenate(self.levels)
+        if items.size == 0:
+            return [float('nan')] * len(qs)
+        weights = np.concatenate([np.full(len(lvl), 2.0 ** h) for h, lvl in enumerate(self.levels)])
+        order = np.argsort(items)
+        items, cum = items[order], np.cumsum(weights[order])
+        ranks = np.asarray(qs) * cum[-1]
+        return [float(v) for v in items[np.minimum(np.searchsorted(cum, ranks), len(items) - 1)]]
+
+    def to_dict(self):
+        return {'k': self.k, 'levels': [lvl.tolist() for lvl in self.levels]}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d['k'], [np.asarray(lvl, dtype=np.float64) for lvl in d['levels']])
+
+
+class TopK:
+    """Misra-Gries frequent items: mergeable, counts are lower bounds."""
+
+    def __init__(self, capacity=64, counts=None):
+        self.capacity = capacity
+        self.counts = counts if counts is not None else {}
+
+    def _trim(self):
+        if len(self.counts) > self.capacity:
+            ordered = sorted(self.counts.values(), reverse=True)
+            cut = ordered[self.capacity]
+            self.counts = {v: c - cut for v, c in self.counts.items() if c > cut}
+
+    def update(self, values):
+        for value, count in values.value_counts().head(4 * self.capacity).items():
+            self.counts[value] = self.counts.get(value, 0) + int(count)
+        self._trim()
+
+    def merge(self, other):
+        for value, count in other.counts.items():
+            self.counts[value] = self.counts.get(value, 0) + count
+        self._trim()
+        return self
+
+    def top(self, n=10):
+        return sorted(self.counts.items(), key=lambda kv: kv[1], reverse=True)[:n]
+
+    def to_dict(self):
+        return {'capacity': self.capacity, 'items': [[str(v), c] for v, c in self.counts.items()]}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d['capacity'], {v: c for v, c in d['items']})
+
+
+class ColumnStats:
+    """All per-column statistics, updated in one vectorized pass per chunk."""
+
+    def __init__(self, numeric):
+        self.numeric = numeric
+        self.count = 0
+        self.nulls = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.quantiles = KLLSketch() if numeric else None
+        self.distinct = HyperLogLog()
+        self.top = None if numeric else TopK()
+
+    def update(self, series):
+        values = series.dropna()
+        self.nulls += len(series) - len(values)
+        if values.empty:
+            return
+        self.distinct.update_hashes(hash_values(values))
+
+        if self.numeric:
+            arr = values.to_numpy(dtype=np.float64)
+            self._merge_moments(len(arr), float(arr.mean()), float(((arr - arr.mean()) ** 2).sum()))
+            lo, hi = float(arr.min()), float(arr.max())
+            self.min = lo if self.min is None else min(self.min, lo)
+            self.max = hi if self.max is None else max(self.max, hi)
+            self.quantiles.update(arr)
+        else:
+            self.count += len(values)
+            self.top.update(values)
+
+    def _merge_moments(self, n_b, mean_b, m2_b):
+        # Chan et al. pairwise combination of Welford states
+        total = self.count + n_b
+        delta = mean_b - self.mean
+        self.mean += delta * n_b / total
+        self.m2 += m2_b + delta * delta * self.count * n_b / total
+        self.count = total
+
+    def merge(self, other):
+        self.nulls += other.nulls
+        self.distinct.merge(other.distinct)
+        if self.numeric:
+            if other.count:
+                self._merge_moments(other.count, other.mean, other.m2)
+                self.min = other.min if self.min is None else min(self.min, other.min)
+                self.max = other.max if self.max is None else max(self.max, other.max)
+            self.quantiles.merge(other.quantiles)
+        else:
+            self.count += other.count
+            self.top.merge(other.top)
+        return self
+
+    @property
+    def std(self):
+        return (self.m2 / (self.count - 1)) ** 0.5 if self.count > 1 else float('nan')
+
+    def summary(self):
+        """One describe()-style column."""
+        row = {'count': self.count, 'unique': self.distinct.estimate(), 'nulls': self.nulls}
+        if self.numeric:
+            q25, q50, q75 = self.quantiles.quantiles([0.25, 0.5, 0.75])
+            row.update({'mean': self.mean, 'std': self.std, 'min': self.min,
+                        '25%': q25, '50%': q50, '75%': q75, 'max': self.max})
+        elif self.top.counts:
+            row['top'], row['freq'] = self.top.top(1)[0]
+        return row
+
+    def to_dict(self):
+        d = {'numeric': self.numeric, 'count': self.count, 'nulls': self.nulls,
+             'distinct': self.distinct.to_dict()}
+        if self.numeric:
+            d.update({'mean': self.mean, 'm2': self.m2, 'min': self.min, 'max': self.max,
+                      'quantiles': self.quantiles.to_dict()})
+        else:
+            d['top'] = self.top.to_dict()
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        col = cls(d['numeric'])
+        col.count, col.nulls = d['count'], d['nulls']
+        col.distinct = HyperLogLog.from_dict(d['distinct'])
+        if col.numeric:
+            col.mean, col.m2, col.min, col.max = d['mean'], d['m2'], d['min'], d['max']
+            col.quantiles = KLLSketch.from_dict(d['quantiles'])
+        else:
+            col.top = TopK.from_dict(d['top'])
+        return col
+
+
+class StatsAccumulator:
+    """
+    One-pass, mergeable profile of a DataFrame.
+    Feed it chunks with update(), combine partial states from other chunks
+    or processes with merge(), and persist it with to_dict()/from_dict().
+    """
+    DESCRIBE_ROWS = ['count', 'unique', 'top', 'freq', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']
+
+    def __init__(self):
+        self.columns = {}
+        self.rows = 0
+
+    def update(self, df):
+        for col in df.columns:
+            series = df[col]
+            key = str(col)
+            if key not in self.columns:
+                numeric = pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+                self.columns[key] = ColumnStats(numeric)
+            self.columns[key].update(series)
+        self.rows += len(df)
+        return self
+
+    def merge(self, other):
+        for key, col in other.columns.items():
+            if key in self.columns:
+                self.columns[key].merge(col)
+            else:
+                self.columns[key] = col
+        self.rows += other.rows
+        return self
+
+    def describe(self, numeric_only=False):
+        """DataFrame shaped like df.describe(include='all')."""
+        table = {key: col.summary() for key, col in self.columns.items()
+                 if col.numeric or not numeric_only}
+        rows = [r for r in self.DESCRIBE_ROWS if any(r in col for col in table.values())]
+        return pd.DataFrame(table).reindex(rows)
+
+    def to_dict(self):
+        return {'rows': self.rows, 'columns': {key: col.to_dict() for key, col in self.columns.items()}}
+
+    @classmethod
+    def from_dict(cls, d):
+        acc = cls()
+        acc.rows = d['rows']
+        acc.columns = {key: ColumnStats.from_dict(col) for key, col in d['columns'].items()}
+        return acc
+
+
+class CoMoments:
+    """
+    Mergeable pairwise co-moments of the numeric columns, from which the
+    correlation matrix is read off without another pass over the data.
+    For every pair (i, j) it keeps, over the rows where both are present:
+    the count, the sums, the sums of squares and the cross-product (each
+    column shifted by a reference value so the raw sums stay well
+    conditioned). correlation() matches DataFrame.corr(): pairwise-complete
+    Pearson.
+    """
+
+    def __init__(self, columns=None, shift=None, n=None, sx=None, sxx=None, sxy=None):
+        self.columns = list(columns or [])
+        k = len(self.columns)
+        self.shift = shift if shift is not None else np.zeros(k)
+        self.n = n if n is not None else np.zeros((k, k))
+        self.sx = sx if sx is not None else np.zeros((k, k))    # sx[i, j]: sum of x_i where j is present too
+        self.sxx = sxx if sxx is not None else np.zeros((k, k))
+        self.sxy = sxy if sxy is not None else np.zeros((k, k))
+
+    @staticmethod
+    def numeric_columns(df):
+        return [str(c) for c in df.columns
+                if pd.api.types.is_numeric_dtype(df[c]) and not pd.api.types.is_bool_dtype(df[c])]
+
+    def update(self, df):
+        df = df.rename(columns=str)
+        if not self.columns:
+            self.columns = self.numeric_columns(df)
+            k = len(self.columns)
+            self.n, self.sx, self.sxx, self.sxy = (np.zeros((k, k)) for _ in range(4))
+            self.shift = df[self.columns].astype('float64').mean().fillna(0.0).to_numpy()
+        if not self.columns or df.empty:
+            return self
+
+        x = df[self.columns].to_numpy(dtype=np.float64, na_value=np.nan) - self.shift
+        present = ~np.isnan(x)
+        if present.all():
+            # No nulls in this chunk: every pair sees every row, so one GEMM suffices
+            col_sums, col_squares = x.sum(axis=0), (x * x).sum(axis=0)
+            self.n += len(x)
+            self.sx += col_sums[:, None]
+            self.sxx += col_squares[:, None]
+            self.sxy += x.T @ x
+        else:
+            mask = present.astype(np.float64)
+            x0 = np.where(present, x, 0.0)
+            self.n += mask.T @ mask
+            self.sx += x0.T @ mask
+            self.sxx += (x0 * x0).T @ mask
+            self.sxy += x0.T @ x0
+        return self
+
+    def merge(self, other):
+        if not self.columns:
+            self.columns = list(other.columns)
+            self.shift, self.n = other.shift.copy(), other.n.copy()
+            self.sx, self.sxx, self.sxy = other.sx.copy(), other.sxx.copy(), other.sxy.copy()
+            return self
+        if other.columns != self.columns:
+            raise ValueError("Cannot merge co-moments over different columns.")
+        # Re-express the other state around this state's shift first
+        d = other.shift - self.shift
+        di, dj = d[:, None], d[None, :]
+        self.sxy += other.sxy + dj * other.sx + di * other.sx.T + di * dj * other.n
+        self.sxx += other.sxx + 2 * di * other.sx + di * di * other.n
+        self.sx += other.sx + di * other.n
+        self.n += other.n
+        return self
+
+    def drop(self, columns):
+        """The same statistics without `columns`: no data is re-read."""
+        keep = [i for i, c in enumerate(self.columns) if c not in set(columns)]
+        grid = np.ix_(keep, keep)
+        return CoMoments([self.columns[i] for i in keep], self.shift[keep],
+                         self.n[grid], self.sx[grid], self.sxx[grid], self.sxy[grid])
+
+    def correlation(self):
+        n, sx = self.n, self.sx
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cov = n * self.sxy - sx * sx.T
+            var = n * self.sxx - sx * sx
+            r = cov / np.sqrt(var * var.T)
+        r[(n < 2) | ~np.isfinite(r)] = np.nan
+        return pd.DataFrame(np.clip(r, -1.0, 1.0), index=self.columns, columns=self.columns)
+
+    def top_pairs(self, k=20):
+        """The k most strongly correlated column pairs as (x, y, r, rows)."""
+        r = self.correlation().to_numpy()
+        i, j = np.triu_indices(len(self.columns), k=1)
+        values = r[i, j]
+        valid = ~np.isnan(values)
+        i, j, values = i[valid], j[valid], values[valid]
+        order = np.argsort(-np.abs(values), kind='stable')[:k]
+        return [(self.columns[i[o]], self.columns[j[o]], float(values[o]), int(self.n[i[o], j[o]]))
+                for o in order]
+
+    def save(self, path):
+        with atomic_path(path) as tmp_path, open(tmp_path, 'wb') as fh:
+            np.savez(fh, columns=np.array(self.columns, dtype=str), shift=self.shift,
+                     n=self.n, sx=self.sx, sxx=self.sxx, sxy=self.sxy)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls([str(c) for c in data['columns']], data['shift'], data['n'],
+                       data['sx'], data['sxx'], data['sxy'])
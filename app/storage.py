@@ -0,0 +1,283 @@
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from flask import g, has_request_context
+
+from .utils import atomic_write
+
+
+class DatasetStore:
+    """
+    Versioned, immutable dataset snapshots under the upload folder.
+
+    Every upload of a name is written to its own version directory,
+    uploads/.datasets/<name>/<version>/, laid out like the upload folder
+    itself: the source file plus its .columnar/, row index and quality
+    sidecars. It is staged under a '.staging' name, renamed into place and
+    published by atomically replacing the CURRENT pointer, so a reader sees
+    either the old version or the new one and never a file being written.
+
+    Readers pin the version they resolved with a shared flock on its lock
+    file (per open file, so it works across gunicorn workers and threads
+    alike) and keep reading it while newer versions are published or the
+    dataset is deleted: publishing never waits for readers. A superseded
+    version is removed by whoever finds it unpinned: an exclusive
+    non-blocking flock only succeeds once no shared one is held. The
+    publisher tries right away, and each reader tries again as it lets go,
+    so the last reader out cleans up.
+
+    A staged version is pinned the same way by its writer until it is
+    published or discarded, so only one whose writer is gone (e.g. its
+    worker died mid-upload) is ever collected.
+
+    Datasets uploaded before this layout are still read from uploads/<name>,
+    as are transformed datasets (an operation log over a pinned source).
+    """
+    FOLDER = '.datasets'
+    POINTER = 'CURRENT'
+    LOCK = '.lock'
+    WRITE_LOCK = '.write.lock'
+    STAGING = '.staging'
+    PIN_RETRIES = 5
+
+    def __init__(self):
+        self.upload_dir = None
+        self._staging = {}  # staged path -> fd holding a shared lock on its version
+        self._staging_lock = threading.Lock()
+
+    def configure(self, app, upload_dir):
+        self.upload_dir = upload_dir
+        os.makedirs(os.path.join(upload_dir, self.FOLDER), exist_ok=True)
+        app.teardown_request(lambda exc: self.release_request_pins())
+        self.sweep()
+
+    # --- 1. Layout ---
+    def _root(self, filename):
+        return os.path.join(self.upload_dir, self.FOLDER, filename)
+
+    def current_version(self, filename):
+        try:
+            with open(os.path.join(self._root(filename), self.POINTER)) as fh:
+                return json.load(fh)['version']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def resolve(self, filename):
+        """Path of the current version's source file (uploads/<name> outside the snapshot layout)."""
+        version = self.current_version(filename)
+        if version is None:
+            return os.path.join(self.upload_dir, filename)
+        return os.path.join(self._root(filename), version, filename)
+
+    def exists(self, filename):
+        return os.path.exists(self.resolve(filename))
+
+    def _version_of(self, path):
+        """(name, version directory) that `path` lies in, or (None, None) outside the layout."""
+        relative = os.path.relpath(path, os.path.join(self.upload_dir, self.FOLDER))
+        parts = relative.split(os.sep)
+        if relative.startswith('..') or len(parts) < 3:
+            return None, None
+        return parts[0], os.path.join(self._root(parts[0]), parts[1])
+
+    # --- 2. Readers ---
+    def _lock_shared(self, version_dir):
+        """An fd holding a shared lock on the version, or None if it is gone or being removed."""
+        lock_path = os.path.join(version_dir, self.LOCK)
+        try:
+            fd = os.open(lock_path, os.O_RDONLY)
+        except FileNotFoundError:
+            return None
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)  # a collector holds it: this version is on its way out
+            return None
+        if not os.path.exists(lock_path):
+            os.close(fd)  # collected between open() and flock()
+            return None
+        return fd
+
+    def pin(self, filename):
+        """
+        Resolves `filename` and pins that version. Returns (path, pin); pass
+        the pin to release() when done. The pin is None outside the layout.
+        """
+        for _ in range(self.PIN_RETRIES):
+            version = self.current_version(filename)
+            if version is None:
+                return os.path.join(self.upload_dir, filename), None
+            fd = self._lock_shared(os.path.join(self._root(filename), version))
+            if fd is not None:
+                return os.path.join(self._root(filename), version, filename), (filename, version, fd)
+            # A newer version was published meanwhile: resolve again
+        raise RuntimeError(f"'{filename}' is being replaced too often to read; try again.")
+
+    def release(self, pin):
+        if pin is None:
+            return
+        filename, version, fd = pin
+        os.close(fd)
+        if version != self.current_version(filename):
+            self.collect(filename)
+
+    @contextmanager
+    def reading(self, filename):
+        """The current version of `filename`, pinned for the block."""
+        path, pin = self.pin(filename)
+        try:
+            yield path
+        finally:
+            self.release(pin)
+
+    @contextmanager
+    def holding(self, path):
+        """Pins the version a path lies in (e.g. a sidecar handed to a job); FileNotFoundError once it is gone."""
+        filename, version_dir = self._version_of(path)
+        fd = self._lock_shared(version_dir) if version_dir else None
+        if version_dir and fd is None:
+            raise FileNotFoundError(f"{os.path.basename(path)} belongs to a dataset version that was removed.")
+        try:
+            yield path
+        finally:
+            if fd is not None:
+                self.release((filename, os.path.basename(version_dir), fd))
+
+    def path(self, filename):
+        """resolve(), pinned until the end of the current request."""
+        path, pin = self.pin(filename)
+        if pin is not None:
+            if has_request_context():
+                g.setdefault('storage_pins', []).append(pin)
+            else:
+                self.release(pin)
+        return path
+
+    def release_request_pins(self):
+        for pin in g.pop('storage_pins', []):
+            self.release(pin)
+
+    # --- 3. Writers ---
+    @contextmanager
+    def _write_lock(self, filename):
+        """Serialises publish/delete of one name (never held while data is written)."""
+        root = self._root(filename)
+        os.makedirs(root, exist_ok=True)
+        fd = os.open(os.path.join(root, self.WRITE_LOCK), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def stage(self, filename):
+        """
+        Path to write a new, unpublished version's source file to. Its
+        sidecars land next to it as usual; publish() or discard() it after.
+        """
+        version = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        root = self._root(filename)
+        # Locked under a hidden name (which collect() skips) before it shows up as staged
+        hidden_dir = os.path.join(root, '.' + version)
+        os.makedirs(hidden_dir)
+        fd = os.open(os.path.join(hidden_dir, self.LOCK), os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        version_dir = os.path.join(root, version + self.STAGING)
+        os.rename(hidden_dir, version_dir)
+        staged_path = os.path.join(version_dir, filename)
+        with self._staging_lock:
+            self._staging[staged_path] = fd
+        return staged_path
+
+    def _unstage(self, staged_path):
+        with self._staging_lock:
+            fd = self._staging.pop(staged_path, None)
+        if fd is not None:
+            os.close(fd)
+
+    def discard(self, staged_path):
+        self._unstage(staged_path)
+        shutil.rmtree(os.path.dirname(staged_path), ignore_errors=True)
+
+    def publish(self, staged_path):
+        """Makes a staged version the current one and returns its source path."""
+        staging_dir, filename = os.path.split(staged_path)
+        version = os.path.basename(staging_dir)[:-len(self.STAGING)]
+        root = self._root(filename)
+        with self._write_lock(filename):
+            os.replace(staging_dir, os.path.join(root, version))
+            atomic_write(os.path.join(root, self.POINTER),
+                         json.dumps({'version': version, 'published': time.time()}))
+        self._unstage(staged_path)
+        self.collect(filename)
+        print(f"--- 📦 Published {filename} version {version} ---")
+        return os.path.join(root, version, filename)
+
+    def delete(self, filename):
+        """Unpublishes `filename`; its versions are removed once nobody reads them."""
+        if not os.path.isdir(self._root(filename)):
+            return
+        with self._write_lock(filename):
+            pointer = os.path.join(self._root(filename), self.POINTER)
+            if os.path.exists(pointer):
+                os.remove(pointer)
+        self.collect(filename)
+
+    # --- 4. Cleanup ---
+    def _remove_unpinned(self, version_dir):
+        try:
+            fd = os.open(os.path.join(version_dir, self.LOCK), os.O_RDONLY)
+        except FileNotFoundError:
+            shutil.rmtree(version_dir, ignore_errors=True)
+            return True
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False  # still pinned: its last reader collects it
+        else:
+            shutil.rmtree(version_dir, ignore_errors=True)
+            return True
+        finally:
+            os.close(fd)
+
+    def collect(self, filename):
+        """
+        Removes the versions of `filename` that are neither current, pinned
+        nor still being staged. Takes the write lock, so the caller must not
+        hold it: CURRENT cannot move to a version while it is being removed.
+        """
+        root = self._root(filename)
+        if not os.path.isdir(root):
+            return 0
+        removed = 0
+        with self._write_lock(filename):
+            current = self.current_version(filename)
+            for name in os.listdir(root):
+                version_dir = os.path.join(root, name)
+                if name == current or name.startswith('.') or not os.path.isdir(version_dir):
+                    continue
+                removed += self._remove_unpinned(version_dir)
+        return removed
+
+    def sweep(self):
+        """collect() over every dataset (run at startup)."""
+        folder = os.path.join(self.upload_dir, self.FOLDER)
+        removed = sum(self.collect(name) for name in os.listdir(folder))
+        if removed:
+            print(f"--- 🧹 Removed {removed} superseded dataset versions ---")
+
+    def stats(self):
+        folder = os.path.join(self.upload_dir, self.FOLDER)
+        names = os.listdir(folder)
+        return {'datasets': sum(self.current_version(name) is not None for name in names),
+                'versions': sum(len([v for v in os.listdir(os.path.join(folder, name))
+                                     if os.path.isdir(os.path.join(folder, name, v))]) for name in names)}
+
+
+storage = DatasetStore()
@@ -0,0 +1,408 @@
+import fcntl
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.utils import secure_filename
+
+from .catalog import catalog
+from .columnar import ColumnarStore
+from .ingest import StreamingIngestor
+from .preview import RowIndex
+from .quality import QualityProfiler
+from .storage import storage
+from .utils import atomic_write
+from .warehouse import warehouse
+
+
+_UPLOAD_ID = re.compile(r'^[0-9a-f]{32}$')
+UPLOAD_EXTENSIONS = ('.csv', '.xlsx', '.xls')
+
+
+class UploadError(Exception):
+    """A session or chunk request the protocol rejects, with its HTTP status."""
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+class DuplicateUpload(Exception):
+    """Stops the parse that follows an upload once its content turns out to be on the server already."""
+
+
+class GrowingFile(io.RawIOBase):
+    """
+    Read-only view of an upload that is still arriving. Reads block until
+    more bytes land (or `size` is reached), so a parser can run through
+    the file while the client is still sending it. Every CHECK_SECONDS
+    `stop()` is asked whether the parse is still wanted; if it is not,
+    the next read raises DuplicateUpload.
+    """
+    POLL_SECONDS = 0.05
+    CHECK_SECONDS = 0.5
+
+    def __init__(self, path, size, stall_seconds, stop=None):
+        super().__init__()
+        self._fh = open(path, 'rb', buffering=0)
+        self.path = path
+        self.size = size
+        self.pos = 0
+        self.stall_seconds = stall_seconds
+        self.stop = stop
+        self._checked = time.monotonic()
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.pos >= self.size:
+            return 0
+        if self.stop is not None and time.monotonic() - self._checked > self.CHECK_SECONDS:
+            self._checked = time.monotonic()
+            if self.stop():
+                raise DuplicateUpload("The content of this upload is already on the server.")
+        view = memoryview(buffer)[:self.size - self.pos]
+        waited = 0.0
+        while True:
+            n = self._fh.readinto(view)
+            if n:
+                self.pos += n
+                return n
+            if not os.path.exists(self.path):
+                raise FileNotFoundError("The upload was cancelled.")
+            if waited > self.stall_seconds:
+                raise TimeoutError(f"Upload stalled at {self.pos} of {self.size} bytes.")
+            time.sleep(self.POLL_SECONDS)
+            waited += self.POLL_SECONDS
+
+    def close(self):
+        self._fh.close()
+        super().close()
+
+
+class ChunkedUploads:
+    """
+    Resumable chunked uploads.
+    A session is opened with the file name and total size; the client then
+    sends raw byte ranges in order. Each chunk is streamed to a partial
+    file one block at a time while a SHA-256 is updated, so no request
+    holds more than a block in memory. The server's offset is always the
+    partial file's size: after a dropped connection the client asks for it
+    and resumes from there.
+
+    CSV parsing starts with the session, on a thread of its own, and
+    follows the bytes as they arrive (GrowingFile), so the dashboard is
+    ready right after the last chunk. Once the hash is known, content that
+    is already on the server is reused instead of being ingested and
+    stored again. Session state lives in a JSON file, so any worker can
+    take the next chunk or a status poll.
+    """
+    FOLDER = '.partial'
+    INDEX_FOLDER = '.by_hash'
+    BLOCK_SIZE = 1024 * 1024
+    STALL_SECONDS = 600
+    ABANDONED_SECONDS = 24 * 3600
+
+    def __init__(self):
+        self.upload_dir = None
+        self.max_bytes = 2 * 1024 ** 3
+        self.chunk_bytes = 8 * 1024 * 1024
+        self.chunk_rows = 100_000
+        self.max_rss_bytes = None
+        self.sample_rows = 100_000
+        self.parsers = 4
+        self._hashers = {}  # upload id -> (offset, sha256 of the bytes before it)
+        self._active = set()  # upload ids being processed by this worker
+        self._executor = None
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self.after_fork)
+
+    def after_fork(self):
+        """In a forked worker: no parser threads or partial hashes came along."""
+        self._hashers = {}
+        self._active = set()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def configure(self, upload_dir, max_bytes, chunk_bytes, chunk_rows, max_rss_bytes, sample_rows, parsers):
+        self.upload_dir = upload_dir
+        self.max_bytes = max_bytes
+        self.chunk_bytes = chunk_bytes
+        self.chunk_rows = chunk_rows
+        self.max_rss_bytes = max_rss_bytes
+        self.sample_rows = sample_rows
+        self.parsers = parsers
+        os.makedirs(os.path.join(upload_dir, self.FOLDER), exist_ok=True)
+        os.makedirs(os.path.join(upload_dir, self.INDEX_FOLDER), exist_ok=True)
+
+    # --- 1. Session files ---
+    def _meta_path(self, upload_id):
+        return os.path.join(self.upload_dir, self.FOLDER, f"{upload_id}.json")
+
+    def _data_path(self, meta):
+        # Keeps the extension, so ingest picks the right parser
+        return os.path.join(self.upload_dir, self.FOLDER, f"{meta['id']}_{meta['filename']}")
+
+    def _load(self, upload_id):
+        if not _UPLOAD_ID.match(upload_id) or not os.path.exists(self._meta_path(upload_id)):
+            raise UploadError("Unknown upload.", 404)
+        with open(self._meta_path(upload_id)) as fh:
+            return json.load(fh)
+
+    def _save(self, meta):
+        meta['updated'] = time.time()
+        atomic_write(self._meta_path(meta['id']), json.dumps(meta))
+        return meta
+
+    def _update(self, upload_id, **fields):
+        """Read-modify-write of the session file, serialised across workers."""
+        with open(self._meta_path(upload_id) + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            meta = self._load(upload_id)
+            meta.update(fields)
+            return self._save(meta)
+
+    def _ingestor(self):
+        return StreamingIngestor(
+            chunk_rows=self.chunk_rows, max_rss_bytes=self.max_rss_bytes, sample_rows=self.sample_rows
+        )
+
+    def _status(self, meta):
+        path = self._data_path(meta)
+        return {
+            'upload_id': meta['id'],
+            'filename': meta['filename'],
+            'size': meta['size'],
+            'offset': os.path.getsize(path) if os.path.exists(path) else meta['size'],
+            'chunk_size': self.chunk_bytes,
+            'state': meta['state'],
+            'sha256': meta['sha256'],
+            'result': meta['result'],
+            'error': meta['error'],
+        }
+
+    # --- 2. Content index (dedup) ---
+    def _index_path(self, digest):
+        return os.path.join(self.upload_dir, self.INDEX_FOLDER, f"{digest}.json")
+
+    def remember(self, filename, digest):
+        """Records that `filename` holds the content `digest` (called for every ingested upload)."""
+        atomic_write(self._index_path(digest), json.dumps({'filename': filename}))
+
+    def find(self, digest):
+        """Name of an ingested upload with this content, if it is still there and unchanged."""
+        if not os.path.exists(self._index_path(digest)):
+            return None
+        with open(self._index_path(digest)) as fh:
+            filename = json.load(fh)['filename']
+        filepath = storage.resolve(filename)
+        if not os.path.exists(filepath):
+            return None
+        summary = ColumnarStore.read_summary(filepath)
+        return filename if summary and summary.get('content_hash') == digest else None
+
+    # --- 3. Protocol ---
+    def start(self, filename, size):
+        """Opens a session and returns its status. CSVs start parsing right away."""
+        self._prune()
+        filename = secure_filename(filename or '')
+        if not filename.lower().endswith(UPLOAD_EXTENSIONS):
+            raise UploadError("Only CSV and Excel files can be uploaded.")
+        if not isinstance(size, int) or size <= 0:
+            raise UploadError("The upload size must be a positive number of bytes.")
+        if size > self.max_bytes:
+            raise UploadError(f"File is larger than the {self.max_bytes // 2**20} MB upload limit.", 413)
+
+        meta = {'id': uuid.uuid4().hex, 'filename': filename, 'size': size, 'state': 'receiving',
+                'streaming': filename.lower().endswith('.csv'), 'parse_error': None,
+                'sha256': None, 'result': None, 'error': None, 'created': time.time()}
+        open(self._data_path(meta), 'wb').close()
+        self._save(meta)
+        if meta['streaming']:
+            self._submit(meta['id'], streaming=True)
+        return self._status(meta)
+
+    def _submit(self, upload_id, streaming):
+        with self._lock:
+            if upload_id in self._active:
+                return
+            self._active.add(upload_id)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.parsers, thread_name_prefix='upload')
+        self._executor.submit(self._process, upload_id, streaming)
+
+    def status(self, upload_id):
+        """
+        Session status. Once every byte is in, processing is (re)started
+        here unless a live parse is already following the upload: Excel
+        files, parses that failed mid-upload and parses whose worker went
+        away all finish from the complete file.
+        """
+        meta = self._load(upload_id)
+        if meta['state'] == 'received' and upload_id not in self._active and (
+                not meta['streaming'] or meta['parse_error']
+                or time.time() - meta['updated'] > self.STALL_SECONDS):
+            self._submit(upload_id, streaming=False)
+        return self._status(meta)
+
+    def _digest_before(self, upload_id, path, offset):
+        """SHA-256 state for the first `offset` bytes: kept from the last chunk, else re-read."""
+        known = self._hashers.pop(upload_id, None)
+        if known is not None and known[0] == offset:
+            return known[1]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as fh:
+            remaining = offset
+            while remaining:
+                block = fh.read(min(self.BLOCK_SIZE, remaining))
+                digest.update(block)
+                remaining -= len(block)
+        return digest
+
+    def write_chunk(self, upload_id, offset, stream):
+        """Appends one chunk at `offset`, streaming it to disk block by block."""
+        meta = self._load(upload_id)
+        if meta['state'] != 'receiving':
+            raise UploadError("This upload is already complete.", 409)
+        path = self._data_path(meta)
+
+        with open(path, 'ab') as fh:
+            # Two requests for the same session must not interleave
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            current = os.path.getsize(path)
+            if offset != current:
+                raise UploadError(f"Expected offset {current}.", 409, offset=current)
+            digest = self._digest_before(upload_id, path, current)
+            try:
+                for block in iter(lambda: stream.read(self.BLOCK_SIZE), b''):
+                    if current + len(block) > meta['size']:
+                        raise UploadError("Chunk runs past the declared file size.", 413, offset=current)
+                    fh.write(block)
+                    digest.update(block)
+                    current += len(block)
+            finally:
+                # Bytes already written are kept: the client resumes after them
+                fh.flush()
+                self._hashers[upload_id] = (current, digest)
+
+        if current == meta['size']:
+            self._hashers.pop(upload_id, None)
+            meta = self._update(upload_id, state='received', sha256=digest.hexdigest())
+            print(f"--- 📦 Upload {meta['filename']} received ({current} bytes) ---")
+            return self.status(upload_id)
+        return self._status(meta)
+
+    def abort(self, upload_id):
+        meta = self._load(upload_id)
+        self._discard(meta)
+
+    def _discard(self, meta):
+        self._hashers.pop(meta['id'], None)
+        self._discard_data(meta)
+        for leftover in (self._meta_path(meta['id']), self._meta_path(meta['id']) + '.lock'):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+    def _discard_data(self, meta):
+        """Removes the received bytes and their artifacts but keeps the session record."""
+        path = self._data_path(meta)
+        ColumnarStore.remove(path)
+        RowIndex.remove(path)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _prune(self):
+        """Drops sessions nobody has touched for a day."""
+        folder = os.path.join(self.upload_dir, self.FOLDER)
+        for name in os.listdir(folder):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(folder, name)) as fh:
+                    meta = json.load(fh)
+            except (OSError, ValueError):
+                continue
+            if time.time() - meta['updated'] > self.ABANDONED_SECONDS:
+                self._discard(meta)
+
+    # --- 4. Processing (upload threads) ---
+    def _wait_received(self, upload_id):
+        """The last chunk's request records the hash just after writing it."""
+        deadline = time.time() + self.STALL_SECONDS
+        while time.time() < deadline:
+            meta = self._load(upload_id)
+            if meta['sha256']:
+                return meta
+            time.sleep(GrowingFile.POLL_SECONDS)
+        raise TimeoutError("The upload never completed.")
+
+    def _duplicate_of(self, upload_id):
+        """Once every byte is in: the ingested upload with the same content, if any."""
+        meta = self._load(upload_id)
+        return self.find(meta['sha256']) if meta['sha256'] else None
+
+    def _process(self, upload_id, streaming):
+        """Ingests the upload (following it while it arrives if `streaming`) and moves it into place."""
+        try:
+            meta = self._load(upload_id)
+            path = self._data_path(meta)
+            # The hash is computed as the chunks arrive: ingest need not read the file again for it
+            streamed_digest = lambda: self._wait_received(upload_id)['sha256']
+            summary = None
+            if streaming:
+                opener = lambda: io.BufferedReader(GrowingFile(
+                    path, meta['size'], self.STALL_SECONDS, stop=lambda: self._duplicate_of(upload_id) is not None
+                ))
+                try:
+                    summary = self._ingestor().ingest(path, opener=opener, digest=streamed_digest)
+                except DuplicateUpload:
+                    pass  # the known content is reused below
+            meta = self._wait_received(upload_id)
+
+            existing = self.find(meta['sha256'])
+            if existing is not None:
+                print(f"--- ♻️ {meta['filename']} has the same content as {existing}: not stored again ---")
+                self._discard_data(meta)
+                self._update(upload_id, state='done', result={'filename': existing, 'deduplicated': True})
+                return
+
+            if summary is None:
+                summary = self._ingestor().ingest(path, digest=streamed_digest)
+
+            # Moved into a staged version (same filesystem: renames only), then published
+            staged = storage.stage(meta['filename'])
+            ColumnarStore.move(path, staged)
+            RowIndex.move(path, staged)
+            os.replace(path, staged)
+            target = storage.publish(staged)
+            self.remember(meta['filename'], meta['sha256'])
+            catalog.record(target, summary)
+            QualityProfiler.submit(target, summary['content_hash'])
+            warehouse.submit_load(ColumnarStore.sidecar_path(target), summary['content_hash'])
+
+            self._update(upload_id, state='done', result={'filename': meta['filename'], 'deduplicated': False})
+            print(f"--- ✅ Upload {meta['filename']} ingested ---")
+        except Exception as e:
+            if not os.path.exists(self._meta_path(upload_id)):
+                return  # cancelled by the client
+            print(f"--- ❌ UPLOAD {upload_id} FAILED ---")
+            print(traceback.format_exc())
+            if streaming and self._load(upload_id)['state'] == 'receiving':
+                # e.g. a long pause: retried from the complete file once the last chunk is in
+                self._update(upload_id, parse_error=str(e))
+            else:
+                self._update(upload_id, state='failed', error=str(e))
+        finally:
+            with self._lock:
+                self._active.discard(upload_id)
+
+
+chunked_uploads = ChunkedUploads()
@@ -1,4 +1,6 @@
 import os
+import threading
+from contextlib import contextmanager
 from werkzeug.utils import secure_filename
 
 # Configuration for allowed formats
@@ -25,4 +27,28 @@ def save_and_get_path(file, upload_folder):
         ext = os.path.splitext(filename)[1].lower()
         return filepath, ext
     
-    return None, None
\ No newline at end of file
+    return None, None
+
+
+@contextmanager
+def atomic_path(path):
+    """
+    Temp path to write `path`'s new contents to. It is renamed over `path`
+    when the block finishes, or removed if it raises, so readers only ever
+    see the old file or the whole new one. Unique per process and thread.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_write(path, data):
+    """Replaces `path` with `data` (bytes or str) in one step (see atomic_path)."""
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, 'wb' if isinstance(data, bytes) else 'w') as fh:
+            fh.write(data)
@@ -0,0 +1,279 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather
+
+from .jobs import job_queue
+from .storage import storage
+
+
+def quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+class SQLWarehouse:
+    """
+    Optional embedded SQL store for uploaded data (SQLite, one file shared
+    by every worker). Uploads are bulk-loaded from their columnar sidecar
+    in the background, one table per content hash. Transform pipelines made
+    of filter/dropna/fillna/drop_col/groupby/agg that aggregate then compile
+    to a single query, so only the (usually small) result ever reaches
+    pandas and the source no longer has to fit in memory. Row-level results
+    stay with pandas: SQLite would hand back bools as integers and
+    categories as plain text. Group-by columns get a covering index the
+    first time they are used.
+    """
+    OPERATORS = ('==', '!=', '>', '>=', '<', '<=')
+    AGGREGATING = ('groupby', 'agg')
+    BATCH_ROWS = 50_000
+    STALE_LOAD_SECONDS = 600
+    AGG_SQL = {'mean': 'AVG({})', 'sum': 'COALESCE(SUM({}), 0)', 'count': 'COUNT({})',
+               'min': 'MIN({})', 'max': 'MAX({})', 'nunique': 'COUNT(DISTINCT {})'}
+
+    def __init__(self, path=None, enabled=False):
+        self.path = path
+        self.enabled = enabled
+        self.queries = 0
+        self.fallbacks = 0
+
+    def configure(self, path, enabled):
+        self.path = path
+        self.enabled = enabled
+        if enabled:
+            with closing(self._connect()) as conn:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS datasets ('
+                    'table_name TEXT PRIMARY KEY, state TEXT, rows INTEGER, '
+                    'columns TEXT, indexes TEXT, updated REAL)'
+                )
+                conn.commit()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    @staticmethod
+    def table_name(dataset_hash):
+        return 't_' + dataset_hash[:32]
+
+    # --- 1. Bulk load ---
+    @staticmethod
+    def _sql_type(arrow_type):
+        if pa.types.is_integer(arrow_type) or pa.types.is_boolean(arrow_type):
+            return 'INTEGER'
+        if pa.types.is_floating(arrow_type):
+            return 'REAL'
+        return 'TEXT'
+
+    @staticmethod
+    def _python_columns(batch):
+        """Column values as Python lists (None for nulls); exotic types as text."""
+        columns = []
+        for array in batch.columns:
+            t = array.type
+            if not (pa.types.is_integer(t) or pa.types.is_floating(t) or pa.types.is_boolean(t)
+                    or pa.types.is_string(t) or pa.types.is_large_string(t)):
+                array = pc.cast(array, pa.string())
+            columns.append(array.to_pylist())
+        return columns
+
+    def state(self, dataset_hash):
+        """Registry row for a dataset: {'state', 'rows', 'columns', 'indexes', 'updated'} or None."""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                'SELECT state, rows, columns, indexes, updated FROM datasets WHERE table_name = ?',
+                (self.table_name(dataset_hash),)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'state': row[0], 'rows': row[1], 'columns': json.loads(row[2] or '{}'),
+                'indexes': json.loads(row[3] or '[]'), 'updated': row[4]}
+
+    def load(self, sidecar_path, dataset_hash):
+        """Copies a columnar sidecar into its table (no-op if already loaded or loading)."""
+        table = self.table_name(dataset_hash)
+        current = self.state(dataset_hash)
+        if current and (current['state'] == 'ready' or
+                        time.time() - current['updated'] < self.STALE_LOAD_SECONDS):
+            return current['state']
+
+        with storage.holding(sidecar_path):
+            source = feather.read_table(sidecar_path, memory_map=True)
+        types = {name: self._sql_type(field.type) for name, field in zip(source.column_names, source.schema)}
+        with closing(self._connect()) as conn:
+            conn.execute('INSERT OR REPLACE INTO datasets VALUES (?, ?, ?, ?, ?, ?)',
+                         (table, 'loading', 0, json.dumps(types), '[]', time.time()))
+            conn.execute(f'DROP TABLE IF EXISTS {quote(table)}')
+            conn.execute(f'CREATE TABLE {quote(table)} ('
+                         + ', '.join(f'{quote(c)} {t}' for c, t in types.items()) + ')')
+            conn.commit()
+
+            insert = f'INSERT INTO {quote(table)} VALUES ({", ".join("?" * len(types))})'
+            try:
+                for batch in source.to_batches(max_chunksize=self.BATCH_ROWS):
+                    conn.executemany(insert, zip(*self._python_columns(batch)))
+                    conn.commit()
+            except Exception:
+                # A row left 'loading' would block every retry for STALE_LOAD_SECONDS
+                conn.rollback()
+                conn.execute(f'DROP TABLE IF EXISTS {quote(table)}')
+                conn.execute('DELETE FROM datasets WHERE table_name = ?', (table,))
+                conn.commit()
+                raise
+
+            conn.execute('UPDATE datasets SET state = ?, rows = ?, updated = ? WHERE table_name = ?',
+                         ('ready', source.num_rows, time.time(), table))
+            conn.commit()
+        print(f"--- 🗄️ Warehouse loaded {table} ({source.num_rows} rows) ---")
+        return 'ready'
+
+    def submit_load(self, sidecar_path, dataset_hash):
+        """Loads in the background; queries fall back to pandas until it is ready."""
+        if self.enabled:
+            job_queue.submit(self.load, sidecar_path, dataset_hash, job_id=f"wh-{dataset_hash[:32]}")
+
+    @staticmethod
+    def _index_name(table, columns):
+        return 'ix_' + hashlib.sha256(json.dumps([table] + columns).encode('utf8')).hexdigest()[:24]
+
+    def ensure_index(self, dataset_hash, columns):
+        table = self.table_name(dataset_hash)
+        name = self._index_name(table, columns)
+        with closing(self._connect()) as conn:
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {quote(name)} ON {quote(table)} '
+                         f'({", ".join(quote(c) for c in columns)})')
+            row = conn.execute('SELECT indexes FROM datasets WHERE table_name = ?', (table,)).fetchone()
+            indexes = json.loads(row[0] or '[]') if row else []
+            if columns not in indexes:
+                conn.execute('UPDATE datasets SET indexes = ? WHERE table_name = ?',
+                             (json.dumps(indexes + [columns]), table))
+            conn.commit()
+
+    def drop(self, dataset_hash):
+        if not self.enabled:
+            return
+        table = self.table_name(dataset_hash)
+        with closing(self._connect()) as conn:
+            conn.execute(f'DROP TABLE IF EXISTS {quote(table)}')
+            conn.execute('DELETE FROM datasets WHERE table_name = ?', (table,))
+            conn.commit()
+
+    # --- 2. Compiling pipeline ops ---
+    @staticmethod
+    def _param(value, sql_type):
+        if sql_type in ('INTEGER', 'REAL'):
+            return float(pd.to_numeric(value))
+        return str(value)
+
+    def compile(self, table, types, plan):
+        """
+        (sql, params, group_indexes) for an optimized TransformPipeline plan,
+        or None if an op has no SQL equivalent here (pandas runs it instead).
+        Each op wraps the previous query; SQLite flattens the nesting.
+        """
+        types = dict(types)
+        select = lambda cols: ', '.join(quote(c) for c in cols)
+        sql, params, indexes = f'SELECT {select(types)} FROM {quote(table)}', [], []
+        base_columns = set(types)
+
+        for op in plan:
+            kind, cols = op['op'], list(types)
+            if kind == 'filter':
+                clauses = []
+                for cond in op['conditions']:
+                    if cond['column'] not in types or cond['operator'] not in self.OPERATORS:
+                        return None
+                    clauses.append(f"{quote(cond['column'])} {cond['operator']} ?")
+                    params.append(self._param(cond['value'], types[cond['column']]))
+                sql = f'SELECT {select(cols)} FROM ({sql}) WHERE ' + ' AND '.join(clauses)
+            elif kind == 'dropna':
+                subset = op['columns'] or cols
+                if any(c not in types for c in subset):
+                    return None
+                sql = f'SELECT {select(cols)} FROM ({sql}) WHERE ' + ' AND '.join(
+                    f'{quote(c)} IS NOT NULL' for c in subset)
+            elif kind == 'fillna':
+                col = op['column']
+                if col not in types:
+                    return None
+                items = [f'COALESCE({quote(c)}, ?) AS {quote(c)}' if c == col else quote(c) for c in cols]
+                # The select list comes before the nested query in the SQL text
+                params = [self._param(op['value'], types[col])] + params
+                sql = f'SELECT {", ".join(items)} FROM ({sql})'
+            elif kind == 'drop_col':
+                types = {c: t for c, t in types.items() if c not in op['columns']}
+                sql = f'SELECT {select(types)} FROM ({sql})'
+            elif kind == 'groupby':
+                g, a, func = op['group_col'], op['agg_col'], op['agg_func']
+                if g not in types or a not in types or func not in self.AGG_SQL or g == a:
+                    return None
+                if func in ('mean', 'sum') and types[a] == 'TEXT':
+                    return None
+                if g in base_columns and a in base_columns:
+                    indexes.append([g, a])
+                agg = self.AGG_SQL[func].format(quote(a))
+                # pandas drops null keys and sorts the groups
+                sql = (f'SELECT {quote(g)}, {agg} AS {quote(a)} FROM ({sql}) '
+                       f'WHERE {quote(g)} IS NOT NULL GROUP BY {quote(g)} ORDER BY {quote(g)}')
+                types = {g: types[g], a: 'INTEGER' if func in ('count', 'nunique') else types[a]}
+            elif kind == 'agg':
+                targets = op['columns'] or [c for c, t in types.items() if t != 'TEXT']
+                func = op['agg_func']
+                if func not in self.AGG_SQL or any(c not in types for c in targets):
+                    return None
+                items = ', '.join(f'{self.AGG_SQL[func].format(quote(c))} AS {quote(c)}' for c in targets)
+                params = [func] + params
+                sql = f'SELECT ? AS statistic, {items} FROM ({sql})'
+                types = {'statistic': 'TEXT', **{c: types[c] for c in targets}}
+            else:
+                return None
+            base_columns &= set(types)
+        return sql, params, indexes
+
+    def query(self, dataset_hash, plan, columns=None):
+        """Runs `plan` inside SQLite, or returns None if it cannot (not loaded, not compilable, not aggregating)."""
+        if not self.enabled or not any(op['op'] in self.AGGREGATING for op in plan):
+            return None
+        info = self.state(dataset_hash)
+        if info is None or info['state'] != 'ready':
+            return None
+        types = info['columns']
+        if columns:
+            types = {c: t for c, t in types.items() if c in set(columns)}
+        table = self.table_name(dataset_hash)
+        try:
+            compiled = self.compile(table, types, plan)
+        except (TypeError, ValueError):
+            compiled = None  # e.g. a non-numeric filter value: let pandas report it
+        if compiled is None:
+            self.fallbacks += 1
+            return None
+        sql, params, indexes = compiled
+        for index in indexes:
+            if index not in info['indexes']:
+                # Built once in the background; this query runs without it
+                job_queue.submit(self.ensure_index, dataset_hash, index,
+                                 job_id=f"wh-{self._index_name(table, index)}")
+        self.queries += 1
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(sql, conn, params=params)
+
+    def stats(self):
+        result = {'enabled': self.enabled, 'queries': self.queries, 'fallbacks': self.fallbacks}
+        if self.enabled and os.path.exists(self.path):
+            with closing(self._connect()) as conn:
+                result['tables'] = conn.execute("SELECT COUNT(*) FROM datasets WHERE state = 'ready'").fetchone()[0]
+            result['bytes'] = os.path.getsize(self.path)
+        return result
+
+
+warehouse = SQLWarehouse()
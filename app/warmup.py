@@ -0,0 +1,80 @@
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+
+def prime():
+    """
+    Pays the one-time plotting costs before serving: the matplotlib import
+    and font cache (built on disk on first use, which takes seconds on a
+    fresh container) and the seaborn theme. Run it in the gunicorn master
+    with preload_app, so forked workers and spawned render processes find
+    both ready. Returns the seconds spent.
+    """
+    started = time.perf_counter()
+    from matplotlib import font_manager
+    from .render import figure_bytes, new_figure
+
+    font_manager.findfont(font_manager.FontProperties())
+    fig = new_figure((2, 2))
+    ax = fig.add_subplot()
+    ax.plot([0, 1], [0, 1])
+    ax.set_title('warmup')
+    figure_bytes(fig)
+    elapsed = time.perf_counter() - started
+    print(f"--- 🔥 Plotting warmed up in {elapsed:.2f}s ---")
+    return elapsed
+
+
+# --- Import-time report ---
+_IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|\s*(\S+)')
+
+
+def import_report(module='app', top=15):
+    """
+    Measures `import <module>` in a fresh interpreter with `-X importtime`
+    and returns {'total_seconds', 'heaviest': [(package, seconds), ...],
+    'loaded': {'matplotlib': bool, ...}}. A package's time is the sum of
+    its own modules' import times, excluding what they import from others.
+    """
+    code = (f"import json, sys; import {module}; "
+            f"print(json.dumps({{m: m in sys.modules for m in "
+            f"('matplotlib', 'seaborn', 'google.generativeai', 'scipy')}}))")
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    packages, total = {}, 0
+    for line in result.stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if not match:
+            continue
+        own, name = int(match.group(1)), match.group(3)
+        if name == module:
+            total = int(match.group(2))
+        root = name.split('.')[0]
+        packages[root] = packages.get(root, 0) + own
+    heaviest = sorted(packages.items(), key=lambda kv: -kv[1])[:top]
+    return {
+        'total_seconds': total / 1e6,
+        'heaviest': [(name, us / 1e6) for name, us in heaviest],
+        'loaded': json.loads(result.stdout.strip().splitlines()[-1]),
+    }
+
+
+if __name__ == '__main__':
+    # python -m app.warmup: where web-worker startup time goes
+    report = import_report()
+    print(f"import app: {report['total_seconds']:.3f}s")
+    for name, seconds in report['heaviest']:
+        print(f"  {name:<28} {seconds:8.3f}s")
+    print("loaded at import: " + ', '.join(f"{m}={v}" for m, v in report['loaded'].items()))
+    started = time.perf_counter()
+    prime()
+    print(f"warmup (first chart): {time.perf_counter() - started:.3f}s")
@@ -0,0 +1 @@
+"""Performance benchmarks for the dashboard's endpoints (see benchmarks.run)."""
@@ -0,0 +1,90 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# Rows per generated chunk: 50M-row files are written without ever holding them in memory
+CHUNK_ROWS = 250_000
+# An Excel sheet holds 1,048,576 rows including the header
+EXCEL_MAX_ROWS = 1_048_575
+# Categorical columns cycle through these cardinalities
+CARDINALITIES = (5, 50, 1000)
+NULL_RATE = 0.05
+
+
+def dataset_name(rows, numeric, categorical, fmt='csv'):
+    return f"bench_{rows}r_{numeric}n{categorical}c.{fmt}"
+
+
+def columns(numeric, categorical):
+    """Column names of a generated dataset, with their kind."""
+    return ([(f"num_{i}", 'numeric') for i in range(numeric)] +
+            [(f"cat_{i}", 'categorical') for i in range(categorical)])
+
+
+def make_chunk(start, rows, numeric, categorical, seed=0):
+    """
+    Rows [start, start + rows) of a synthetic dataset. Every chunk is seeded
+    by its position, so a dataset is identical however it is chunked.
+    Odd numeric columns and every third categorical column have ~5% nulls.
+    """
+    rng = np.random.default_rng([seed, numeric, categorical, start])
+    data = {}
+    for i in range(numeric):
+        values = rng.normal(loc=i * 10, scale=1 + i, size=rows)
+        if i % 2:
+            values[rng.random(rows) < NULL_RATE] = np.nan
+        data[f"num_{i}"] = values.round(4)
+    for i in range(categorical):
+        cardinality = CARDINALITIES[i % len(CARDINALITIES)]
+        labels = np.array([f"c{i}_{k}" for k in range(cardinality)], dtype=object)
+        values = labels[rng.zipf(1.5, size=rows) % cardinality]
+        if i % 3 == 2:
+            values[rng.random(rows) < NULL_RATE] = None
+        data[f"cat_{i}"] = values
+    return pd.DataFrame(data)
+
+
+def _chunks(rows, numeric, categorical, seed):
+    for start in range(0, rows, CHUNK_ROWS):
+        yield make_chunk(start, min(CHUNK_ROWS, rows - start), numeric, categorical, seed)
+
+
+def _write_csv(path, rows, numeric, categorical, seed):
+    with open(path, 'w', newline='') as fh:
+        for i, chunk in enumerate(_chunks(rows, numeric, categorical, seed)):
+            chunk.to_csv(fh, header=(i == 0), index=False)
+
+
+def _write_xlsx(path, rows, numeric, categorical, seed):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('data')
+    sheet.append([name for name, _ in columns(numeric, categorical)])
+    for chunk in _chunks(rows, numeric, categorical, seed):
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+        for row in chunk.itertuples(index=False, name=None):
+            sheet.append(row)
+    workbook.save(path)
+
+
+def generate(folder, rows, numeric, categorical, fmt='csv', seed=0):
+    """
+    Path of the synthetic dataset, generated on first use and reused after
+    that (the name encodes the shape, the content depends only on `seed`).
+    """
+    if fmt == 'xlsx' and rows > EXCEL_MAX_ROWS:
+        raise ValueError(f"XLSX holds at most {EXCEL_MAX_ROWS} rows (asked for {rows}).")
+    if fmt not in ('csv', 'xlsx'):
+        raise ValueError(f"Unsupported format '{fmt}'.")
+
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, dataset_name(rows, numeric, categorical, fmt))
+    if not os.path.exists(path):
+        print(f"--- 🧪 Generating {os.path.basename(path)} ---")
+        writer = _write_csv if fmt == 'csv' else _write_xlsx
+        writer(path + '.tmp', rows, numeric, categorical, seed)
+        os.replace(path + '.tmp', path)
+    return path
@@ -0,0 +1,569 @@
+"""
+Benchmark harness for the upload, transform, plot and chart data endpoints.
+
+    python -m benchmarks.run                              # quick: 10K/100K rows, Flask test client
+    python -m benchmarks.run --profile full               # 10K .. 50M rows, CSV + XLSX, three widths
+    python -m benchmarks.run --mode http --concurrency 1,8
+    python -m benchmarks.run --baseline last.json --check # exit 1 on a regression
+
+Datasets are generated once into --data-dir and reused. Every request in a
+phase asks for something new (a CSV upload gets one unique trailing row,
+plots another column pair, filters another value...), so latencies
+measure real work rather than cache hits or upload deduplication. The
+JSON written to --out holds p50/p95/p99 latency, throughput and the peak
+RSS of the serving process tree per dataset, endpoint, variant and
+concurrency, plus any regressions against --baseline under the limits in
+thresholds.json. In client mode the serving process is the harness itself.
+"""
+import argparse
+import io
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .datasets import EXCEL_MAX_ROWS, columns, dataset_name, generate
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROFILES = {
+    'quick': {'rows': [10_000, 100_000], 'shapes': [(4, 2)], 'formats': ['csv']},
+    'standard': {'rows': [10_000, 1_000_000], 'shapes': [(4, 2), (20, 5), (3, 12)], 'formats': ['csv', 'xlsx']},
+    'full': {'rows': [10_000, 1_000_000, 10_000_000, 50_000_000], 'shapes': [(4, 2), (20, 5), (3, 12)],
+             'formats': ['csv', 'xlsx']},
+}
+ENDPOINTS = ('upload', 'transform', 'plot', 'chart')
+TRANSFORMS = ('filter', 'dropna', 'fillna', 'groupby')
+AGG_FUNCS = ('mean', 'sum', 'min', 'max', 'count')
+EDA_FORMATS = ('png', 'svg', 'webp')
+
+
+# --- 1. Talking to the app ---
+class ClientTransport:
+    """Requests through Flask's test client, one client per thread."""
+    mode = 'client'
+
+    def __init__(self):
+        from app import create_app
+        self.app = create_app()
+        self.pid = os.getpid()
+        self._local = threading.local()
+
+    def request(self, method, path, form=None, file=None, json_body=None, body=None, headers=None):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        kwargs = {'method': method, 'headers': headers or {}}
+        if file is not None:
+            kwargs['data'] = dict(form or {}, file=(io.BytesIO(file[1]), file[0]))
+            kwargs['content_type'] = 'multipart/form-data'
+        elif form is not None:
+            kwargs['data'] = form
+        elif json_body is not None:
+            kwargs['json'] = json_body
+        elif body is not None:
+            kwargs['data'] = body
+        response = client.open(path, **kwargs)
+        return response.status_code, response.get_data()
+
+    def close(self):
+        pass
+
+
+class HTTPTransport:
+    """Requests over HTTP to a gunicorn server this harness starts (gunicorn.conf.py)."""
+    mode = 'http'
+
+    def __init__(self, workdir, port, boot_timeout=120):
+        self.base_url = f"http://127.0.0.1:{port}"
+        env = dict(os.environ, PORT=str(port), PYTHONPATH=REPO_ROOT)
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', os.path.join(REPO_ROOT, 'gunicorn.conf.py'), 'run:app'],
+            cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        self.pid = self.process.pid
+        deadline = time.time() + boot_timeout
+        while time.time() < deadline:
+            try:
+                if self.request('GET', '/')[0] == 200:
+                    return
+            except OSError:
+                time.sleep(0.25)
+        self.close()
+        raise RuntimeError(f"The server did not answer within {boot_timeout}s.")
+
+    @staticmethod
+    def _multipart(form, file):
+        boundary = uuid.uuid4().hex
+        parts = []
+        for key, value in (form or {}).items():
+            parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{key}"\r\n\r\n{value}\r\n'.encode())
+        name, data = file
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{name}"\r\n'
+                     f'Content-Type: application/octet-stream\r\n\r\n'.encode() + data + b'\r\n')
+        parts.append(f'--{boundary}--\r\n'.encode())
+        return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+    def request(self, method, path, form=None, file=None, json_body=None, body=None, headers=None):
+        headers = dict(headers or {})
+        data = body
+        if file is not None:
+            data, headers['Content-Type'] = self._multipart(form, file)
+        elif form is not None:
+            from urllib.parse import urlencode
+            data, headers['Content-Type'] = urlencode(form).encode(), 'application/x-www-form-urlencoded'
+        elif json_body is not None:
+            data, headers['Content-Type'] = json.dumps(json_body).encode(), 'application/json'
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(req, timeout=600) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def close(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+# --- 2. Measuring ---
+def _children(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as fh:
+            return [int(child) for child in fh.read().split()]
+    except OSError:
+        return []
+
+
+def tree_rss_bytes(pid):
+    """Resident memory of `pid` and all its descendants (Linux /proc; 0 elsewhere)."""
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/status') as fh:
+                for line in fh:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            continue
+        pending.extend(_children(current))
+    return total
+
+
+class RSSSampler:
+    """Peak tree RSS while the block runs, sampled every INTERVAL seconds."""
+    INTERVAL = 0.05
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.start = self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, tree_rss_bytes(self.pid))
+            self._stop.wait(self.INTERVAL)
+
+    def __enter__(self):
+        self.start = self.peak = tree_rss_bytes(self.pid)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, tree_rss_bytes(self.pid))
+
+
+def run_phase(transport, calls, concurrency):
+    """Runs the callables (each returns True on success) and summarizes them."""
+    failures = []
+
+    def timed(call):
+        started = time.perf_counter()
+        try:
+            ok = call()
+        except Exception as e:
+            failures.append(f"{type(e).__name__}: {e}")
+            ok = False
+        return (time.perf_counter() - started) * 1000, ok
+
+    with RSSSampler(transport.pid) as rss:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(timed, calls))
+        wall = time.perf_counter() - started
+
+    latencies = np.array([ms for ms, _ in outcomes])
+    errors = sum(1 for _, ok in outcomes if not ok)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        'n': len(outcomes),
+        'errors': errors,
+        'error_rate': errors / len(outcomes),
+        'min_ms': float(latencies.min()),
+        'mean_ms': float(latencies.mean()),
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+        'max_ms': float(latencies.max()),
+        'throughput_rps': len(outcomes) / wall,
+        'peak_rss_mb': rss.peak / 2 ** 20,
+        'rss_growth_mb': (rss.peak - rss.start) / 2 ** 20,
+        # A few distinct failure messages, so a regression report says why
+        'error_samples': sorted(set(failures))[:5],
+    }
+
+
+# --- 3. Workloads ---
+def _json(status, body):
+    try:
+        return json.loads(body) if status < 500 else None
+    except ValueError:
+        return None
+
+
+def _succeeded(status, body):
+    """True for a {"success": true} response, else raises with the app's error message."""
+    payload = _json(status, body) or {}
+    if not payload.get('success'):
+        raise RuntimeError(payload.get('error') or f"HTTP {status}")
+    return True
+
+
+def _ok(status, body):
+    if status != 200:
+        raise RuntimeError((_json(status, body) or {}).get('error') or f"HTTP {status}")
+    return True
+
+
+def upload(transport, path, name, unique_row=None, max_request_bytes=16 * 2 ** 20):
+    """
+    Uploads `path` as `name` the way the UI does: one form post when it
+    fits the request limit, else the chunked /uploads protocol. A CSV gets
+    `unique_row` appended so repeated uploads are never deduplicated.
+    Returns the dataset's name on the server (an identical earlier upload's
+    name after a chunked dedup), or None on failure.
+    """
+    suffix = (unique_row + '\n').encode() if unique_row and path.endswith('.csv') else b''
+    size = os.path.getsize(path) + len(suffix)
+
+    if size <= max_request_bytes - 64 * 1024:
+        with open(path, 'rb') as fh:
+            status, body = transport.request('POST', '/upload', file=(name, fh.read() + suffix))
+        return name if status == 200 else None
+
+    status, body = transport.request('POST', '/uploads', json_body={'filename': name, 'size': size})
+    session = _json(status, body)
+    if status != 201 or not session:
+        return None
+    offset, upload_id = 0, session['upload_id']
+    with open(path, 'rb') as fh:
+        blocks = itertools.chain(iter(lambda: fh.read(session['chunk_size']), b''), [suffix] if suffix else [])
+        for block in blocks:
+            status, body = transport.request('PATCH', f'/uploads/{upload_id}', body=block,
+                                             headers={'Upload-Offset': str(offset),
+                                                      'Content-Type': 'application/offset+octet-stream'})
+            if status != 200:
+                return None
+            offset += len(block)
+    while True:
+        state = _json(*transport.request('GET', f'/uploads/{upload_id}'))
+        if state is None or state['state'] == 'failed':
+            return None
+        if state['state'] == 'done':
+            return state['result']['filename']
+        time.sleep(0.05)
+
+
+_upload_serial = itertools.count()
+_uploaded = set()
+
+
+def _unique_row(numeric, categorical):
+    """A trailing CSV row no other upload in this run shares."""
+    serial = next(_upload_serial)
+    return ','.join([str(serial)] * numeric + [f'bench{serial}'] * categorical)
+
+
+def transform_calls(transport, filename, numeric_cols, categorical_cols, op, repeats):
+    """Distinct /transform requests for one op, so no two share a cached result."""
+    def post(form):
+        return lambda: _succeeded(*transport.request('POST', '/transform', form=form))
+
+    calls = []
+    all_cols = numeric_cols + categorical_cols
+    nullable = [c for i, c in enumerate(numeric_cols) if i % 2] or numeric_cols
+    for i in range(repeats):
+        if op == 'filter':
+            form = {'action': 'filter', 'column': numeric_cols[i % len(numeric_cols)],
+                    'operator': '>', 'value': str(round(-1 + i * 0.05, 2))}
+        elif op == 'dropna':
+            form = {'action': 'drop_na', 'column': all_cols[i % len(all_cols)] if i else ''}
+        elif op == 'fillna':
+            form = {'action': 'fillna', 'column': nullable[i % len(nullable)], 'value': str(i)}
+        else:
+            if not categorical_cols:
+                return []
+            form = {'action': 'groupby', 'group_by': categorical_cols[i % len(categorical_cols)],
+                    'agg_col': numeric_cols[(i // len(categorical_cols)) % len(numeric_cols)],
+                    'agg_func': AGG_FUNCS[i % len(AGG_FUNCS)]}
+        calls.append(post(dict(form, filename=filename)))
+    return calls
+
+
+def _plot_args(plot_type, numeric_cols, categorical_cols):
+    """Every (x, y) a chart type accepts for this dataset."""
+    pairs = [(x, y) for x in numeric_cols for y in numeric_cols if x != y]
+    if plot_type == 'bar':
+        return [(x, y) for x in categorical_cols for y in numeric_cols] or pairs
+    if plot_type == 'hist':
+        return [(x, None) for x in numeric_cols + categorical_cols]
+    return pairs
+
+
+def plot_calls(transport, filename, numeric_cols, categorical_cols, plot_type, repeats):
+    """Requests for one chart type; each asks for a different chart until the combinations run out."""
+    from app.routes import EDA_PLOTS
+
+    calls = []
+    if plot_type in EDA_PLOTS:
+        for fmt in EDA_FORMATS[:repeats]:
+            path = f'/plot/{filename}?plot_type={plot_type}&fmt={fmt}'
+            calls.append(lambda path=path: _ok(*transport.request('GET', path)))
+        return calls
+
+    combos = _plot_args(plot_type, numeric_cols, categorical_cols)
+    for i in range(min(repeats, len(combos))):
+        x, y = combos[i]
+        form = {'filename': filename, 'plot_type': plot_type, 'x_col': x, 'y_col': y or 'None'}
+        calls.append(lambda form=form: _succeeded(*transport.request('POST', '/generate_plot', form=form)))
+    return calls
+
+
+def chart_calls(transport, filename, numeric_cols, categorical_cols, plot_type, repeats):
+    """/chart_data requests for one chart type, over the same combinations as plot_calls."""
+    calls = []
+    combos = _plot_args(plot_type, numeric_cols, categorical_cols)
+    for i in range(min(repeats, len(combos))):
+        x, y = combos[i]
+        spec = {'mark': plot_type, 'encoding': {'x': x, 'y': y}}
+        body = {'filename': filename, 'spec': spec}
+        calls.append(lambda body=body: _ok(*transport.request('POST', '/chart_data', json_body=body)))
+    return calls
+
+
+def bench_dataset(transport, path, rows, numeric, categorical, fmt, args, concurrency):
+    """All phases for one dataset at one concurrency level, as result records."""
+    from app.routes import CHART_TYPES, EDA_PLOTS
+
+    stem = os.path.splitext(os.path.basename(path))[0]
+    names = [name for name, _ in columns(numeric, categorical)]
+    numeric_cols, categorical_cols = names[:numeric], names[numeric:]
+    base = {'dataset': os.path.basename(path), 'rows': rows, 'numeric': numeric, 'categorical': categorical,
+            'format': fmt, 'bytes': os.path.getsize(path), 'mode': transport.mode, 'concurrency': concurrency}
+    records = []
+    run_id = uuid.uuid4().hex[:6]
+    max_request = int(os.environ.get('MAX_CONTENT_MB', 16)) * 2 ** 20
+
+    def record(endpoint, variant, calls):
+        if not calls:
+            return
+        print(f"  {endpoint:<10} {variant:<14} x{len(calls)} @ c={concurrency}")
+        records.append(dict(base, endpoint=endpoint, variant=variant, **run_phase(transport, calls, concurrency)))
+
+    # The first upload is the dataset every later phase works on
+    chunked = os.path.getsize(path) > max_request - 64 * 1024
+    # XLSX content cannot be varied: after its first chunked upload the server deduplicates it
+    variant = 'dedup' if chunked and fmt == 'xlsx' and path in _uploaded else ('chunked' if chunked else 'form')
+    _uploaded.add(path)
+    repeats = args.upload_repeats if 'upload' in args.endpoints else 1
+    names = [None] * repeats
+
+    def upload_call(i):
+        def call():
+            names[i] = upload(transport, path, f"{stem}_{run_id}_c{concurrency}_{i}.{fmt}",
+                              unique_row=_unique_row(numeric, categorical), max_request_bytes=max_request)
+            return names[i] is not None
+        return call
+
+    calls = [upload_call(i) for i in range(1 if variant == 'dedup' else repeats)]
+    if 'upload' in args.endpoints:
+        record('upload', variant, calls)
+    else:
+        calls[0]()
+    filename = names[0]
+    if filename is None:
+        print(f"  ! could not upload {os.path.basename(path)}; skipping its phases")
+        return records
+    if 'transform' in args.endpoints:
+        for op in TRANSFORMS:
+            record('transform', op,
+                   transform_calls(transport, filename, numeric_cols, categorical_cols, op, args.repeats))
+    if 'plot' in args.endpoints:
+        for plot_type in list(CHART_TYPES) + list(EDA_PLOTS):
+            record('plot', plot_type,
+                   plot_calls(transport, filename, numeric_cols, categorical_cols, plot_type, args.repeats))
+    if 'chart' in args.endpoints:
+        for plot_type in CHART_TYPES:
+            record('chart', plot_type,
+                   chart_calls(transport, filename, numeric_cols, categorical_cols, plot_type, args.repeats))
+    return records
+
+
+# --- 4. Regressions ---
+def result_key(record):
+    return '|'.join(str(record[k]) for k in ('dataset', 'endpoint', 'variant', 'mode', 'concurrency'))
+
+
+def find_regressions(results, baseline, thresholds):
+    """Records that break a threshold: error rate always, ratios against `baseline` when given."""
+    regressions = []
+    previous = {result_key(r): r for r in (baseline or {}).get('results', [])}
+    floor = thresholds.get('noise_floor_ms', 0)
+    for record in results:
+        key = result_key(record)
+        if record['error_rate'] > thresholds.get('max_error_rate', 0):
+            regressions.append({'key': key, 'metric': 'error_rate', 'current': record['error_rate'],
+                                'limit': thresholds.get('max_error_rate', 0)})
+        old = previous.get(key)
+        if old is None:
+            continue
+        for metric, limit in thresholds.get('metrics', {}).items():
+            before, now = old.get(metric), record.get(metric)
+            if not before or now is None:
+                continue
+            if metric.endswith('_ms') and max(before, now) < floor:
+                continue
+            ratio = now / before
+            if ratio > limit.get('max_ratio', float('inf')) or ratio < limit.get('min_ratio', 0):
+                regressions.append({'key': key, 'metric': metric, 'baseline': before, 'current': now,
+                                    'ratio': round(ratio, 3), 'limit': limit})
+    return regressions
+
+
+def _meta(args):
+    import pandas as pd
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'args': {k: v for k, v in vars(args).items() if k not in ('baseline', 'check')},
+    }
+
+
+# --- 5. CLI ---
+def _ints(text):
+    return [int(part.replace('_', '')) for part in text.split(',') if part]
+
+
+def _shapes(text):
+    return [tuple(int(n) for n in part.split('x')) for part in text.split(',') if part]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='quick')
+    parser.add_argument('--rows', type=_ints, help='override the profile, e.g. 10000,1000000')
+    parser.add_argument('--shapes', type=_shapes, help='NUMERICxCATEGORICAL columns, e.g. 4x2,20x5')
+    parser.add_argument('--formats', type=lambda s: s.split(','), help='csv,xlsx')
+    parser.add_argument('--endpoints', type=lambda s: s.split(','), default=list(ENDPOINTS))
+    parser.add_argument('--mode', choices=('client', 'http'), default='client')
+    parser.add_argument('--concurrency', type=_ints, default=[1])
+    parser.add_argument('--repeats', type=int, default=10, help='requests per transform/plot phase')
+    parser.add_argument('--upload-repeats', type=int, default=3)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'eda-bench-data'))
+    parser.add_argument('--workdir', help='server working directory (default: a fresh temporary one)')
+    parser.add_argument('--out', default='benchmark-results.json')
+    parser.add_argument('--thresholds', default=os.path.join(os.path.dirname(__file__), 'thresholds.json'))
+    parser.add_argument('--baseline', help='earlier results JSON to compare against')
+    parser.add_argument('--check', action='store_true', help='exit with status 1 on any regression')
+    args = parser.parse_args(argv)
+    profile = PROFILES[args.profile]
+    args.rows = args.rows or profile['rows']
+    args.shapes = args.shapes or profile['shapes']
+    args.formats = args.formats or profile['formats']
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    out, data_dir = os.path.abspath(args.out), os.path.abspath(args.data_dir)
+    thresholds_path = os.path.abspath(args.thresholds)
+    baseline_path = args.baseline and os.path.abspath(args.baseline)
+    # Never call the real AI service from a benchmark
+    os.environ.setdefault('AI_BACKEND', 'stub')
+    workdir = args.workdir or tempfile.mkdtemp(prefix='eda-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_ROOT)
+
+    datasets = []
+    for rows, (numeric, categorical), fmt in itertools.product(args.rows, args.shapes, args.formats):
+        if fmt == 'xlsx' and rows > EXCEL_MAX_ROWS:
+            print(f"--- skipping {dataset_name(rows, numeric, categorical, fmt)}: over the Excel row limit ---")
+            continue
+        datasets.append((generate(data_dir, rows, numeric, categorical, fmt), rows, numeric, categorical, fmt))
+
+    transport = ClientTransport() if args.mode == 'client' else HTTPTransport(workdir, args.port)
+    results = []
+    try:
+        for path, rows, numeric, categorical, fmt in datasets:
+            for concurrency in args.concurrency:
+                print(f"--- ⏱️ {os.path.basename(path)} ({transport.mode}, concurrency {concurrency}) ---")
+                results.extend(bench_dataset(transport, path, rows, numeric, categorical, fmt, args, concurrency))
+    finally:
+        transport.close()
+
+    with open(thresholds_path) as fh:
+        thresholds = json.load(fh)
+    baseline = None
+    if baseline_path:
+        with open(baseline_path) as fh:
+            baseline = json.load(fh)
+    regressions = find_regressions(results, baseline, thresholds)
+
+    report = {'meta': _meta(args), 'thresholds': thresholds, 'results': results, 'regressions': regressions}
+    with open(out, 'w') as fh:
+        json.dump(report, fh, indent=2)
+
+    print(f"\n{'dataset':<34} {'endpoint':<10} {'variant':<12} {'c':>3} {'p50':>9} {'p95':>9} "
+          f"{'p99':>9} {'rps':>8} {'rss MB':>8}")
+    for r in results:
+        print(f"{r['dataset']:<34} {r['endpoint']:<10} {r['variant']:<12} {r['concurrency']:>3} "
+              f"{r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f} "
+              f"{r['throughput_rps']:>8.1f} {r['peak_rss_mb']:>8.0f}")
+    for reg in regressions:
+        print(f"!! regression {reg['key']} {reg['metric']}: {reg.get('baseline', '-')} -> {reg['current']} (limit {reg['limit']})")
+    return 1 if regressions and args.check else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
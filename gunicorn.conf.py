@@ -0,0 +1,37 @@
+# gunicorn -c gunicorn.conf.py run:app
+#
+# The app is imported once in the master (preload_app) and forked into the
+# workers, so they start in milliseconds and share the imported modules'
+# memory. State that cannot cross a fork (thread pools, render processes,
+# pooled DB connections, the Gemini client) is reset by the owning objects'
+# after_fork hooks (os.register_at_fork), so each worker builds its own.
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+preload_app = os.environ.get('PRELOAD_APP', '1') == '1'
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+
+# WARMUP=1: prime fonts and the seaborn theme in the master, then start each
+# worker's render processes before it accepts requests
+WARMUP = os.environ.get('WARMUP', '1') == '1'
+
+
+def on_starting(server):
+    # Metrics start from zero with each server run: drop the last run's worker files
+    from app.metrics import metrics
+    metrics.reset(metrics.folder or os.path.join(os.getcwd(), 'uploads', '.metrics'))
+
+
+def when_ready(server):
+    if WARMUP and preload_app:
+        from app.warmup import prime
+        prime()
+
+
+def post_worker_init(worker):
+    if WARMUP:
+        from app.render_pool import render_pool
+        render_pool.warm()
+        worker.log.info("Render pool warm (%s processes)", render_pool.workers)